@@ -0,0 +1,104 @@
+# U-TUTOR v5.0 - Event loop compartido para las llamadas asíncronas al modelo
+"""
+Un único event loop de asyncio corriendo en un hilo de fondo por proceso.
+
+Streamlit ejecuta cada rerun en un hilo de script sin loop propio, así que
+las corrutinas de ``ChatManager`` (``aget_response_stream``, ``atranslate_text``,
+``agenerate_ai_title``) se envían a este loop:
+
+- ``submit(corrutina)`` retorna un ``concurrent.futures.Future`` que el
+  script puede consultar en reruns posteriores sin bloquearse.
+- ``stream(generador_async)`` retorna un iterador síncrono (``StreamBridge``)
+  que el script recorre para pintar los tokens mientras el loop sigue
+  atendiendo otras tareas (título, traducción, otras sesiones).
+"""
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from typing import AsyncIterator, Coroutine, Optional
+
+# Tipos de elemento en la cola del StreamBridge
+_ITEM = "item"
+_DONE = "done"
+_ERROR = "error"
+
+
+class StreamBridge:
+    """Iterador síncrono sobre un generador asíncrono que corre en el loop compartido"""
+
+    def __init__(self, runner: "BackgroundLoop", agen: AsyncIterator):
+        self._queue = queue.Queue()
+        self._finished = False
+        self._future = runner.submit(self._pump(agen))
+
+    async def _pump(self, agen: AsyncIterator):
+        """Corre en el loop: pasa cada elemento del generador a la cola"""
+        try:
+            async for item in agen:
+                self._queue.put((_ITEM, item))
+            self._queue.put((_DONE, None))
+        except asyncio.CancelledError:
+            self._queue.put((_DONE, None))
+            raise
+        except Exception as e:
+            self._queue.put((_ERROR, e))
+        finally:
+            aclose = getattr(agen, "aclose", None)
+            if aclose:
+                await aclose()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        kind, value = self._queue.get()
+        if kind == _ITEM:
+            return value
+        self._finished = True
+        if kind == _ERROR:
+            raise value
+        raise StopIteration
+
+    def close(self):
+        """Cancela la tarea en el loop (y con ella la petición HTTP en curso)"""
+        self._future.cancel()
+        # Si la tarea se canceló antes de empezar, _pump nunca avisa el final:
+        # sin esto, quien espera en __next__ quedaría bloqueado para siempre
+        self._queue.put((_DONE, None))
+
+
+class BackgroundLoop:
+    """Event loop de asyncio en un hilo daemon"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="ututor-async-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Programa una corrutina en el loop y retorna su Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stream(self, agen: AsyncIterator) -> StreamBridge:
+        """Recorre un generador asíncrono desde código síncrono"""
+        return StreamBridge(self, agen)
+
+
+_runner: Optional[BackgroundLoop] = None
+_runner_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Retorna el loop compartido del proceso (lo crea la primera vez)"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = BackgroundLoop()
+        return _runner
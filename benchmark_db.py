@@ -0,0 +1,128 @@
+# U-TUTOR v5.0 - Benchmark de DatabaseManager: conexión por llamada vs. pool persistente
+"""
+Mide cuántos "reruns" de Streamlit por segundo soporta DatabaseManager.
+
+Un rerun simulado hace las mismas lecturas que la UI en cada interacción
+(sidebar + cabecera + historial). Cada cierto número de reruns se simula un
+turno de chat (dos save_message). También se mide un escenario concurrente
+con varias sesiones leyendo mientras otra escribe.
+
+Uso:
+    python benchmark_db.py [--conversations 200] [--messages 20] [--seconds 3]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from database_manager import DatabaseManager
+
+
+def seed_database(db_path: str, conversations: int, messages: int):
+    """Crea una base de datos de prueba con datos sintéticos"""
+    db = DatabaseManager(db_path, pooled=True)
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(conversations):
+            cursor.execute("INSERT INTO conversations (title) VALUES (?)", (f"Conversación {i}",))
+            conv_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+                [
+                    (conv_id, "user" if j % 2 == 0 else "assistant", f"Mensaje {j} " * 20)
+                    for j in range(messages)
+                ]
+            )
+        conn.commit()
+    db.close_all()
+
+
+def simulate_rerun(db: DatabaseManager, conv_id: int, write: bool):
+    """Reproduce las consultas de un rerun de la UI"""
+    db.get_conversations()
+    db.get_conversation_by_id(conv_id)
+    db.load_conversation_messages(conv_id)
+    if write:
+        db.save_message(conv_id, "user", "¿Qué es un número primo?")
+        db.save_message(conv_id, "assistant", "Un número primo es divisible solo por 1 y por sí mismo.")
+
+
+def run_single(db: DatabaseManager, seconds: float) -> float:
+    """Reruns por segundo en una sola sesión (1 turno de chat cada 10 reruns)"""
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        simulate_rerun(db, 1 + count % 50, write=(count % 10 == 0))
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def run_concurrent(db: DatabaseManager, seconds: float, readers: int) -> tuple:
+    """Reruns/s de lectores concurrentes mientras un hilo escribe sin pausa"""
+    stop = threading.Event()
+    read_counts = [0] * readers
+    write_count = [0]
+    errors = []
+
+    def reader(idx: int):
+        try:
+            while not stop.is_set():
+                simulate_rerun(db, 1 + (idx + read_counts[idx]) % 50, write=False)
+                read_counts[idx] += 1
+        except Exception as e:
+            errors.append(e)
+
+    def writer():
+        try:
+            while not stop.is_set():
+                db.save_message(1, "user", "Escritura concurrente")
+                write_count[0] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(read_counts) / elapsed, write_count[0] / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de DatabaseManager")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configs = (
+            ("antes (conexión por llamada)", False, False),
+            ("después (pool + WAL)", True, False),
+            ("pool + WAL + write-behind", True, True),
+        )
+        for idx, (label, pooled, write_behind) in enumerate(configs):
+            db_path = os.path.join(tmp, f"bench_{idx}.db")
+            seed_database(db_path, args.conversations, args.messages)
+            db = DatabaseManager(db_path, pooled=pooled, write_behind=write_behind)
+
+            single = run_single(db, args.seconds)
+            reads, writes, errors = run_concurrent(db, args.seconds, args.readers)
+            db.close_all()
+
+            print(f"📊 {label}")
+            print(f"   1 sesión:          {single:8.1f} reruns/s")
+            print(f"   {args.readers} lectores + 1 escritor: {reads:8.1f} reruns/s, "
+                  f"{writes:8.1f} escrituras/s, errores: {errors}")
+
+
+if __name__ == "__main__":
+    main()
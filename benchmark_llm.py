@@ -0,0 +1,122 @@
+# U-TUTOR v5.0 - Benchmark de ChatManager con el modelo falso (sin OpenAI ni red)
+"""
+Simula varias sesiones de Streamlit pidiendo respuestas en streaming a la vez.
+
+Cada sesión tiene su propio ChatManager (como en la app) y todas comparten el
+registro de clientes, el event loop de fondo y el limitador global. El modelo
+es ``FakeChatModel`` (llm_providers.py), así que se mide el pipeline completo
+(contexto, limitador, reintentos, streaming) sin gastar cuota.
+
+Uso:
+    python benchmark_llm.py [--sessions 20] [--requests 5] [--ttft-ms 300] [--tps 50]
+                            [--error-rate 0.05] [--rate-limit-rate 0.05] [--rpm 0] [--tpm 0]
+"""
+import argparse
+import os
+import threading
+import time
+from typing import List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentil por rango más cercano (None si no hay valores)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def run_session(chat_manager, session: int, requests: int, results: list, lock: threading.Lock):
+    """Una sesión: preguntas seguidas, esperando cada respuesta completa"""
+    for turn in range(requests):
+        messages = [{"role": "user", "content": f"Sesión {session}, pregunta {turn}: ¿qué es un número primo?"}]
+        start = time.perf_counter()
+        first_token = None
+        chunks = 0
+        error = None
+        try:
+            for chunk in chat_manager.start_generation(messages):
+                if getattr(chunk, "content", None):
+                    chunks += 1
+                    first_token = first_token or time.perf_counter()
+        except Exception as e:
+            error = type(e).__name__
+        end = time.perf_counter()
+        with lock:
+            results.append({
+                "ttft": first_token - start if first_token else None,
+                "total": end - start,
+                "chunks": chunks,
+                "model": chat_manager.last_served_model,
+                "error": error,
+            })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ChatManager con el modelo falso")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tps", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0, help="RATE_LIMIT_RPM (0 = sin límite)")
+    parser.add_argument("--tpm", type=int, default=0, help="RATE_LIMIT_TPM (0 = sin límite)")
+    args = parser.parse_args()
+
+    # El limitador lee su configuración al importarse
+    os.environ["RATE_LIMIT_RPM"] = str(args.rpm)
+    os.environ["RATE_LIMIT_TPM"] = str(args.tpm)
+    from chat_manager import ChatManager
+    from llm_providers import FakeProvider
+    from llm_registry import LLMClientRegistry
+    from rate_limiter import get_rate_limiter
+
+    registry = LLMClientRegistry(None, provider=FakeProvider(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tps,
+        response_tokens=args.tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    ))
+    managers = [ChatManager("", args.model, llm_registry=registry) for _ in range(args.sessions)]
+
+    results = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=run_session, args=(manager, idx, args.requests, results, lock))
+        for idx, manager in enumerate(managers)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["error"] is None]
+    ttfts = [r["ttft"] * 1000 for r in ok if r["ttft"] is not None]
+    totals = [r["total"] * 1000 for r in ok]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    def fmt(value: Optional[float]) -> str:
+        return f"{value:8.1f} ms" if value is not None else "       -"
+
+    print(f"📊 {args.sessions} sesiones x {args.requests} preguntas en {elapsed:.2f} s "
+          f"({len(results) / elapsed:.1f} respuestas/s, "
+          f"{sum(r['chunks'] for r in ok) / elapsed:.0f} tokens/s)")
+    print(f"   TTFT   p50 {fmt(percentile(ttfts, 50))}  p95 {fmt(percentile(ttfts, 95))}  "
+          f"p99 {fmt(percentile(ttfts, 99))}")
+    print(f"   Total  p50 {fmt(percentile(totals, 50))}  p95 {fmt(percentile(totals, 95))}  "
+          f"p99 {fmt(percentile(totals, 99))}")
+    print(f"   Completadas: {len(ok)}/{len(results)}; errores: {errors or 'ninguno'}")
+    print(f"   Limitador: {get_rate_limiter().get_metrics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,128 +1,728 @@
 # U-TUTOR v3.0 - Mejoras en chat_manager.py: Streaming, validaciones mejoradas y personalidades
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage
+import hashlib
+import os
+import re
+from concurrent.futures import Future
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from context_builder import ContextBuilder
+from conversation_memory import ConversationMemory
+from response_cache import ResponseCache, make_cache_key
+from semantic_cache import SemanticCache
+from async_runner import StreamBridge, get_background_loop
+from llm_registry import LLMClientRegistry
+from local_titler import get_local_titler
+from query_router import QueryRouter, RouteDecision
+from llm_resilience import fallback_models, resilient_astream, resilient_call, resilient_stream
+from rate_limiter import (
+    PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_SUMMARY, RATE_LIMIT_COMPLETION_TOKENS,
+    RateLimitExceeded, RateLimitTicket, get_rate_limiter
+)
+
+SUMMARY_PREFIX = "Resumen de la conversación hasta ahora (turnos anteriores):"
+CONTINUE_INSTRUCTION = (
+    "Tu respuesta anterior se interrumpió. Continúa exactamente donde quedó, "
+    "sin repetir lo que ya escribiste ni añadir introducciones."
+)
+
+# Mensajes de sistema por personalidad (la caché separa las respuestas de cada una)
+PERSONALITIES = {
+    "Profesional": """Eres Jake, un tutor universitario profesional y formal. 
+            Proporciona explicaciones detalladas y académicas.""",
+
+    "Amigable": """Eres Jake, un tutor universitario cercano y amigable. 
+            Explicas de manera casual pero efectiva, usando ejemplos cotidianos.""",
+
+    "Conciso": """Eres Jake, un tutor universitario directo y conciso. 
+            Vas al grano y das respuestas precisas sin rodeos.""",
+
+    "Detallado": """Eres Jake, un tutor universitario exhaustivo. 
+            Proporcionas explicaciones profundas con múltiples ejemplos y contexto."""
+}
+
+
+class GenerationHandle:
+    """Respuesta en streaming que se puede cancelar - U-TUTOR v5.0"""
+
+    def __init__(self, conversation_id: Optional[int], bridge: StreamBridge,
+                 ticket: Optional[RateLimitTicket] = None):
+        self.conversation_id = conversation_id
+        self._bridge = bridge
+        # Turno en el limitador global (None si la respuesta salió de la caché)
+        self.ticket = ticket
+        self.cancelled = False
+        self.finished = False
+        self.chunk_count = 0
+
+    def __iter__(self):
+        for chunk in self._bridge:
+            if self.cancelled:
+                break
+            if getattr(chunk, "content", None):
+                self.chunk_count += 1
+            yield chunk
+        self.finished = not self.cancelled
+
+    def cancel(self) -> bool:
+        """
+        Cierra el stream HTTP y deja de contar tokens.
+
+        Returns:
+            True si la generación seguía en curso
+        """
+        if self.finished or self.cancelled:
+            return False
+        self.cancelled = True
+        if self.ticket is not None:
+            self.ticket.cancel()
+        self._bridge.close()
+        return True
+
+    def queue_position(self) -> int:
+        """Posición en la cola del limitador (0 si ya tiene cupo)"""
+        return self.ticket.position() if self.ticket is not None else 0
 
 
 class ChatManager:
-    def __init__(self, api_key: str, model: str, temperature: float = 0.7):
-        """Inicializa ChatManager con temperatura configurable - U-TUTOR v3.0"""
-        self.llm = ChatOpenAI(
-            api_key=api_key,  # type: ignore
-            model_name=model,  # type: ignore
-            temperature=temperature  # type: ignore
-        )
+    def __init__(self, api_key: str, model: str, temperature: float = 0.7,
+                 max_context_messages: int = 50, db_manager=None,
+                 response_cache: Optional[ResponseCache] = None,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 llm_registry: Optional[LLMClientRegistry] = None,
+                 query_router: Optional[QueryRouter] = None):
+        """
+        Inicializa ChatManager con temperatura configurable - U-TUTOR v5.0
+
+        Args:
+            max_context_messages: Máximo de mensajes recientes del historial que
+                                  se envían al modelo en cada turno
+            db_manager: Si se indica, las conversaciones largas usan un resumen
+                        incremental guardado en la base de datos
+            response_cache: Caché compartida de respuestas idénticas (opcional)
+            semantic_cache: Caché de primeras preguntas parecidas (opcional, requiere response_cache)
+            llm_registry: Registro de clientes compartido entre sesiones; si no se
+                          indica se usa uno propio
+            query_router: Si se indica, las preguntas simples van a su modelo económico
+        """
+        self.llm_registry = llm_registry or LLMClientRegistry(api_key)
         self.model = model  # Almacenar el nombre del modelo para referencia rápida
         self.system_message = """Eres Jake, un tutor universitario empático y profesional.
         Ayuda al estudiante con sus dudas, habla como humano y nunca reveles que eres una IA."""
         self.temperature = temperature
+        self.max_context_messages = max_context_messages
+        # Constructores de contexto por modelo (cada uno con su tokenizador y presupuesto)
+        self._context_builders = {}
+        # Resumen de tokens del último prompt enviado
+        self.last_context_stats = None
+        # Memoria de resumen incremental (CONTEXT_SUMMARY=0 para desactivar)
+        self.memory = None
+        if db_manager is not None and os.getenv("CONTEXT_SUMMARY", "1") != "0":
+            self.memory = ConversationMemory(db_manager, self.summarize_messages)
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache if response_cache is not None else None
+        # Generación en streaming en curso (una por sesión)
+        self.active_generation: Optional[GenerationHandle] = None
+        # Limitador de llamadas compartido por todas las sesiones del proceso
+        self.rate_limiter = get_rate_limiter()
+        # Turno de la última petición de chat enviada al limitador
+        self.chat_ticket: Optional[RateLimitTicket] = None
+        # Modelo que respondió la última petición (None si salió de la caché)
+        self.last_served_model: Optional[str] = None
+        # Enrutamiento por complejidad y decisión de la última pregunta
+        self.query_router = query_router
+        self.last_route: Optional[RouteDecision] = None
+
+    @property
+    def llm(self):
+        """Cliente compartido del modelo y temperatura actuales - U-TUTOR v5.0"""
+        return self.llm_registry.get(self.model, self.temperature)
+
+    @property
+    def light_llm(self):
+        """Cliente para tareas simples (títulos, traducciones): el económico si hay enrutador - U-TUTOR v5.0"""
+        if self.query_router is None:
+            return self.llm
+        return self.llm_registry.get(self.query_router.cheap_model, self.temperature)
+
+    def _client_for(self, model: str):
+        """Cliente compartido de un modelo de la cadena con la temperatura actual - U-TUTOR v5.0"""
+        return self.llm_registry.get(model, self.temperature)
+
+    def _served_callback(self, requested: str):
+        """Registra qué modelo respondió (puede ser uno de respaldo) - U-TUTOR v5.0"""
+        def on_served(model: str):
+            self.last_served_model = model
+            if model != requested:
+                print(f"↪️ [LOG] Respondió el modelo de respaldo {model} (principal: {requested})")
+        return on_served
+
+    def _store_if_primary(self, cache_key: Optional[str], messages: List[Dict[str, str]],
+                          content: str, model: str):
+        """Cachea solo las respuestas del modelo pedido, no las de respaldo - U-TUTOR v5.0"""
+        if cache_key and self.last_served_model == model:
+            self._store_response(cache_key, messages, content, model)
+
+    def route_model(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Modelo para responder el último mensaje - U-TUTOR v5.0
+
+        Sin enrutador es siempre el modelo elegido; con él, las preguntas simples
+        van al modelo económico (ver query_router.py).
+        """
+        if self.query_router is None:
+            self.last_route = None
+            return self.model
+        self.last_route = self.query_router.route(messages, self.model)
+        print(f"🧭 [LOG] Pregunta {self.last_route.route} (puntuación {self.last_route.score}"
+              f"{', ' + ', '.join(self.last_route.reasons) if self.last_route.reasons else ''}) "
+              f"→ {self.last_route.model}")
+        return self.last_route.model
+
+    def get_context_builder(self, model: Optional[str] = None) -> ContextBuilder:
+        """Retorna el constructor de contexto de un modelo (por defecto el actual) - U-TUTOR v5.0"""
+        model = model or self.model
+        if model not in self._context_builders:
+            self._context_builders[model] = ContextBuilder(model)
+        return self._context_builders[model]
     
-    def prepare_messages_for_api(self, messages: List[Dict[str, str]]) -> List[tuple]:
-        """Prepara los mensajes para la API de OpenAI"""
-        api_messages = [("system", self.system_message)]
-        
-        for msg in messages:
-            role = "human" if msg["role"] == "user" else "assistant"
-            api_messages.append((role, msg["content"]))
-        
+    def count_tokens(self, text: str) -> int:
+        """Cuenta tokens con el tokenizador del modelo actual - U-TUTOR v5.0"""
+        return self.get_context_builder().counter.count(text)
+
+    def get_context_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Retorna solo la cola del historial que entra en el contexto - U-TUTOR v5.0"""
+        if len(messages) <= self.max_context_messages:
+            return messages
+        return messages[-self.max_context_messages:]
+
+    def _apply_summary(self, messages: List[Dict[str, str]], conversation_id: Optional[int],
+                       messages_offset: int) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Combina el resumen guardado con el historial de la sesión - U-TUTOR v5.0
+
+        Args:
+            messages: Mensajes de la sesión (cola de la conversación)
+            conversation_id: Conversación actual
+            messages_offset: Mensajes de la conversación anteriores a messages[0]
+
+        Returns:
+            (mensaje_de_sistema, mensajes_no_resumidos)
+        """
+        if self.memory is None or conversation_id is None:
+            return self.system_message, messages
+
+        summary, summarized_count = self.memory.get(conversation_id)
+        if not summary:
+            return self.system_message, messages
+
+        # Descartar los mensajes de la sesión que ya están dentro del resumen
+        covered = summarized_count - messages_offset
+        if covered > 0:
+            messages = messages[min(covered, len(messages) - 1):]
+        return f"{self.system_message}\n\n{SUMMARY_PREFIX}\n{summary}", messages
+
+    def prepare_messages_for_api(self, messages: List[Dict[str, str]],
+                                 conversation_id: Optional[int] = None,
+                                 messages_offset: int = 0,
+                                 model: Optional[str] = None) -> List[tuple]:
+        """
+        Prepara los mensajes para la API de OpenAI dentro del presupuesto de tokens - U-TUTOR v5.0
+
+        Conserva siempre el mensaje de sistema y los turnos más recientes; los más
+        antiguos se descartan o recortan (ver context_builder.py). Si la
+        conversación tiene resumen, se envía junto al sistema en lugar de los
+        turnos que ya resume.
+        """
+        system_message, messages = self._apply_summary(messages, conversation_id, messages_offset)
+        api_messages, stats = self.get_context_builder(model).build(
+            system_message,
+            self.get_context_messages(messages)
+        )
+        stats["summary_used"] = system_message != self.system_message
+        self.last_context_stats = stats
+        print(
+            f"📏 [LOG] Contexto: {stats['prompt_tokens']}/{stats['budget']} tokens "
+            f"({stats['messages_sent']} mensajes enviados, {stats['messages_dropped']} descartados"
+            f"{', recortado' if stats['truncated'] else ''}"
+            f"{', con resumen' if stats['summary_used'] else ''}; conteo {stats['token_counter']})"
+        )
         return api_messages
-    
-    def get_response(self, messages: List[Dict[str, str]]) -> str:
+
+    def load_conversation_memory(self, conversation_id: int):
+        """Reutiliza el resumen guardado al abrir una conversación - U-TUTOR v5.0"""
+        if self.memory is None:
+            return
+        self.memory.reload(conversation_id)
+        # Conversaciones largas anteriores al resumen se ponen al día en segundo plano
+        self.memory.schedule_update(conversation_id)
+
+    def schedule_summary_update(self, conversation_id: int):
+        """Actualiza el resumen en segundo plano tras una respuesta - U-TUTOR v5.0"""
+        if self.memory is not None and conversation_id is not None:
+            self.memory.schedule_update(conversation_id)
+
+    def summarize_messages(self, previous_summary: str, messages: List[Tuple[str, str]]) -> str:
+        """
+        Integra nuevos turnos al resumen anterior (sin recalcularlo) - U-TUTOR v5.0
+
+        Args:
+            previous_summary: Resumen acumulado ("" si es el primero)
+            messages: Turnos a incorporar como (role, content)
+        """
+        turns = "\n\n".join(
+            f"{'Estudiante' if role == 'user' else 'Tutor'}: {content}"
+            for role, content in messages
+        )
+        summary_prompt = [
+            ("system", """Eres un asistente que mantiene el resumen de una tutoría universitaria.
+
+            Reglas:
+            - Integra los nuevos turnos al resumen anterior
+            - Conserva temas, datos, fórmulas, decisiones y dudas pendientes del estudiante
+            - Máximo 250 palabras, en español, en tercera persona
+            - No agregues información que no esté en la conversación
+
+            Responde SOLO con el resumen actualizado, nada más."""),
+            ("human", f"Resumen anterior:\n{previous_summary or '(vacío)'}\n\nNuevos turnos:\n{turns}")
+        ]
+
+        self._acquire(PRIORITY_SUMMARY, self.count_tokens(previous_summary + turns) + 400)
+        response = self.llm.invoke(summary_prompt)
+        content = response.content if isinstance(response.content, str) else str(response.content)
+        return content.strip() or previous_summary
+
+    def _acquire(self, priority: int, tokens: int) -> RateLimitTicket:
+        """Espera turno en el limitador global (llamadas síncronas) - U-TUTOR v5.0"""
+        ticket = self.rate_limiter.enqueue(priority, tokens)
+        ticket.wait()
+        return ticket
+
+    async def _aacquire(self, priority: int, tokens: int) -> RateLimitTicket:
+        """Versión asíncrona de _acquire (no bloquea el event loop) - U-TUTOR v5.0"""
+        ticket = self.rate_limiter.enqueue(priority, tokens)
+        await ticket.wait_async()
+        return ticket
+
+    def _extra_call_acquirer(self, priority: int, tokens: int):
+        """
+        Cupo para los reintentos y modelos de respaldo de una llamada síncrona - U-TUTOR v5.0
+
+        Cada uno es otra petición a la API; se cobra la estimación completa.
+        """
+        def acquire(model: str):
+            self._acquire(priority, tokens)
+        return acquire
+
+    def _aextra_call_acquirer(self, priority: int, tokens: int):
+        """Versión asíncrona de _extra_call_acquirer (reintentos, hedging y respaldo) - U-TUTOR v5.0"""
+        async def acquire(model: str) -> RateLimitTicket:
+            return await self._aacquire(priority, tokens)
+        return acquire
+
+    def _estimate_chat_tokens(self) -> int:
+        """Tokens que se reservan para el último prompt preparado - U-TUTOR v5.0"""
+        stats = self.last_context_stats or {}
+        return stats.get("prompt_tokens", 0) + RATE_LIMIT_COMPLETION_TOKENS
+
+    def _settle_chat(self, ticket: RateLimitTicket, content: str):
+        """Ajusta el cupo reservado con los tokens reales de la respuesta - U-TUTOR v5.0"""
+        prompt_tokens = ticket.tokens - RATE_LIMIT_COMPLETION_TOKENS
+        ticket.settle(prompt_tokens + self.count_tokens(content))
+
+    def _get_cache_key(self, api_messages: List[tuple], model: str) -> Optional[str]:
+        """Clave de caché de la petición (None si no hay caché) - U-TUTOR v5.0"""
+        if self.response_cache is None:
+            return None
+        return make_cache_key(model, self.temperature, api_messages)
+
+    def _get_semantic_question(self, messages: List[Dict[str, str]],
+                               model: str) -> Optional[Tuple[str, str]]:
+        """
+        (partición, pregunta) si el turno es la primera pregunta de la conversación - U-TUTOR v5.0
+
+        La partición separa personalidades, modelos y temperaturas (como la
+        clave de la caché exacta): la misma pregunta con otro mensaje de sistema
+        o a otra temperatura no comparte respuesta.
+        """
+        if self.semantic_cache is None or len(messages) != 1 or messages[0]["role"] != "user":
+            return None
+        partition = hashlib.sha1(
+            f"{model}|{round(float(self.temperature), 3)}|{self.system_message}".encode("utf-8")
+        ).hexdigest()[:16]
+        return partition, messages[0]["content"]
+
+    def _get_cached_response(self, cache_key: Optional[str], messages: List[Dict[str, str]],
+                             model: str) -> Optional[str]:
+        """Busca en la caché exacta y, para primeras preguntas, en la semántica - U-TUTOR v5.0"""
+        if not cache_key:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            semantic_question = self._get_semantic_question(messages, model)
+            if semantic_question:
+                cached = self.semantic_cache.lookup(*semantic_question)
+        if cached is not None:
+            print("⚡ [LOG] Respuesta servida desde la caché")
+        return cached
+
+    def _store_response(self, cache_key: str, messages: List[Dict[str, str]], content: str, model: str):
+        """Guarda una respuesta completa en las cachés - U-TUTOR v5.0"""
+        semantic_question = self._get_semantic_question(messages, model)
+        partition, question = semantic_question or (None, None)
+        if self.response_cache.put(cache_key, model, content, question, partition) and semantic_question:
+            self.semantic_cache.add(partition, question, cache_key)
+
+    @staticmethod
+    def _replay_stream(text: str) -> Iterator[AIMessageChunk]:
+        """Reproduce una respuesta cacheada como stream palabra por palabra - U-TUTOR v5.0"""
+        for piece in re.findall(r"\s*\S+\s*", text) or [text]:
+            yield AIMessageChunk(content=piece)
+
+    def _stream_and_cache(self, cache_key: Optional[str], messages: List[Dict[str, str]], stream,
+                          ticket: RateLimitTicket, model: str) -> Iterator:
+        """Pasa el stream tal cual, ajusta el cupo y guarda la respuesta si se completó - U-TUTOR v5.0"""
+        parts = []
+        for chunk in stream:
+            if getattr(chunk, "content", None):
+                parts.append(str(chunk.content))
+            yield chunk
+        # Solo se llega aquí si el stream terminó (no si se interrumpió)
+        content = "".join(parts)
+        self._settle_chat(ticket, content)
+        self._store_if_primary(cache_key, messages, content, model)
+
+    @staticmethod
+    async def _areplay_stream(text: str) -> AsyncIterator[AIMessageChunk]:
+        """Versión asíncrona de _replay_stream - U-TUTOR v5.0"""
+        for chunk in ChatManager._replay_stream(text):
+            yield chunk
+
+    async def _astream_and_cache(self, cache_key: Optional[str], messages: List[Dict[str, str]],
+                                 api_messages: List[tuple], ticket: RateLimitTicket,
+                                 model: str) -> AsyncIterator:
+        """Stream asíncrono del modelo; guarda la respuesta en caché si se completó - U-TUTOR v5.0"""
+        await ticket.wait_async()
+        parts = []
+        stream = resilient_astream(
+            self._client_for, fallback_models(model), api_messages, self._served_callback(model),
+            acquire=self._aextra_call_acquirer(PRIORITY_CHAT, ticket.tokens)
+        )
+        async for chunk in stream:
+            if getattr(chunk, "content", None):
+                parts.append(str(chunk.content))
+            yield chunk
+        content = "".join(parts)
+        self._settle_chat(ticket, content)
+        self._store_if_primary(cache_key, messages, content, model)
+
+    def get_response(self, messages: List[Dict[str, str]], conversation_id: Optional[int] = None,
+                     messages_offset: int = 0) -> str:
         """Obtiene una respuesta del modelo de IA - U-TUTOR v3.0"""
         try:
-            api_messages = self.prepare_messages_for_api(messages)
-            response = self.llm.invoke(api_messages)
+            model = self.route_model(messages)
+            api_messages = self.prepare_messages_for_api(messages, conversation_id, messages_offset, model)
+            cache_key = self._get_cache_key(api_messages, model)
+            cached = self._get_cached_response(cache_key, messages, model)
+            self.last_served_model = None
+            if cached is not None:
+                return cached
+
+            ticket = self._acquire(PRIORITY_CHAT, self._estimate_chat_tokens())
+            response = resilient_call(
+                fallback_models(model),
+                lambda target: self._client_for(target).invoke(api_messages),
+                self._served_callback(model),
+                acquire=self._extra_call_acquirer(PRIORITY_CHAT, ticket.tokens)
+            )
             # Asegurar que retornamos string
             if isinstance(response.content, str):
-                return response.content
-            elif isinstance(response.content, list):
-                # Si es lista, convertir a string
-                return str(response.content)
-            return str(response.content)
+                content = response.content
+            else:
+                # Si es lista u otro tipo, convertir a string
+                content = str(response.content)
+
+            self._settle_chat(ticket, content)
+            self._store_if_primary(cache_key, messages, content, model)
+            return content
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Error al obtener respuesta del modelo: {str(e)}")
     
-    def get_response_stream(self, messages: List[Dict[str, str]]):
+    def get_response_stream(self, messages: List[Dict[str, str]], conversation_id: Optional[int] = None,
+                            messages_offset: int = 0):
         """Obtiene respuesta en streaming para mejor UX - U-TUTOR v3.0"""
         try:
-            api_messages = self.prepare_messages_for_api(messages)
-            return self.llm.stream(api_messages)
+            model = self.route_model(messages)
+            api_messages = self.prepare_messages_for_api(messages, conversation_id, messages_offset, model)
+            cache_key = self._get_cache_key(api_messages, model)
+            cached = self._get_cached_response(cache_key, messages, model)
+            self.last_served_model = None
+            if cached is not None:
+                return self._replay_stream(cached)
+            ticket = self._acquire(PRIORITY_CHAT, self._estimate_chat_tokens())
+            stream = resilient_stream(
+                self._client_for, fallback_models(model), api_messages, self._served_callback(model),
+                acquire=self._extra_call_acquirer(PRIORITY_CHAT, ticket.tokens)
+            )
+            return self._stream_and_cache(cache_key, messages, stream, ticket, model)
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             raise Exception(f"Error al obtener respuesta en streaming: {str(e)}")
     
+    def refresh_cached_response(self, messages: List[Dict[str, str]], max_age: float) -> bool:
+        """
+        Pregenera la respuesta de una petición si no está en caché o es más antigua que max_age - U-TUTOR v5.0
+
+        Usa la misma clave que get_response/aget_response_stream con la
+        personalidad, modelo y temperatura actuales, así que la petición real
+        se sirve desde la caché. Va al limitador con prioridad de fondo.
+
+        Returns:
+            True si se generó una respuesta nueva
+        """
+        if self.response_cache is None:
+            return False
+        model = self.route_model(messages)
+        api_messages = self.prepare_messages_for_api(messages, model=model)
+        cache_key = self._get_cache_key(api_messages, model)
+        age = self.response_cache.age(cache_key)
+        if age is not None and age < max_age:
+            return False
+
+        ticket = self._acquire(PRIORITY_BACKGROUND, self._estimate_chat_tokens())
+        self.last_served_model = None
+        response = resilient_call(
+            fallback_models(model),
+            lambda target: self._client_for(target).invoke(api_messages),
+            self._served_callback(model),
+            acquire=self._extra_call_acquirer(PRIORITY_BACKGROUND, ticket.tokens)
+        )
+        content = self._response_text(response)
+        self._settle_chat(ticket, content)
+        self._store_if_primary(cache_key, messages, content, model)
+        return self.last_served_model == model
+
+    @staticmethod
+    def _with_continuation(messages: List[Dict[str, str]], prefix: str) -> List[Dict[str, str]]:
+        """Agrega la respuesta parcial y la instrucción de continuarla - U-TUTOR v5.0"""
+        return messages + [
+            {"role": "assistant", "content": prefix},
+            {"role": "user", "content": CONTINUE_INSTRUCTION},
+        ]
+
+    def aget_response_stream(self, messages: List[Dict[str, str]], conversation_id: Optional[int] = None,
+                             messages_offset: int = 0,
+                             continuation_prefix: Optional[str] = None) -> AsyncIterator:
+        """
+        Versión asíncrona de get_response_stream - U-TUTOR v5.0
+
+        El contexto y la caché se resuelven al llamar; la petición HTTP empieza
+        al recorrer el generador en el event loop.
+
+        Args:
+            continuation_prefix: Respuesta parcial guardada; el modelo genera solo
+                lo que falta (los chunks no repiten el prefijo)
+        """
+        try:
+            # Se enruta por la pregunta original, no por la instrucción de continuar
+            model = self.route_model(messages)
+            if continuation_prefix:
+                messages = self._with_continuation(messages, continuation_prefix)
+            api_messages = self.prepare_messages_for_api(messages, conversation_id, messages_offset, model)
+            cache_key = self._get_cache_key(api_messages, model)
+            cached = self._get_cached_response(cache_key, messages, model)
+            self.last_served_model = None
+            self.chat_ticket = None
+            if cached is not None:
+                return self._areplay_stream(cached)
+            # El turno se pide ya (la UI muestra la posición); la espera ocurre en el loop
+            self.chat_ticket = self.rate_limiter.enqueue(PRIORITY_CHAT, self._estimate_chat_tokens())
+            return self._astream_and_cache(cache_key, messages, api_messages, self.chat_ticket, model)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            raise Exception(f"Error al obtener respuesta en streaming: {str(e)}")
+
+    @staticmethod
+    def _response_text(response) -> str:
+        """Contenido de una respuesta del modelo como string - U-TUTOR v5.0"""
+        return response.content if isinstance(response.content, str) else str(response.content)
+
+    @staticmethod
+    def _build_translation_prompt(text: str, target_language: str) -> List[tuple]:
+        """Prompt de traducción (compartido por la versión síncrona y la asíncrona)"""
+        return [
+            ("system", f"""Eres un traductor experto. Traduce el siguiente texto al {target_language.upper()}.
+
+            Reglas:
+            - Mantén el tono y estilo del texto original
+            - Preserva el formato (markdown, listas, etc.)
+            - Traduce solo el contenido, no agregues explicaciones
+            - Si el texto ya está en {target_language.upper()}, devuélvelo tal como está
+
+            Responde SOLO con la traducción, nada más."""),
+            ("human", text)
+        ]
+
     def translate_text(self, text: str, target_language: str = 'en') -> str:
         """Traduce texto usando la API de OpenAI - U-TUTOR v3.0"""
         try:
             if target_language == 'es':
                 return text  # No traducir si ya está en español
 
-            # Crear prompt de traducción
-            translation_prompt = [
-                ("system", f"""Eres un traductor experto. Traduce el siguiente texto al {target_language.upper()}.
+            self._acquire(PRIORITY_BACKGROUND, self.count_tokens(text) * 2 + 100)
+            response = self.light_llm.invoke(self._build_translation_prompt(text, target_language))
+            return self._response_text(response).strip()
 
-                Reglas:
-                - Mantén el tono y estilo del texto original
-                - Preserva el formato (markdown, listas, etc.)
-                - Traduce solo el contenido, no agregues explicaciones
-                - Si el texto ya está en {target_language.upper()}, devuélvelo tal como está
+        except Exception as e:
+            print(f"Error en traducción: {e}")
+            return text  # Devolver texto original si falla la traducción
 
-                Responde SOLO con la traducción, nada más."""),
-                ("human", text)
-            ]
+    async def atranslate_text(self, text: str, target_language: str = 'en') -> str:
+        """Versión asíncrona de translate_text - U-TUTOR v5.0"""
+        try:
+            if target_language == 'es':
+                return text
 
-            response = self.llm.invoke(translation_prompt)
-            # Asegurar que obtenemos string
-            content = response.content if isinstance(response.content, str) else str(response.content)
-            return content.strip()
+            await self._aacquire(PRIORITY_BACKGROUND, self.count_tokens(text) * 2 + 100)
+            response = await self.light_llm.ainvoke(self._build_translation_prompt(text, target_language))
+            return self._response_text(response).strip()
 
         except Exception as e:
             print(f"Error en traducción: {e}")
-            return text  # Devolver texto original si falla la traducción
+            return text
     
     def generate_conversation_title(self, first_message: str, max_length: int = 50) -> str:
-        """Genera un título para la conversación basado en el primer mensaje"""
+        """
+        Genera un título para la conversación basado en el primer mensaje - U-TUTOR v5.0
+
+        Primero el título local por palabras clave ("Materia: Tema", sin llamar
+        al modelo); si el mensaje no tiene palabras de contenido, se recorta.
+        """
+        title = get_local_titler().title(first_message)
+        if title:
+            return title
         if len(first_message) > max_length:
             return first_message[:max_length].strip() + "..."
         return first_message.strip()
+
+    def _build_title_prompt(self, messages: List[Dict[str, str]]) -> List[dict]:
+        """Prompt para generar el título de una conversación - U-TUTOR v5.0"""
+        return [
+            {"role": "system", "content": """Eres un asistente que genera títulos concisos y descriptivos para conversaciones educativas.
+
+            Reglas:
+            - Máximo 40 caracteres
+            - Usa palabras clave del tema principal
+            - Sé específico y claro
+            - Usa español
+            - NO incluyas emojis
+            - Ejemplos: "Matemáticas: Ecuaciones", "Biología: Fotosíntesis", "Programación: POO"
+
+            Responde SOLO con el título, nada más."""},
+            {"role": "user", "content": f"Genera un título para esta conversación:\n\n{self._format_messages_for_title(messages)}"}
+        ]
+
+    @staticmethod
+    def _clean_title(content: str) -> str:
+        """Limpia y valida el título devuelto por el modelo - U-TUTOR v5.0"""
+        title = content.strip().replace('"', '').replace("'", '').strip()
+        if len(title) > 40:
+            title = title[:37] + "..."
+        return title if title else "Nueva Conversación"
+
+    def _fallback_title(self, messages: List[Dict[str, str]]) -> str:
+        """Título a partir del primer mensaje si falla la IA - U-TUTOR v5.0"""
+        if messages and len(messages) > 0:
+            first_msg = messages[0].get("content", "")
+            return self.generate_conversation_title(first_msg)
+        return "Nueva Conversación"
     
-    def generate_ai_title(self, messages: List[Dict[str, str]]) -> str:
-        """Genera un título inteligente usando la API - U-TUTOR v3.0"""
+    def generate_ai_title(self, messages: List[Dict[str, str]], fallback: bool = True) -> Optional[str]:
+        """
+        Genera un título inteligente usando la API - U-TUTOR v3.0
+
+        Args:
+            fallback: Si la IA falla, retornar el título local (True) o None
+        """
         try:
-            # Preparar mensajes para generar título
-            title_prompt = [
-                {"role": "system", "content": """Eres un asistente que genera títulos concisos y descriptivos para conversaciones educativas.
-
-                Reglas:
-                - Máximo 40 caracteres
-                - Usa palabras clave del tema principal
-                - Sé específico y claro
-                - Usa español
-                - NO incluyas emojis
-                - Ejemplos: "Matemáticas: Ecuaciones", "Biología: Fotosíntesis", "Programación: POO"
-
-                Responde SOLO con el título, nada más."""},
-                {"role": "user", "content": f"Genera un título para esta conversación:\n\n{self._format_messages_for_title(messages)}"}
-            ]
-
-            response = self.llm.invoke(title_prompt)
-            # Asegurar que obtenemos string
-            content = response.content if isinstance(response.content, str) else str(response.content)
-            title = content.strip()
-            
-            # Limpiar y validar el título
-            title = title.replace('"', '').replace("'", '').strip()
-            if len(title) > 40:
-                title = title[:37] + "..."
-            
-            return title if title else "Nueva Conversación"
+            self._acquire(PRIORITY_BACKGROUND, self.count_tokens(self._format_messages_for_title(messages)) + 200)
+            response = self.light_llm.invoke(self._build_title_prompt(messages))
+            return self._clean_title(self._response_text(response))
             
         except Exception as e:
             print(f"Error generando título con IA: {e}")
             # Fallback al método original
-            if messages and len(messages) > 0:
-                first_msg = messages[0].get("content", "")
-                return self.generate_conversation_title(first_msg)
-            return "Nueva Conversación"
+            return self._fallback_title(messages) if fallback else None
+
+    async def agenerate_ai_title(self, messages: List[Dict[str, str]]) -> str:
+        """Versión asíncrona de generate_ai_title - U-TUTOR v5.0"""
+        try:
+            await self._aacquire(PRIORITY_BACKGROUND, self.count_tokens(self._format_messages_for_title(messages)) + 200)
+            response = await self.light_llm.ainvoke(self._build_title_prompt(messages))
+            return self._clean_title(self._response_text(response))
+
+        except Exception as e:
+            print(f"Error generando título con IA: {e}")
+            return self._fallback_title(messages)
+
+    # --- Fachada síncrona sobre el event loop compartido (no bloquea los reruns) ---
+
+    def start_response_stream(self, messages: List[Dict[str, str]], conversation_id: Optional[int] = None,
+                              messages_offset: int = 0,
+                              continuation_prefix: Optional[str] = None) -> StreamBridge:
+        """
+        Inicia aget_response_stream en el loop compartido - U-TUTOR v5.0
+
+        Returns:
+            Iterador síncrono de chunks; mientras el script lo recorre, el loop
+            puede atender en paralelo el título o la traducción
+        """
+        return get_background_loop().stream(
+            self.aget_response_stream(messages, conversation_id, messages_offset, continuation_prefix)
+        )
+
+    def start_generation(self, messages: List[Dict[str, str]], conversation_id: Optional[int] = None,
+                         messages_offset: int = 0,
+                         continuation_prefix: Optional[str] = None) -> GenerationHandle:
+        """
+        Inicia una respuesta cancelable (cancela la anterior si sigue en curso) - U-TUTOR v5.0
+        """
+        self.cancel_generation(reason="nueva generación")
+        bridge = self.start_response_stream(messages, conversation_id, messages_offset, continuation_prefix)
+        handle = GenerationHandle(conversation_id, bridge, self.chat_ticket)
+        self.active_generation = handle
+        return handle
+
+    def cancel_generation(self, reason: str = "", handle: Optional[GenerationHandle] = None) -> bool:
+        """
+        Cancela la generación en curso - U-TUTOR v5.0
+
+        Args:
+            reason: Motivo (solo para el log)
+            handle: Si se indica, solo se cancela si sigue siendo la generación activa
+
+        Returns:
+            True si había una generación en curso y se canceló
+        """
+        active = self.active_generation
+        if active is None or (handle is not None and handle is not active):
+            return False
+        self.active_generation = None
+        if active.cancel():
+            print(f"🛑 [LOG] Generación cancelada ({reason}): {active.chunk_count} fragmentos recibidos")
+            return True
+        return False
+
+    def translate_text_async(self, text: str, target_language: str = 'en') -> Future:
+        """Traduce en segundo plano; retorna un Future con el texto traducido - U-TUTOR v5.0"""
+        return get_background_loop().submit(self.atranslate_text(text, target_language))
+
+    def generate_ai_title_async(self, messages: List[Dict[str, str]]) -> Future:
+        """Genera el título en segundo plano; retorna un Future con el título - U-TUTOR v5.0"""
+        return get_background_loop().submit(self.agenerate_ai_title(messages))
     
     def _format_messages_for_title(self, messages: List[Dict[str, str]]) -> str:
         """Formatea los primeros mensajes para generar título - U-TUTOR v3.0"""
@@ -153,25 +753,16 @@ class ChatManager:
     
     def update_personality(self, personality_type: str):
         """Actualiza la personalidad del asistente - U-TUTOR v3.0"""
-        personalities = {
-            "Profesional": """Eres Jake, un tutor universitario profesional y formal. 
-            Proporciona explicaciones detalladas y académicas.""",
-            
-            "Amigable": """Eres Jake, un tutor universitario cercano y amigable. 
-            Explicas de manera casual pero efectiva, usando ejemplos cotidianos.""",
-            
-            "Conciso": """Eres Jake, un tutor universitario directo y conciso. 
-            Vas al grano y das respuestas precisas sin rodeos.""",
-            
-            "Detallado": """Eres Jake, un tutor universitario exhaustivo. 
-            Proporcionas explicaciones profundas con múltiples ejemplos y contexto."""
-        }
-        
-        self.system_message = personalities.get(personality_type, self.system_message)
+        self.system_message = PERSONALITIES.get(personality_type, self.system_message)
 
     def update_temperature(self, new_temperature: float):
         """Actualiza la temperatura del modelo - U-TUTOR v5.0"""
+        # El cliente es compartido: no se modifica, se elige el de la nueva temperatura
         self.temperature = new_temperature
-        self.llm.temperature = new_temperature
+
+    def set_model(self, model: str):
+        """Cambia el modelo de la sesión (cancela la respuesta en curso) - U-TUTOR v5.0"""
+        self.cancel_generation(reason="cambio de modelo")
+        self.model = model
         
     
\ No newline at end of file
@@ -0,0 +1,170 @@
+# U-TUTOR v5.0 - Constructor de contexto con presupuesto de tokens por modelo
+"""
+Decide qué parte del historial se envía al modelo en cada turno.
+
+Siempre se conserva el mensaje de sistema y los turnos más recientes; los
+más antiguos se descartan (o el primero que no cabe se recorta) hasta que
+el prompt entra en el presupuesto de tokens del modelo. El resultado es
+determinista: el mismo historial produce siempre el mismo contexto.
+
+Los tokens se cuentan con tiktoken si está instalado; si no, con una
+estimación por caracteres calibrada para español.
+"""
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+
+# Presupuesto de tokens de entrada por modelo (deja margen para la respuesta)
+MODEL_TOKEN_BUDGETS = {
+    "gpt-4": 6000,            # Ventana de 8k
+    "gpt-4-turbo": 24000,
+    "gpt-4o": 24000,
+    "gpt-4o-mini": 24000,
+    "gpt-3.5-turbo": 12000,   # Ventana de 16k
+}
+DEFAULT_TOKEN_BUDGET = 6000
+
+# Tokens extra por mensaje en el formato de chat de OpenAI (rol + separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens que el formato agrega para iniciar la respuesta del asistente
+REPLY_PRIMING_TOKENS = 3
+# Caracteres por token estimados para texto en español (sin tiktoken)
+CHARS_PER_TOKEN = 3.5
+# Un mensaje antiguo solo se recorta si quedan al menos estos tokens libres
+MIN_TRUNCATED_TOKENS = 32
+TRUNCATION_MARKER = "[…] "
+
+
+def get_token_budget(model: str) -> int:
+    """
+    Presupuesto de tokens de entrada para un modelo.
+
+    Se puede configurar con CONTEXT_TOKEN_BUDGET (todos los modelos) o con
+    CONTEXT_TOKEN_BUDGETS="gpt-4:6000,gpt-4o:24000" (por modelo).
+    """
+    per_model = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+    for entry in per_model.split(","):
+        name, _, value = entry.partition(":")
+        if name.strip() == model and value.strip().isdigit():
+            return int(value)
+
+    global_budget = os.getenv("CONTEXT_TOKEN_BUDGET", "")
+    if global_budget.isdigit():
+        return int(global_budget)
+
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+class TokenCounter:
+    """Cuenta tokens con tiktoken o con una estimación local"""
+
+    def __init__(self, model: str):
+        self.encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.method = "tiktoken" if self.encoding else "estimado"
+
+    def count(self, text: str) -> int:
+        """Cantidad de tokens de un texto"""
+        if not text:
+            return 0
+        if self.encoding:
+            return len(self.encoding.encode(text))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """Recorta un texto conservando su final (lo más cercano a la conversación actual)"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        # Reservar espacio para el marcador (+1 por redondeo en la unión)
+        keep_tokens = max(max_tokens - self.count(TRUNCATION_MARKER) - 1, 1)
+        if self.encoding:
+            tokens = self.encoding.encode(text)
+            return TRUNCATION_MARKER + self.encoding.decode(tokens[-keep_tokens:])
+        max_chars = int(keep_tokens * CHARS_PER_TOKEN)
+        return TRUNCATION_MARKER + text[-max_chars:]
+
+
+class ContextBuilder:
+    """Arma la lista de mensajes para la API dentro de un presupuesto de tokens"""
+
+    def __init__(self, model: str, budget: Optional[int] = None, min_recent_messages: int = 2):
+        """
+        Args:
+            model: Nombre del modelo (para el tokenizador y el presupuesto)
+            budget: Presupuesto de tokens de entrada (None = según el modelo)
+            min_recent_messages: Mensajes más recientes que siempre se envían
+        """
+        self.model = model
+        self.budget = budget if budget is not None else get_token_budget(model)
+        self.min_recent_messages = min_recent_messages
+        self.counter = TokenCounter(model)
+
+    def build(self, system_message: str, messages: List[Dict[str, str]]) -> Tuple[List[tuple], dict]:
+        """
+        Construye los mensajes para la API.
+
+        Args:
+            system_message: Prompt de sistema (siempre se incluye)
+            messages: Historial [{"role", "content"}] en orden cronológico
+
+        Returns:
+            (api_messages, stats) donde api_messages es [(rol, contenido)] y
+            stats resume los tokens enviados y lo descartado
+        """
+        system_tokens = self.counter.count(system_message) + MESSAGE_OVERHEAD_TOKENS
+        remaining = self.budget - system_tokens - REPLY_PRIMING_TOKENS
+
+        selected = []
+        truncated = False
+        # Recorrer del más reciente al más antiguo
+        for position, msg in enumerate(reversed(messages)):
+            content = msg["content"]
+            cost = self.counter.count(content) + MESSAGE_OVERHEAD_TOKENS
+            must_keep = position < self.min_recent_messages
+
+            if cost <= remaining:
+                selected.append((msg["role"], content))
+                remaining -= cost
+                continue
+
+            available = remaining - MESSAGE_OVERHEAD_TOKENS
+            if must_keep or available >= MIN_TRUNCATED_TOKENS:
+                # Los turnos recientes nunca se descartan: se recortan al espacio que quede
+                content = self.counter.truncate_to_tokens(content, max(available, MIN_TRUNCATED_TOKENS))
+                selected.append((msg["role"], content))
+                remaining -= self.counter.count(content) + MESSAGE_OVERHEAD_TOKENS
+                truncated = True
+                if must_keep:
+                    continue
+            break
+
+        selected.reverse()
+
+        api_messages = [("system", system_message)]
+        for role, content in selected:
+            api_role = "human" if role == "user" else "assistant"
+            api_messages.append((api_role, content))
+
+        stats = {
+            "model": self.model,
+            "budget": self.budget,
+            "prompt_tokens": self.budget - remaining,
+            "messages_sent": len(selected),
+            "messages_dropped": len(messages) - len(selected),
+            "truncated": truncated,
+            "token_counter": self.counter.method,
+        }
+        return api_messages, stats
@@ -0,0 +1,132 @@
+# U-TUTOR v5.0 - Memoria de conversación con resumen incremental
+"""
+Resumen acumulado de los turnos antiguos de cada conversación.
+
+En los hilos largos el modelo recibe el resumen más los turnos recientes en
+lugar de todo el historial. El resumen se guarda en la tabla
+``conversation_summaries`` y se actualiza en segundo plano después de cada
+respuesta: solo se "pliegan" los mensajes nuevos que salieron de la ventana
+reciente, combinándolos con el resumen anterior (nunca se recalcula desde
+cero).
+
+Los mensajes resumidos se identifican por posición: ``summarized_count`` es
+la cantidad de mensajes (en orden de id) que ya están dentro del resumen.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Mensajes más recientes que nunca se resumen (se envían completos)
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "10"))
+# Mensajes pendientes mínimos para justificar una llamada de resumen
+SUMMARY_MIN_BATCH = int(os.getenv("SUMMARY_MIN_BATCH", "10"))
+# Máximo de mensajes que se pliegan por llamada (los hilos viejos se resumen por tramos)
+SUMMARY_MAX_BATCH = 40
+
+# Un solo ejecutor por proceso: los resúmenes no compiten con las respuestas
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SUMMARY_WORKERS", "2")),
+    thread_name_prefix="ututor-summary"
+)
+
+SummarizeFn = Callable[[str, List[Tuple[str, str]]], str]
+
+
+class ConversationMemory:
+    """Resumen persistente por conversación, actualizado en segundo plano"""
+
+    def __init__(self, db_manager, summarize_fn: SummarizeFn,
+                 keep_recent: int = SUMMARY_KEEP_RECENT, min_batch: int = SUMMARY_MIN_BATCH):
+        """
+        Args:
+            db_manager: DatabaseManager donde se guardan los resúmenes
+            summarize_fn: fn(resumen_anterior, [(role, content)]) -> resumen nuevo
+            keep_recent: Mensajes recientes que quedan fuera del resumen
+            min_batch: Mensajes pendientes mínimos para actualizar el resumen
+        """
+        self.db_manager = db_manager
+        self.summarize_fn = summarize_fn
+        self.keep_recent = keep_recent
+        self.min_batch = min_batch
+        self._lock = threading.Lock()
+        # conversation_id -> (summary, summarized_count, last_message_id)
+        self._cache: Dict[int, Tuple[str, int, int]] = {}
+        self._in_flight = set()
+
+    def get(self, conversation_id: int) -> Tuple[str, int]:
+        """Retorna (resumen, mensajes_resumidos) de una conversación ("" y 0 si no hay)"""
+        with self._lock:
+            cached = self._cache.get(conversation_id)
+        if cached is None:
+            cached = self._load(conversation_id)
+        return cached[0], cached[1]
+
+    def _load(self, conversation_id: int) -> Tuple[str, int, int]:
+        """Lee el resumen guardado y lo deja en caché"""
+        row = self.db_manager.get_conversation_summary(conversation_id) or ("", 0, 0)
+        with self._lock:
+            self._cache[conversation_id] = row
+        return row
+
+    def reload(self, conversation_id: int) -> Tuple[str, int]:
+        """Vuelve a leer el resumen de la base de datos (al abrir una conversación)"""
+        row = self._load(conversation_id)
+        return row[0], row[1]
+
+    def schedule_update(self, conversation_id: int) -> Optional[Future]:
+        """
+        Encola la actualización incremental del resumen.
+
+        Si ya hay una actualización en curso para la conversación no se encola
+        otra: la próxima respuesta volverá a intentarlo.
+        """
+        with self._lock:
+            if conversation_id in self._in_flight:
+                return None
+            self._in_flight.add(conversation_id)
+        return _executor.submit(self._run_update, conversation_id)
+
+    def _run_update(self, conversation_id: int):
+        """Tarea en segundo plano (nunca propaga errores al script de Streamlit)"""
+        try:
+            self.update(conversation_id)
+        except Exception as e:
+            print(f"❌ [MEMORIA] Error actualizando resumen de la conversación {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(conversation_id)
+
+    def update(self, conversation_id: int) -> bool:
+        """
+        Pliega en el resumen los mensajes que salieron de la ventana reciente.
+
+        Returns:
+            True si el resumen cambió
+        """
+        summary, summarized_count, last_message_id = self._load(conversation_id)
+        total = self.db_manager.get_conversation_message_count(conversation_id)
+        changed = False
+
+        pending = total - summarized_count - self.keep_recent
+        while pending >= self.min_batch:
+            rows = self.db_manager.load_messages_after(
+                conversation_id, last_message_id, min(pending, SUMMARY_MAX_BATCH)
+            )
+            if not rows:
+                break
+
+            summary = self.summarize_fn(summary, [(role, content) for _, role, content in rows])
+            summarized_count += len(rows)
+            last_message_id = rows[-1][0]
+            self.db_manager.save_conversation_summary(
+                conversation_id, summary, summarized_count, last_message_id
+            )
+            with self._lock:
+                self._cache[conversation_id] = (summary, summarized_count, last_message_id)
+            print(f"🧠 [MEMORIA] Conversación {conversation_id}: {summarized_count} mensajes resumidos "
+                  f"({len(summary)} caracteres)")
+            changed = True
+            pending -= len(rows)
+
+        return changed
@@ -1,52 +1,205 @@
 # U-TUTOR v3.0 - Mejoras en database_manager.py: Context managers, optimizaciones y nuevos métodos
+import queue
+import re
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 from contextlib import contextmanager
+from db_migrations import MESSAGE_METRIC_COLUMNS, apply_migrations, backfill_stats
+from message_writer import MessageWriter
+
+# PRAGMAs aplicados a cada conexión del pool - OPTIMIZACION
+# WAL permite que los lectores (sidebar) no se bloqueen mientras otra sesión escribe.
+POOL_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",      # Seguro con WAL, evita fsync en cada commit
+    "PRAGMA cache_size=-16000",       # ~16 MB de caché de páginas por conexión
+    "PRAGMA mmap_size=134217728",     # 128 MB de lectura mapeada en memoria
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Conexiones abiertas como máximo en el pool (cada una con su caché de páginas y mmap)
+DEFAULT_POOL_SIZE = 8
+
+# Tamaño del caché de sentencias preparadas por conexión
+STATEMENT_CACHE_SIZE = 256
+
+# Tiempo máximo (segundos) que una conexión espera un lock antes de fallar
+BUSY_TIMEOUT = 5.0
+
+# Máximo de mensajes candidatos (mejor BM25) considerados por búsqueda
+SEARCH_CANDIDATE_LIMIT = 500
+
+# Inserción de un mensaje junto con sus columnas de métricas
+_INSERT_MESSAGE = (
+    "INSERT INTO messages (conversation_id, role, content, "
+    + ", ".join(name for name, _ in MESSAGE_METRIC_COLUMNS)
+    + ") VALUES (?, ?, ?" + ", ?" * len(MESSAGE_METRIC_COLUMNS) + ")"
+)
+
+
+class _PoolLease:
+    """Conexión prestada a un hilo; las llamadas anidadas del mismo hilo la comparten"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.depth = 0
+
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "chat_history.db"):
+    def __init__(self, db_path: str = "chat_history.db", pooled: bool = False,
+                 write_behind: bool = False, pool_size: int = DEFAULT_POOL_SIZE):
+        """
+        Inicializa el gestor de base de datos - U-TUTOR v5.0
+
+        Args:
+            db_path: Ruta del archivo SQLite
+            pooled: Si es True, presta conexiones persistentes de un pool acotado
+                    (modo WAL + PRAGMAs optimizados) en lugar de abrir una
+                    conexión nueva en cada llamada
+            write_behind: Si es True, save_message encola el mensaje y un hilo
+                          en segundo plano lo guarda en lotes (ver message_writer.py)
+            pool_size: Conexiones abiertas como máximo en modo pooled
+        """
         self.db_path = db_path
+        self.pooled = pooled
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        # Conexiones libres (LIFO: la más reciente tiene la caché más caliente)
+        self._idle = queue.LifoQueue()
+        self._pool_connections = []
+        self.fts_enabled = False
         self.init_database()
+        self.writer = MessageWriter(self) if write_behind else None
     
+    def _create_pooled_connection(self) -> sqlite3.Connection:
+        """Abre una conexión de larga duración con PRAGMAs de rendimiento - U-TUTOR v5.0"""
+        # La usa un solo hilo a la vez, pero no siempre el mismo (cada rerun
+        # de Streamlit corre en un hilo nuevo)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        for pragma in POOL_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        """Toma una conexión libre, abre una nueva si hay cupo o espera una - U-TUTOR v5.0"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if len(self._pool_connections) < self.pool_size:
+                conn = self._create_pooled_connection()
+                self._pool_connections.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=BUSY_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Pool de conexiones agotado ({self.pool_size} en uso durante {BUSY_TIMEOUT:.0f} s)"
+            )
+
+    def _checkin(self, conn: sqlite3.Connection):
+        """Devuelve una conexión al pool (o la cierra si el pool se cerró) - U-TUTOR v5.0"""
+        with self._pool_lock:
+            if any(conn is pooled for pooled in self._pool_connections):
+                self._idle.put(conn)
+                return
+        conn.close()
+
     @contextmanager
     def get_connection(self):
-        """Context manager para conexiones eficientes - U-TUTOR v3.0"""
+        """Context manager para conexiones eficientes - U-TUTOR v5.0"""
+        if self.pooled:
+            # La conexión se presta mientras dura el bloque y vuelve al pool al salir:
+            # un hilo que termina (cada rerun de Streamlit) no se queda con ella.
+            # Las llamadas anidadas del mismo hilo comparten el préstamo.
+            lease = getattr(self._local, "lease", None)
+            if lease is None or lease.depth == 0:
+                lease = self._local.lease = _PoolLease(self._checkout())
+            lease.depth += 1
+            conn = lease.conn
+            try:
+                yield conn
+                if lease.depth == 1 and conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                # No dejar transacciones abiertas en una conexión reutilizable
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                lease.depth -= 1
+                if lease.depth == 0:
+                    self._checkin(conn)
+            return
+
         conn = sqlite3.connect(self.db_path)
         try:
             yield conn
         finally:
             conn.close()
+
+    def close_all(self):
+        """Vacía la cola de escritura y cierra todas las conexiones del pool - U-TUTOR v5.0"""
+        if self.writer:
+            self.writer.close()
+        with self._pool_lock:
+            idle = self._idle
+            self._idle = queue.LifoQueue()
+            self._pool_connections = []
+        # Las prestadas en este momento se cierran al devolverse (_checkin)
+        while not idle.empty():
+            try:
+                idle.get_nowait().close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
     
     def init_database(self):
         """Inicializa la base de datos SQLite"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Crear tabla para conversaciones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Crear tabla para mensajes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                conversation_id INTEGER,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Crear tabla para conversaciones
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Crear tabla para mensajes
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id INTEGER,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+                )
+            ''')
+            
+            conn.commit()
+
+            # Aplicar migraciones pendientes (índices, tablas nuevas, etc.)
+            apply_migrations(conn)
+
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
             )
-        ''')
-        
-        conn.commit()
-        conn.close()
+            self.fts_enabled = cursor.fetchone() is not None
     
     def create_conversation(self, title: str) -> int:
         """Crea una nueva conversación usando context manager - U-TUTOR v3.0"""
@@ -68,6 +221,48 @@ class DatabaseManager:
             ''')
             return cursor.fetchall()
     
+    def get_conversations_page(self, limit: int = 20,
+                               cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Tuple], Optional[Tuple[str, int]]]:
+        """
+        Obtiene una página de conversaciones con paginación por keyset - U-TUTOR v5.0
+
+        Ordena por (updated_at, id) descendente. El costo de cada página es
+        O(limit) gracias al índice de updated_at, sin importar el tamaño del historial.
+
+        Args:
+            limit: Conversaciones por página
+            cursor: (updated_at, id) de la última fila de la página anterior,
+                    o None para la primera página
+
+        Returns:
+            (filas, siguiente_cursor); siguiente_cursor es None si no hay más páginas
+        """
+        with self.get_connection() as conn:
+            db_cursor = conn.cursor()
+            if cursor is None:
+                db_cursor.execute('''
+                    SELECT id, title, created_at, updated_at 
+                    FROM conversations 
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                ''', (limit + 1,))
+            else:
+                db_cursor.execute('''
+                    SELECT id, title, created_at, updated_at 
+                    FROM conversations 
+                    WHERE (updated_at, id) < (?, ?)
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                ''', (cursor[0], cursor[1], limit + 1))
+            rows = db_cursor.fetchall()
+
+        # Se pidió una fila extra solo para saber si existe otra página
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_id, _, _, last_updated_at = rows[-1]
+            return rows, (last_updated_at, last_id)
+        return rows, None
+
     def get_conversation_by_id(self, conversation_id: int) -> Optional[Tuple]:
         """Obtiene una conversación específica por ID - U-TUTOR v3.0"""
         with self.get_connection() as conn:
@@ -78,46 +273,245 @@ class DatabaseManager:
             )
             return cursor.fetchone()
     
-    def update_conversation_title(self, conversation_id: int, new_title: str) -> bool:
-        """Actualiza el título de una conversación - U-TUTOR v3.0"""
+    def update_conversation_title(self, conversation_id: int, new_title: str,
+                                  expected_title: Optional[str] = None) -> bool:
+        """
+        Actualiza el título de una conversación - U-TUTOR v3.0
+
+        Args:
+            expected_title: Si se indica, solo se actualiza si el título actual es
+                            este (p. ej. para no pisar un título renombrado a mano)
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE conversations SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-                (new_title, conversation_id)
-            )
+            if expected_title is None:
+                cursor.execute(
+                    "UPDATE conversations SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (new_title, conversation_id)
+                )
+            else:
+                cursor.execute(
+                    "UPDATE conversations SET title = ?, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id = ? AND title = ?",
+                    (new_title, conversation_id, expected_title)
+                )
             success = cursor.rowcount > 0
             conn.commit()
             return success
     
-    def save_message(self, conversation_id: int, role: str, content: str):
-        """Guarda un mensaje en la base de datos - U-TUTOR v3.0"""
+    @staticmethod
+    def _metric_values(metrics: Optional[dict]) -> tuple:
+        """Valores de las columnas de métricas (en el orden de MESSAGE_METRIC_COLUMNS)"""
+        metrics = metrics or {}
+        return tuple(metrics.get(name) for name, _ in MESSAGE_METRIC_COLUMNS)
+
+    def save_message(self, conversation_id: int, role: str, content: str,
+                     metrics: Optional[dict] = None):
+        """
+        Guarda un mensaje en la base de datos (o lo encola en modo write-behind) - U-TUTOR v5.0
+
+        Args:
+            metrics: Solo respuestas del asistente: model, prompt_tokens,
+                     completion_tokens, ttft_ms y total_ms
+        """
+        if self.writer:
+            self.writer.enqueue(conversation_id, role, content, metrics)
+            return
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                (conversation_id, role, content)
+                _INSERT_MESSAGE,
+                (conversation_id, role, content) + self._metric_values(metrics)
             )
             cursor.execute(
                 "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                 (conversation_id,)
             )
             conn.commit()
-    
-    def load_conversation_messages(self, conversation_id: int) -> List[Tuple]:
-        """Carga el historial de mensajes de una conversación - U-TUTOR v3.0"""
+
+    def write_messages_batch(self, messages: List[Tuple]):
+        """
+        Guarda varios mensajes en una sola transacción (group commit) - U-TUTOR v5.0
+
+        Args:
+            messages: Lista de (conversation_id, role, content[, metrics])
+        """
+        conversation_ids = {(message[0],) for message in messages}
+        rows = [
+            tuple(message[:3]) + self._metric_values(message[3] if len(message) > 3 else None)
+            for message in messages
+        ]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(_INSERT_MESSAGE, rows)
+            cursor.executemany(
+                "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                conversation_ids
+            )
+            conn.commit()
+
+    def flush_pending_writes(self, conversation_id: Optional[int] = None) -> bool:
+        """
+        Espera a que los mensajes encolados estén confirmados - U-TUTOR v5.0
+
+        Args:
+            conversation_id: Solo esperar los de esta conversación (None = todos)
+
+        Returns:
+            False si algún mensaje no se pudo guardar (ver retry_failed_writes)
+        """
+        return self.writer.flush(conversation_id) if self.writer else True
+
+    def insert_partial_message(self, conversation_id: int, content: str) -> int:
+        """
+        Crea el checkpoint de una respuesta en curso (escritura síncrona) - U-TUTOR v5.0
+
+        Returns:
+            ID del mensaje parcial, para actualizarlo en los siguientes checkpoints
+        """
+        # El mensaje del usuario (quizá aún en la cola) debe quedar antes
+        self.flush_pending_writes(conversation_id)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO messages (conversation_id, role, content, is_partial) VALUES (?, 'assistant', ?, 1)",
+                (conversation_id, content)
+            )
+            cursor.execute(
+                "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (conversation_id,)
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def update_partial_message(self, message_id: int, content: str, finished: bool = False,
+                               metrics: Optional[dict] = None):
+        """
+        Actualiza un checkpoint; con finished=True queda como respuesta completa - U-TUTOR v5.0
+
+        Args:
+            metrics: Métricas de la respuesta terminada (ver save_message)
+        """
+        with self.get_connection() as conn:
+            if metrics:
+                assignments = ", ".join(f"{name} = ?" for name, _ in MESSAGE_METRIC_COLUMNS)
+                conn.execute(
+                    f"UPDATE messages SET content = ?, is_partial = ?, {assignments} WHERE id = ?",
+                    (content, 0 if finished else 1) + self._metric_values(metrics) + (message_id,)
+                )
+            else:
+                conn.execute(
+                    "UPDATE messages SET content = ?, is_partial = ? WHERE id = ?",
+                    (content, 0 if finished else 1, message_id)
+                )
+            conn.commit()
+
+    def get_partial_message(self, conversation_id: int) -> Optional[Tuple]:
+        """
+        Respuesta parcial con la que termina una conversación - U-TUTOR v5.0
+
+        Returns:
+            (id, content) si el último mensaje es un checkpoint, si no None
+        """
+        self.flush_pending_writes(conversation_id)
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT role, content, timestamp 
-                FROM messages 
-                WHERE conversation_id = ? 
-                ORDER BY timestamp ASC
+                SELECT id, content, is_partial FROM messages
+                WHERE conversation_id = ?
+                ORDER BY id DESC
+                LIMIT 1
             ''', (conversation_id,))
-            return cursor.fetchall()
+            row = cursor.fetchone()
+            return row[:2] if row and row[2] else None
+
+    def delete_message(self, message_id: int) -> bool:
+        """Elimina un mensaje (p. ej. una respuesta parcial descartada) - U-TUTOR v5.0"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def get_write_metrics(self) -> Optional[dict]:
+        """Métricas de la cola de escritura (None si write-behind está desactivado) - U-TUTOR v5.0"""
+        return self.writer.get_metrics() if self.writer else None
+
+    def retry_failed_writes(self) -> int:
+        """Vuelve a encolar los mensajes que no se pudieron guardar - U-TUTOR v5.0"""
+        return self.writer.retry_failed() if self.writer else 0
+    
+    def load_conversation_messages(self, conversation_id: int, before_id: Optional[int] = None,
+                                   limit: Optional[int] = None) -> List[Tuple]:
+        """
+        Carga el historial de mensajes de una conversación - U-TUTOR v5.0
+
+        Args:
+            conversation_id: ID de la conversación
+            before_id: Si se indica, solo mensajes con id menor (páginas anteriores)
+            limit: Si se indica, solo los `limit` mensajes más recientes de la ventana
+
+        Returns:
+            Lista de (role, content, timestamp) en orden cronológico
+        """
+        self.flush_pending_writes(conversation_id)
+        if before_id is None and limit is None:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT role, content, timestamp 
+                    FROM messages 
+                    WHERE conversation_id = ? 
+                    ORDER BY id ASC
+                ''', (conversation_id,))
+                return cursor.fetchall()
+
+        rows, _ = self.load_message_window(conversation_id, before_id, limit)
+        return [row[1:] for row in rows]
+
+    def load_message_window(self, conversation_id: int, before_id: Optional[int] = None,
+                            limit: Optional[int] = 50) -> Tuple[List[Tuple], bool]:
+        """
+        Carga una ventana de mensajes recientes usando el id como cursor - U-TUTOR v5.0
+
+        Recorre el índice (conversation_id, id) hacia atrás y se detiene tras
+        `limit` filas, así abrir un hilo largo no lee todo su historial.
+
+        Args:
+            conversation_id: ID de la conversación
+            before_id: Solo mensajes con id menor a este (None = desde el final)
+            limit: Máximo de mensajes (None = sin límite)
+
+        Returns:
+            (filas, hay_más_antiguos); filas son (id, role, content, timestamp)
+            en orden cronológico
+        """
+        self.flush_pending_writes(conversation_id)
+        query = "SELECT id, role, content, timestamp FROM messages WHERE conversation_id = ?"
+        params = [conversation_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            # Una fila extra para saber si quedan mensajes más antiguos
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+        rows.reverse()
+        return rows, has_more
     
     def delete_conversation(self, conversation_id: int) -> bool:
         """Elimina una conversación y todos sus mensajes - U-TUTOR v3.0"""
+        self.flush_pending_writes(conversation_id)
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
@@ -144,16 +538,18 @@ class DatabaseManager:
             print(f"❌ Error al eliminar conversación {conversation_id}: {e}")
             return False
     
+    def _get_global_stats(self, cursor) -> dict:
+        """Lee los contadores globales materializados (O(1))"""
+        cursor.execute("SELECT key, value FROM global_stats")
+        return dict(cursor.fetchall())
+
     def get_conversation_stats(self) -> dict:
-        """Obtiene estadísticas de las conversaciones - U-TUTOR v3.0"""
+        """Obtiene estadísticas de las conversaciones desde contadores materializados - U-TUTOR v5.0"""
+        self.flush_pending_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("SELECT COUNT(*) FROM conversations")
-            total_conversations = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            total_messages = cursor.fetchone()[0]
+            global_stats = self._get_global_stats(cursor)
             
             cursor.execute("""
                 SELECT title, updated_at 
@@ -164,66 +560,275 @@ class DatabaseManager:
             latest_conversation = cursor.fetchone()
             
             return {
-                'total_conversations': total_conversations,
-                'total_messages': total_messages,
+                'total_conversations': global_stats.get('total_conversations', 0),
+                'total_messages': global_stats.get('total_messages', 0),
+                'total_chars': global_stats.get('total_chars', 0),
                 'latest_conversation': latest_conversation
             }
+
+    def get_conversation_message_count(self, conversation_id: int) -> int:
+        """Cantidad de mensajes de una conversación (materializada) - U-TUTOR v5.0"""
+        self.flush_pending_writes(conversation_id)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT message_count FROM conversation_stats WHERE conversation_id = ?",
+                (conversation_id,)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else 0
+
+    def load_messages_after(self, conversation_id: int, after_id: int = 0,
+                            limit: int = 50) -> List[Tuple]:
+        """
+        Mensajes posteriores a un id, en orden cronológico - U-TUTOR v5.0
+
+        Returns:
+            Lista de (id, role, content)
+        """
+        self.flush_pending_writes(conversation_id)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, role, content
+                FROM messages
+                WHERE conversation_id = ? AND id > ?
+                ORDER BY id ASC
+                LIMIT ?
+            ''', (conversation_id, after_id, limit))
+            return cursor.fetchall()
+
+    def get_conversation_summary(self, conversation_id: int) -> Optional[Tuple]:
+        """
+        Resumen guardado de una conversación - U-TUTOR v5.0
+
+        Returns:
+            (summary, summarized_count, last_message_id) o None si no hay resumen
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT summary, summarized_count, last_message_id FROM conversation_summaries "
+                "WHERE conversation_id = ?",
+                (conversation_id,)
+            )
+            return cursor.fetchone()
+
+    def save_conversation_summary(self, conversation_id: int, summary: str,
+                                  summarized_count: int, last_message_id: int):
+        """Guarda (o reemplaza) el resumen de una conversación - U-TUTOR v5.0"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO conversation_summaries
+                    (conversation_id, summary, summarized_count, last_message_id, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                    summary = excluded.summary,
+                    summarized_count = excluded.summarized_count,
+                    last_message_id = excluded.last_message_id,
+                    updated_at = excluded.updated_at
+            ''', (conversation_id, summary, summarized_count, last_message_id))
+            conn.commit()
+
+    def get_cached_response(self, cache_key: str, min_created_at: float) -> Optional[str]:
+        """
+        Busca una respuesta en caché y actualiza su último acceso - U-TUTOR v5.0
+
+        Args:
+            cache_key: Hash de la petición
+            min_created_at: Entradas creadas antes de este instante están vencidas
+
+        Returns:
+            La respuesta guardada o None si no existe o venció
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT response, created_at FROM response_cache WHERE cache_key = ?",
+                (cache_key,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+
+            if row[1] < min_created_at:
+                cursor.execute("DELETE FROM response_cache WHERE cache_key = ?", (cache_key,))
+                conn.commit()
+                return None
+
+            cursor.execute(
+                "UPDATE response_cache SET last_access = ?, hits = hits + 1 WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+            conn.commit()
+            return row[0]
+
+    def get_cached_response_created_at(self, cache_key: str) -> Optional[float]:
+        """Instante en que se guardó una respuesta (sin contar el acceso) - U-TUTOR v5.0"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT created_at FROM response_cache WHERE cache_key = ?", (cache_key,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def save_cached_response(self, cache_key: str, model: str, response: str,
+                             max_entries: int, min_created_at: float,
+                             question: Optional[str] = None, semantic_partition: Optional[str] = None):
+        """
+        Guarda una respuesta en caché, purgando vencidas y expulsando las menos usadas - U-TUTOR v5.0
+
+        Args:
+            question / semantic_partition: Pregunta original y partición, si la
+                                           respuesta también se indexa semánticamente
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO response_cache
+                    (cache_key, model, response, created_at, last_access, hits, question, semantic_partition)
+                VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+            ''', (cache_key, model, response, now, now, question, semantic_partition))
+            cursor.execute("DELETE FROM response_cache WHERE created_at < ?", (min_created_at,))
+            cursor.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache
+                    ORDER BY last_access ASC
+                    LIMIT MAX((SELECT COUNT(*) FROM response_cache) - ?, 0)
+                )
+            ''', (max_entries,))
+            conn.commit()
+
+    def iter_cached_questions(self, min_created_at: float, batch_size: int = 1000) -> Iterator[Tuple]:
+        """
+        Preguntas vigentes de la caché semántica, de la más antigua a la más usada - U-TUTOR v5.0
+
+        Yields:
+            (cache_key, semantic_partition, question)
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT cache_key, semantic_partition, question
+                FROM response_cache
+                WHERE question IS NOT NULL AND created_at >= ?
+                ORDER BY last_access ASC
+            ''', (min_created_at,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def get_response_cache_size(self) -> int:
+        """Cantidad de respuestas en caché - U-TUTOR v5.0"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM response_cache")
+            return cursor.fetchone()[0]
+
+    def clear_response_cache(self):
+        """Vacía la caché de respuestas - U-TUTOR v5.0"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM response_cache")
+            conn.commit()
+
+    def rebuild_materialized_stats(self):
+        """Recalcula las estadísticas materializadas desde las tablas base - U-TUTOR v5.0"""
+        self.flush_pending_writes()
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            backfill_stats(conn)
+            conn.commit()
     
     def export_conversation_to_markdown(self, conversation_id: int) -> str:
-        """Exporta conversación a formato Markdown - U-TUTOR v3.0"""
+        """Exporta conversación a formato Markdown - U-TUTOR v5.0"""
+        # Import local: export_manager depende de este módulo
+        from export_manager import iter_markdown
         conversation = self.get_conversation_by_id(conversation_id)
-        messages = self.load_conversation_messages(conversation_id)
-        
-        md_content = f"# {conversation[1]}\n\n"
-        md_content += f"*Creado: {conversation[2]}*\n\n---\n\n"
-        
-        for role, content, timestamp in messages:
-            emoji = "👤" if role == "user" else "🤖"
-            md_content += f"### {emoji} {role.title()}\n{content}\n\n"
-        
-        return md_content
+        return "".join(iter_markdown(conversation, self.iter_conversation_messages(conversation_id)))
+
+    def iter_conversation_messages(self, conversation_id: int, batch_size: int = 200) -> Iterator[Tuple]:
+        """
+        Recorre los mensajes de una conversación directamente desde el cursor - U-TUTOR v5.0
+
+        A diferencia de load_conversation_messages no materializa la lista completa:
+        trae `batch_size` filas por vez.
+
+        Yields:
+            (role, content, timestamp) en orden cronológico
+        """
+        self.flush_pending_writes(conversation_id)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT role, content, timestamp 
+                FROM messages 
+                WHERE conversation_id = ? 
+                ORDER BY id ASC
+            ''', (conversation_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def get_export_fingerprints(self, conversation_ids: Optional[List[int]] = None) -> List[Tuple]:
+        """
+        Datos para identificar la versión exportable de cada conversación - U-TUTOR v5.0
+
+        Returns:
+            Lista de (id, title, created_at, updated_at, message_count, char_count)
+        """
+        self.flush_pending_writes()
+        query = '''
+            SELECT c.id, c.title, c.created_at, c.updated_at,
+                   COALESCE(s.message_count, 0), COALESCE(s.char_count, 0)
+            FROM conversations c
+            LEFT JOIN conversation_stats s ON s.conversation_id = c.id
+        '''
+        params = ()
+        if conversation_ids is not None:
+            query += f" WHERE c.id IN ({','.join('?' * len(conversation_ids))})"
+            params = tuple(conversation_ids)
+        query += " ORDER BY c.id ASC"
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
 
     def get_detailed_stats(self) -> dict:
-        """Estadísticas avanzadas - U-TUTOR v3.0"""
+        """Estadísticas avanzadas con lecturas O(1) sobre tablas materializadas - U-TUTOR v5.0"""
+        self.flush_pending_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT AVG(msg_count) FROM (
-                    SELECT COUNT(*) as msg_count 
-                    FROM messages 
-                    GROUP BY conversation_id
-                )
-            """)
-            avg_messages = cursor.fetchone()[0] or 0
+            global_stats = self._get_global_stats(cursor)
+            active_conversations = global_stats.get('active_conversations', 0)
+            avg_messages = (
+                global_stats.get('total_messages', 0) / active_conversations
+                if active_conversations else 0
+            )
             
+            # Recorre idx_conversation_stats_count desde el final
             cursor.execute("""
-                SELECT c.title, COUNT(m.id) as msg_count
-                FROM conversations c
-                JOIN messages m ON c.id = m.conversation_id
-                GROUP BY c.id
-                ORDER BY msg_count DESC
+                SELECT c.title, s.message_count
+                FROM conversation_stats s
+                JOIN conversations c ON c.id = s.conversation_id
+                ORDER BY s.message_count DESC
                 LIMIT 1
             """)
             longest_conv = cursor.fetchone()
             
-            # Obtener conversación más antigua
-            cursor.execute("""
-                SELECT created_at FROM conversations 
-                ORDER BY created_at ASC 
-                LIMIT 1
-            """)
-            oldest_result = cursor.fetchone()
-            oldest_conversation = oldest_result[0] if oldest_result else None
+            # Conversación más antigua y más reciente: consultas separadas para que
+            # SQLite resuelva cada MIN/MAX con un solo salto en idx_conversations_created
+            cursor.execute("SELECT MIN(created_at) FROM conversations")
+            oldest_conversation = cursor.fetchone()[0]
             
-            # Obtener conversación más reciente
-            cursor.execute("""
-                SELECT created_at FROM conversations 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """)
-            newest_result = cursor.fetchone()
-            newest_conversation = newest_result[0] if newest_result else None
+            cursor.execute("SELECT MAX(created_at) FROM conversations")
+            newest_conversation = cursor.fetchone()[0]
             
             return {
                 'avg_messages_per_conv': round(avg_messages, 1),
@@ -232,17 +837,158 @@ class DatabaseManager:
                 'newest_conversation': newest_conversation
             }
 
-    def search_conversations(self, query: str) -> List[Tuple]:
-        """Busca conversaciones por título - U-TUTOR v3.0"""
+    @staticmethod
+    def _latency_percentiles(cursor, column: str, since: str) -> dict:
+        """
+        p50/p95/p99 por día de ``column`` (ttft_ms o total_ms), por rango más cercano.
+
+        Las funciones de ventana numeran las respuestas de cada día ordenadas por
+        latencia; el percentil p es el primer valor cuyo rango alcanza p * n.
+        Solo cuenta respuestas del modelo (los aciertos de caché no tienen modelo).
+        """
+        cursor.execute(f"""
+            WITH ranked AS (
+                SELECT DATE(timestamp) AS day, {column} AS value,
+                       ROW_NUMBER() OVER (PARTITION BY DATE(timestamp) ORDER BY {column}) AS rank,
+                       COUNT(*) OVER (PARTITION BY DATE(timestamp)) AS total
+                FROM messages
+                WHERE total_ms IS NOT NULL AND timestamp >= ?
+                  AND model IS NOT NULL AND {column} IS NOT NULL
+            )
+            SELECT day,
+                   MIN(CASE WHEN rank >= 0.50 * total THEN value END),
+                   MIN(CASE WHEN rank >= 0.95 * total THEN value END),
+                   MIN(CASE WHEN rank >= 0.99 * total THEN value END)
+            FROM ranked
+            GROUP BY day
+        """, (since,))
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def get_response_metrics(self, days: int = 14) -> dict:
+        """
+        Agregados diarios de las respuestas del asistente - U-TUTOR v5.0
+
+        Args:
+            days: Días hacia atrás (incluido hoy, en UTC como los timestamps)
+
+        Returns:
+            {'daily': [(día, respuestas, de_caché, prompt_tokens, completion_tokens,
+                        ttft_p50, ttft_p95, ttft_p99, total_p50, total_p95, total_p99)],
+             'models': [(modelo, respuestas, prompt_tokens, completion_tokens, total_ms_prom)]}
+            con los días más recientes primero
+        """
+        self.flush_pending_writes()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DATE('now', ?)", (f"-{max(days - 1, 0)} days",))
+            since = cursor.fetchone()[0]
+
+            # Recorre idx_messages_metrics (solo respuestas medidas)
+            cursor.execute("""
+                SELECT DATE(timestamp) AS day, COUNT(*), SUM(model IS NULL),
+                       COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0)
+                FROM messages
+                WHERE total_ms IS NOT NULL AND timestamp >= ?
+                GROUP BY day
+                ORDER BY day DESC
+            """, (since,))
+            totals = cursor.fetchall()
+
+            ttft = self._latency_percentiles(cursor, "ttft_ms", since)
+            total = self._latency_percentiles(cursor, "total_ms", since)
+            empty = (None, None, None)
+            daily = [
+                row + ttft.get(row[0], empty) + total.get(row[0], empty)
+                for row in totals
+            ]
+
+            cursor.execute("""
+                SELECT model, COUNT(*), COALESCE(SUM(prompt_tokens), 0),
+                       COALESCE(SUM(completion_tokens), 0), AVG(total_ms)
+                FROM messages
+                WHERE total_ms IS NOT NULL AND timestamp >= ? AND model IS NOT NULL
+                GROUP BY model
+                ORDER BY COUNT(*) DESC
+            """, (since,))
+            return {'daily': daily, 'models': cursor.fetchall()}
+
+    @staticmethod
+    def _build_fts_query(query: str) -> Optional[str]:
+        """Convierte texto libre en una consulta FTS5 segura con búsqueda por prefijo"""
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return None
+        # Cada término entre comillas (evita la sintaxis FTS5) y con * para prefijos
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search_conversations_ranked(self, query: str, limit: int = 50) -> List[Tuple]:
+        """
+        Busca conversaciones por contenido de mensajes y título - U-TUTOR v5.0
+
+        Usa FTS5 con ranking BM25; las coincidencias en el título pesan el doble.
+        Sin FTS5 recurre a LIKE sobre títulos.
+
+        Returns:
+            Lista de (id, title, created_at, updated_at, snippet). El snippet es un
+            fragmento del mensaje con los términos resaltados en **negrita**, o
+            None si la coincidencia fue solo en el título.
+        """
+        self.flush_pending_writes()
+        if not self.fts_enabled:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, title, created_at, updated_at, NULL
+                    FROM conversations 
+                    WHERE LOWER(title) LIKE LOWER(?)
+                    ORDER BY updated_at DESC
+                    LIMIT ?
+                ''', (f'%{query}%', limit))
+                return cursor.fetchall()
+
+        fts_query = self._build_fts_query(query)
+        if not fts_query:
+            return []
+
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, title, created_at, updated_at 
-                FROM conversations 
-                WHERE LOWER(title) LIKE LOWER(?)
-                ORDER BY updated_at DESC
-            ''', (f'%{query}%',))
+                WITH message_hits AS (
+                    SELECT m.conversation_id AS conversation_id,
+                           messages_fts.rank AS score,
+                           snippet(messages_fts, 0, '**', '**', '…', 12) AS snippet
+                    FROM messages_fts
+                    JOIN messages m ON m.id = messages_fts.rowid
+                    WHERE messages_fts MATCH ?
+                    ORDER BY messages_fts.rank
+                    LIMIT ?
+                ),
+                title_hits AS (
+                    SELECT rowid AS conversation_id,
+                           conversations_fts.rank * 2 AS score,
+                           NULL AS snippet
+                    FROM conversations_fts
+                    WHERE conversations_fts MATCH ?
+                    ORDER BY conversations_fts.rank
+                    LIMIT ?
+                ),
+                best AS (
+                    -- SQLite toma "snippet" de la fila con el MIN(score) del grupo
+                    SELECT conversation_id, MIN(score) AS score, snippet
+                    FROM (SELECT * FROM message_hits UNION ALL SELECT * FROM title_hits)
+                    GROUP BY conversation_id
+                )
+                SELECT c.id, c.title, c.created_at, c.updated_at, best.snippet
+                FROM best
+                JOIN conversations c ON c.id = best.conversation_id
+                ORDER BY best.score
+                LIMIT ?
+            ''', (fts_query, SEARCH_CANDIDATE_LIMIT, fts_query, SEARCH_CANDIDATE_LIMIT, limit))
             return cursor.fetchall()
+
+    def search_conversations(self, query: str) -> List[Tuple]:
+        """Busca conversaciones por contenido y título - U-TUTOR v5.0"""
+        return [row[:4] for row in self.search_conversations_ranked(query)]
     
     def generate_auto_title(self, conversation_id: int, chat_manager) -> str:
         """Genera un título automático para una conversación usando IA - U-TUTOR v3.0"""
@@ -0,0 +1,356 @@
+# U-TUTOR v5.0 - Motor de migraciones versionadas para chat_history.db
+"""
+Migraciones ordenadas e idempotentes del esquema SQLite.
+
+Cada migración es una tupla ``(versión, descripción, pasos)``. Los pasos son
+sentencias SQL o funciones ``paso(conn)`` para lógica condicional. Todas las
+sentencias deben poder re-ejecutarse sin error (``IF NOT EXISTS``), de modo
+que una base de datos creada a mano o parcialmente migrada converja al mismo
+esquema. Cada versión aplicada se registra en la tabla ``schema_version``.
+
+Un paso que depende de algo que este entorno no tiene (p. ej. FTS5) lanza
+``MigrationDeferred``: la migración no se registra, las siguientes se aplican
+igual y se vuelve a intentar en el próximo arranque.
+
+Para agregar una migración: añade una tupla al final de ``MIGRATIONS`` con la
+siguiente versión. Nunca modifiques una migración ya publicada.
+"""
+import sqlite3
+import time
+from typing import Callable, List, Tuple, Union
+
+MigrationStep = Union[str, Callable[[sqlite3.Connection], None]]
+Migration = Tuple[int, str, List[MigrationStep]]
+
+class MigrationDeferred(Exception):
+    """La migración no puede aplicarse todavía; se reintenta en el próximo arranque"""
+
+
+# Tokenizador FTS5: minúsculas + sin tildes ("fotosíntesis" == "fotosintesis")
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """Verifica si el SQLite enlazado fue compilado con FTS5"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _create_fts_tables(conn: sqlite3.Connection):
+    """Crea los índices FTS5 de mensajes y títulos, sincronizados por triggers"""
+    if not fts5_available(conn):
+        raise MigrationDeferred("SQLite sin FTS5: la búsqueda usará LIKE sobre títulos")
+
+    for table, source, column in (
+        ("messages_fts", "messages", "content"),
+        ("conversations_fts", "conversations", "title"),
+    ):
+        # Tabla de contenido externo: el texto vive solo en la tabla original
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                {column},
+                content='{source}',
+                content_rowid='id',
+                tokenize='{FTS_TOKENIZER}',
+                prefix='2 3'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} BEGIN
+                INSERT INTO {table} (rowid, {column}) VALUES (new.id, new.{column});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source} BEGIN
+                INSERT INTO {table} ({table}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {column} ON {source} BEGIN
+                INSERT INTO {table} ({table}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                INSERT INTO {table} (rowid, {column}) VALUES (new.id, new.{column});
+            END
+        """)
+        # Indexar las filas que ya existían
+        conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+
+def backfill_stats(conn: sqlite3.Connection):
+    """Recalcula desde cero conversation_stats y global_stats (backfill o reparación)"""
+    conn.execute("DELETE FROM conversation_stats")
+    conn.execute("""
+        INSERT INTO conversation_stats
+            (conversation_id, message_count, char_count, first_message_at, last_message_at)
+        SELECT conversation_id, COUNT(*), SUM(LENGTH(content)), MIN(timestamp), MAX(timestamp)
+        FROM messages
+        WHERE conversation_id IS NOT NULL
+        GROUP BY conversation_id
+    """)
+    totals = {
+        "total_conversations": "SELECT COUNT(*) FROM conversations",
+        "total_messages": "SELECT COUNT(*) FROM messages WHERE conversation_id IS NOT NULL",
+        "total_chars": "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages WHERE conversation_id IS NOT NULL",
+        "active_conversations": "SELECT COUNT(*) FROM conversation_stats",
+    }
+    for key, query in totals.items():
+        conn.execute(
+            "INSERT OR REPLACE INTO global_stats (key, value) VALUES (?, (" + query + "))",
+            (key,)
+        )
+
+
+def _add_response_cache_questions(conn: sqlite3.Connection):
+    """Agrega a response_cache la pregunta y partición usadas por la caché semántica"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(response_cache)")}
+    if "question" not in columns:
+        conn.execute("ALTER TABLE response_cache ADD COLUMN question TEXT")
+    if "semantic_partition" not in columns:
+        conn.execute("ALTER TABLE response_cache ADD COLUMN semantic_partition TEXT")
+
+
+def _add_messages_is_partial(conn: sqlite3.Connection):
+    """Marca de respuesta parcial (checkpoint de una generación interrumpida)"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "is_partial" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN is_partial INTEGER NOT NULL DEFAULT 0")
+
+
+# Columnas de métricas de las respuestas del asistente (NULL en el resto)
+MESSAGE_METRIC_COLUMNS = (
+    ("model", "TEXT"),
+    ("prompt_tokens", "INTEGER"),
+    ("completion_tokens", "INTEGER"),
+    ("ttft_ms", "REAL"),
+    ("total_ms", "REAL"),
+)
+
+
+def _add_messages_metrics(conn: sqlite3.Connection):
+    """Modelo, tokens y latencias de cada respuesta del asistente"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    for name, sql_type in MESSAGE_METRIC_COLUMNS:
+        if name not in columns:
+            conn.execute(f"ALTER TABLE messages ADD COLUMN {name} {sql_type}")
+
+
+def _create_stats_tables(conn: sqlite3.Connection):
+    """Crea las estadísticas materializadas y los triggers que las mantienen"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_stats (
+            conversation_id INTEGER PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            char_count INTEGER NOT NULL DEFAULT 0,
+            first_message_at TIMESTAMP,
+            last_message_at TIMESTAMP
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversation_stats_count ON conversation_stats (message_count)"
+    )
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS global_stats (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Conversación más antigua / más reciente sin recorrer la tabla
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations (created_at)")
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_messages_ai AFTER INSERT ON messages
+        WHEN new.conversation_id IS NOT NULL BEGIN
+            UPDATE global_stats SET value = value + 1
+            WHERE key = 'active_conversations'
+              AND NOT EXISTS (SELECT 1 FROM conversation_stats WHERE conversation_id = new.conversation_id);
+            INSERT INTO conversation_stats
+                (conversation_id, message_count, char_count, first_message_at, last_message_at)
+            VALUES (new.conversation_id, 1, LENGTH(new.content), new.timestamp, new.timestamp)
+            ON CONFLICT (conversation_id) DO UPDATE SET
+                message_count = message_count + 1,
+                char_count = char_count + excluded.char_count,
+                last_message_at = excluded.last_message_at;
+            UPDATE global_stats SET value = value + 1 WHERE key = 'total_messages';
+            UPDATE global_stats SET value = value + LENGTH(new.content) WHERE key = 'total_chars';
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_messages_ad AFTER DELETE ON messages
+        WHEN old.conversation_id IS NOT NULL BEGIN
+            UPDATE global_stats SET value = value - 1
+            WHERE key = 'active_conversations'
+              AND (SELECT message_count FROM conversation_stats
+                   WHERE conversation_id = old.conversation_id) = 1;
+            UPDATE conversation_stats SET
+                message_count = message_count - 1,
+                char_count = char_count - LENGTH(old.content),
+                first_message_at = (SELECT timestamp FROM messages
+                                    WHERE conversation_id = old.conversation_id ORDER BY id ASC LIMIT 1),
+                last_message_at = (SELECT timestamp FROM messages
+                                   WHERE conversation_id = old.conversation_id ORDER BY id DESC LIMIT 1)
+            WHERE conversation_id = old.conversation_id;
+            DELETE FROM conversation_stats
+            WHERE conversation_id = old.conversation_id AND message_count <= 0;
+            UPDATE global_stats SET value = value - 1 WHERE key = 'total_messages';
+            UPDATE global_stats SET value = value - LENGTH(old.content) WHERE key = 'total_chars';
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_messages_au AFTER UPDATE OF content ON messages
+        WHEN new.conversation_id IS NOT NULL BEGIN
+            UPDATE conversation_stats SET char_count = char_count + LENGTH(new.content) - LENGTH(old.content)
+            WHERE conversation_id = new.conversation_id;
+            UPDATE global_stats SET value = value + LENGTH(new.content) - LENGTH(old.content)
+            WHERE key = 'total_chars';
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_conversations_ai AFTER INSERT ON conversations BEGIN
+            UPDATE global_stats SET value = value + 1 WHERE key = 'total_conversations';
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stats_conversations_ad AFTER DELETE ON conversations BEGIN
+            UPDATE global_stats SET value = value - 1 WHERE key = 'total_conversations';
+        END
+    """)
+
+    # Backfill único para bases de datos existentes
+    backfill_stats(conn)
+
+
+MIGRATIONS: List[Migration] = [
+    (1, "Índices compuestos para mensajes y conversaciones", [
+        # load_conversation_messages / GROUP BY conversation_id
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)",
+        # get_conversations / ORDER BY updated_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at)",
+    ]),
+    (2, "Búsqueda de texto completo (FTS5) en mensajes y títulos", [
+        _create_fts_tables,
+    ]),
+    (3, "Estadísticas materializadas mantenidas por triggers", [
+        _create_stats_tables,
+    ]),
+    (4, "Resumen incremental (memoria) de las conversaciones largas", [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            summarized_count INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # El resumen se borra junto con su conversación
+        """
+        CREATE TRIGGER IF NOT EXISTS conversation_summaries_ad AFTER DELETE ON conversations BEGIN
+            DELETE FROM conversation_summaries WHERE conversation_id = old.id;
+        END
+        """,
+    ]),
+    (5, "Caché de respuestas del modelo (TTL + LRU)", [
+        """
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # Expulsión LRU: las entradas menos usadas primero
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache (last_access)",
+    ]),
+    (6, "Preguntas indexables por la caché semántica", [
+        _add_response_cache_questions,
+    ]),
+    (7, "Checkpoints de respuestas parciales", [
+        _add_messages_is_partial,
+    ]),
+    (8, "Métricas de tokens y latencia por respuesta", [
+        _add_messages_metrics,
+        # Agregados por día: índice parcial que solo contiene las respuestas medidas
+        "CREATE INDEX IF NOT EXISTS idx_messages_metrics ON messages (timestamp) WHERE total_ms IS NOT NULL",
+    ]),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Retorna la versión de esquema aplicada (0 si no hay migraciones)"""
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Aplica en orden las migraciones pendientes.
+
+    Cada migración corre en su propia transacción (BEGIN IMMEDIATE), así que
+    si dos procesos arrancan a la vez solo uno la aplica y el otro la omite.
+    Las migraciones aplazadas (``MigrationDeferred``) quedan pendientes.
+
+    Args:
+        conn: Conexión SQLite abierta
+
+    Returns:
+        Versión de esquema resultante
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms REAL
+        )
+    ''')
+    conn.commit()
+
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+    for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+
+        start_time = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            # Otro proceso pudo aplicarla mientras esperábamos el lock
+            already_applied = conn.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (version,)
+            ).fetchone()
+            if already_applied:
+                conn.rollback()
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            conn.execute(
+                "INSERT INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)",
+                (version, description, duration_ms)
+            )
+            conn.commit()
+        except MigrationDeferred as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"⚠️ Migración {version} aplazada ({description}): {e}")
+            continue
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"❌ Error en migración {version} ({description}): {e}")
+            raise
+
+        print(f"🛠️ Migración {version} aplicada: {description} ({duration_ms:.1f} ms)")
+
+    return get_schema_version(conn)
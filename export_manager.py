@@ -0,0 +1,175 @@
+# U-TUTOR v5.0 - Motor de exportación en streaming (Markdown, JSONL y ZIP)
+"""
+Exportación de conversaciones sin cargar el historial completo en memoria.
+
+Los formatos se generan con generadores que leen filas del cursor de SQLite
+(``DatabaseManager.iter_conversation_messages``) y se escriben por partes a un
+archivo en disco. Los archivos quedan en un caché indexado por la "huella" de
+cada conversación (updated_at + contadores materializados), así que volver a
+descargar una conversación sin cambios no vuelve a consultar la base de datos.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zipfile
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Formatos soportados: nombre -> (extensión, tipo MIME)
+EXPORT_FORMATS = {
+    "markdown": (".md", "text/markdown"),
+    "jsonl": (".jsonl", "application/x-ndjson"),
+}
+
+
+def iter_markdown(conversation: Tuple, messages: Iterable[Tuple]) -> Iterator[str]:
+    """
+    Genera una conversación en Markdown por partes.
+
+    Args:
+        conversation: (id, title, created_at, ...) de la conversación
+        messages: Iterable de (role, content, timestamp)
+    """
+    yield f"# {conversation[1]}\n\n"
+    yield f"*Creado: {conversation[2]}*\n\n---\n\n"
+    for role, content, timestamp in messages:
+        emoji = "👤" if role == "user" else "🤖"
+        yield f"### {emoji} {role.title()}\n{content}\n\n"
+
+
+def iter_jsonl(conversation: Tuple, messages: Iterable[Tuple]) -> Iterator[str]:
+    """Genera una conversación en JSON Lines (una línea por mensaje)"""
+    conversation_id, title = conversation[0], conversation[1]
+    for role, content, timestamp in messages:
+        yield json.dumps({
+            "conversation_id": conversation_id,
+            "conversation_title": title,
+            "role": role,
+            "content": content,
+            "timestamp": timestamp,
+        }, ensure_ascii=False) + "\n"
+
+
+FORMAT_WRITERS = {
+    "markdown": iter_markdown,
+    "jsonl": iter_jsonl,
+}
+
+
+def safe_filename(title: str, max_length: int = 60) -> str:
+    """Convierte un título en un nombre de archivo seguro"""
+    name = re.sub(r"[^\w\s\-]", "", title, flags=re.UNICODE).strip()
+    name = re.sub(r"\s+", "_", name)
+    return name[:max_length] or "conversacion"
+
+
+class ExportManager:
+    """Exporta conversaciones a archivos cacheados en disco"""
+
+    def __init__(self, db_manager, cache_dir: Optional[str] = None, max_cache_files: int = 200):
+        """
+        Args:
+            db_manager: DatabaseManager del que se leen las conversaciones
+            cache_dir: Carpeta del caché (por defecto en el directorio temporal)
+            max_cache_files: Archivos máximos en caché antes de borrar los más viejos
+        """
+        self.db_manager = db_manager
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "ututor_exports")
+        self.max_cache_files = max_cache_files
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _fingerprint(rows: List[Tuple], fmt: str) -> str:
+        """Hash de (id, updated_at, message_count, char_count) de cada conversación"""
+        digest = hashlib.sha1(fmt.encode("utf-8"))
+        for conversation_id, _, _, updated_at, message_count, char_count in rows:
+            digest.update(f"{conversation_id}|{updated_at}|{message_count}|{char_count};".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _write_atomic(self, path: str, write_fn):
+        """Escribe a un archivo temporal único (seguro entre hilos) y lo renombra al terminar"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._prune_cache()
+
+    def _prune_cache(self):
+        """Elimina los archivos más antiguos si el caché supera el límite"""
+        try:
+            files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+            if len(files) <= self.max_cache_files:
+                return
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self.max_cache_files]:
+                os.remove(path)
+        except OSError:
+            pass  # Silenciar errores de limpieza
+
+    def _iter_conversation(self, conversation: Tuple, fmt: str) -> Iterator[str]:
+        """Genera el contenido de una conversación en el formato pedido"""
+        messages = self.db_manager.iter_conversation_messages(conversation[0])
+        return FORMAT_WRITERS[fmt](conversation, messages)
+
+    def export_conversation(self, conversation_id: int, fmt: str = "markdown") -> Optional[Tuple[str, str, str]]:
+        """
+        Exporta una conversación (o reutiliza el archivo cacheado).
+
+        Returns:
+            (ruta_archivo, nombre_descarga, mime) o None si no existe la conversación
+        """
+        extension, mime = EXPORT_FORMATS[fmt]
+        rows = self.db_manager.get_export_fingerprints([conversation_id])
+        if not rows:
+            return None
+
+        conversation = rows[0]
+        path = os.path.join(
+            self.cache_dir, f"conv_{conversation_id}_{self._fingerprint(rows, fmt)}{extension}"
+        )
+        if not os.path.exists(path):
+            def write(tmp_path):
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for chunk in self._iter_conversation(conversation, fmt):
+                        f.write(chunk)
+            self._write_atomic(path, write)
+
+        return path, f"{safe_filename(conversation[1])}{extension}", mime
+
+    def export_zip(self, conversation_ids: Optional[List[int]] = None,
+                   fmt: str = "markdown") -> Optional[Tuple[str, str, str]]:
+        """
+        Exporta varias (o todas) las conversaciones a un único ZIP.
+
+        Cada conversación se escribe en su propia entrada del ZIP directamente
+        desde el cursor, así el uso de memoria no depende del tamaño del corpus.
+
+        Args:
+            conversation_ids: IDs a exportar (None = todas)
+            fmt: Formato de cada entrada
+
+        Returns:
+            (ruta_archivo, nombre_descarga, mime) o None si no hay conversaciones
+        """
+        extension, _ = EXPORT_FORMATS[fmt]
+        rows = self.db_manager.get_export_fingerprints(conversation_ids)
+        if not rows:
+            return None
+
+        path = os.path.join(self.cache_dir, f"bulk_{self._fingerprint(rows, fmt)}.zip")
+        if not os.path.exists(path):
+            def write(tmp_path):
+                with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                    for conversation in rows:
+                        arcname = f"{conversation[0]:06d}_{safe_filename(conversation[1])}{extension}"
+                        with zf.open(arcname, "w") as entry:
+                            for chunk in self._iter_conversation(conversation, fmt):
+                                entry.write(chunk.encode("utf-8"))
+            self._write_atomic(path, write)
+
+        return path, f"ututor_conversaciones_{fmt}.zip", "application/zip"
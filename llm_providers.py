@@ -0,0 +1,196 @@
+# U-TUTOR v5.0 - Proveedores de modelos: OpenAI y un modelo falso local para pruebas de carga
+"""
+Interfaz mínima de proveedor: ``create(modelo, temperatura)`` retorna un
+cliente con ``invoke``, ``ainvoke``, ``stream`` y ``astream`` (la interfaz de
+los chat models de LangChain que usa ``ChatManager``).
+
+- ``OpenAIProvider``: ``ChatOpenAI`` sobre un pool httpx con keep-alive
+  compartido (``langchain_openai`` se importa solo al usarlo).
+- ``FakeProvider``: modelo en proceso, sin red ni cuota. Genera tokens
+  deterministas a partir del prompt con TTFT y tokens/s configurables, e
+  inyecta errores 500 y 429 con la probabilidad indicada.
+
+Se elige con ``LLM_PROVIDER`` (``openai`` o ``fake``). Los parámetros del
+modelo falso se leen de ``FAKE_LLM_*`` (ver README).
+"""
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+
+# Límites del pool HTTP compartido hacia OpenAI
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+# Segundos máximos por petición al modelo
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))
+
+# Modelo falso
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "300"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+FAKE_LLM_RESPONSE_TOKENS = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "120"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_429_RATE = float(os.getenv("FAKE_LLM_429_RATE", "0"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "42"))
+
+_FAKE_WORDS = (
+    "el concepto se entiende mejor con un ejemplo sencillo primero definimos los datos "
+    "luego aplicamos la regla paso a paso y revisamos el resultado final para comprobar "
+    "que cada parte tiene sentido también conviene practicar con ejercicios similares"
+).split()
+# Protege el generador de errores compartido entre modelos e hilos
+_rng_lock = threading.Lock()
+
+
+class FakeLLMError(Exception):
+    """Error simulado con el mismo ``status_code`` que usaría la API"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+
+
+class FakeChatModel:
+    """Chat model local con latencia configurable y respuestas deterministas"""
+
+    def __init__(self, model: str, temperature: float, ttft_ms: float = FAKE_LLM_TTFT_MS,
+                 tokens_per_second: float = FAKE_LLM_TOKENS_PER_SEC,
+                 response_tokens: int = FAKE_LLM_RESPONSE_TOKENS,
+                 error_rate: float = FAKE_LLM_ERROR_RATE, rate_limit_rate: float = FAKE_LLM_429_RATE,
+                 rng: Optional[random.Random] = None):
+        """
+        Args:
+            ttft_ms: Milisegundos hasta el primer token
+            tokens_per_second: Velocidad de generación
+            response_tokens: Tokens por respuesta
+            error_rate: Probabilidad de un error 500
+            rate_limit_rate: Probabilidad de un error 429
+            rng: Generador para la inyección de errores (reproducible con una semilla)
+        """
+        self.model_name = model
+        self.temperature = temperature
+        self.ttft = ttft_ms / 1000
+        self.token_delay = 1 / tokens_per_second if tokens_per_second > 0 else 0
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = rng or random.Random(FAKE_LLM_SEED)
+
+    @staticmethod
+    def _prompt_text(messages) -> str:
+        """Texto del prompt (tuplas (rol, contenido) o dicts con "content")"""
+        parts = []
+        for message in messages:
+            if isinstance(message, dict):
+                parts.append(str(message.get("content", "")))
+            elif isinstance(message, (tuple, list)):
+                parts.append(str(message[-1]))
+            else:
+                parts.append(str(getattr(message, "content", message)))
+        return "\n".join(parts)
+
+    def _tokens(self, messages) -> List[str]:
+        """Misma respuesta para el mismo modelo y prompt"""
+        digest = hashlib.sha256(f"{self.model_name}|{self._prompt_text(messages)}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        return [rng.choice(_FAKE_WORDS) + " " for _ in range(self.response_tokens)]
+
+    def _maybe_fail(self):
+        with _rng_lock:
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            raise FakeLLMError(429, "rate_limit_exceeded (simulado)")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise FakeLLMError(500, "internal server error (simulado)")
+
+    def stream(self, messages) -> Iterator[AIMessageChunk]:
+        self._maybe_fail()
+        time.sleep(self.ttft)
+        for index, token in enumerate(self._tokens(messages)):
+            if index:
+                time.sleep(self.token_delay)
+            yield AIMessageChunk(content=token)
+
+    async def astream(self, messages):
+        self._maybe_fail()
+        await asyncio.sleep(self.ttft)
+        for index, token in enumerate(self._tokens(messages)):
+            if index:
+                await asyncio.sleep(self.token_delay)
+            yield AIMessageChunk(content=token)
+
+    def invoke(self, messages) -> AIMessage:
+        return AIMessage(content="".join(chunk.content for chunk in self.stream(messages)))
+
+    async def ainvoke(self, messages) -> AIMessage:
+        return AIMessage(content="".join([chunk.content async for chunk in self.astream(messages)]))
+
+
+class OpenAIProvider:
+    """ChatOpenAI sobre un pool HTTP con keep-alive compartido"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, max_connections: int = LLM_MAX_CONNECTIONS,
+                 keepalive_connections: int = LLM_KEEPALIVE_CONNECTIONS,
+                 timeout: float = LLM_HTTP_TIMEOUT):
+        """
+        Args:
+            api_key: Clave de OpenAI
+            max_connections: Conexiones simultáneas máximas del pool
+            keepalive_connections: Conexiones inactivas que se mantienen abiertas
+            timeout: Segundos máximos por petición
+        """
+        import httpx
+
+        self.api_key = api_key
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=keepalive_connections
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    def create(self, model: str, temperature: float):
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            api_key=self.api_key,  # type: ignore
+            model_name=model,  # type: ignore
+            temperature=temperature,  # type: ignore
+            http_client=self.http_client,
+            http_async_client=self.http_async_client
+        )
+
+
+class FakeProvider:
+    """Modelos falsos en proceso que comparten la semilla de inyección de errores"""
+
+    name = "fake"
+
+    def __init__(self, **options):
+        """
+        Args:
+            options: Parámetros de FakeChatModel (ttft_ms, tokens_per_second, ...)
+        """
+        self.options = options
+        self._rng = random.Random(FAKE_LLM_SEED)
+
+    def create(self, model: str, temperature: float) -> FakeChatModel:
+        return FakeChatModel(model, temperature, rng=self._rng, **self.options)
+
+
+def create_provider(api_key: Optional[str], name: str = LLM_PROVIDER):
+    """Proveedor configurado (``LLM_PROVIDER``)"""
+    if name == "fake":
+        print("🧪 [LOG] LLM_PROVIDER=fake: respuestas simuladas, sin llamadas a OpenAI")
+        return FakeProvider()
+    if name != "openai":
+        raise ValueError(f"LLM_PROVIDER desconocido: {name} (usa 'openai' o 'fake')")
+    return OpenAIProvider(api_key)
@@ -0,0 +1,51 @@
+# U-TUTOR v5.0 - Registro de clientes del modelo compartido por todas las sesiones
+"""
+Clientes del modelo reutilizables entre sesiones de Streamlit.
+
+Cada sesión tiene su propio ``ChatManager`` (personalidad, historial,
+generación en curso), pero los clientes del modelo viven aquí, uno por
+(modelo, temperatura). Con OpenAI todos comparten el mismo pool HTTP con
+keep-alive: las conexiones y sesiones TLS abiertas por un usuario las
+reutiliza el siguiente, y cambiar de modelo no crea clientes ni conexiones
+nuevas. El proveedor se elige con ``LLM_PROVIDER`` (ver llm_providers.py).
+
+El cliente asíncrono de httpx se usa solo desde el event loop compartido
+(ver async_runner.py), por lo que basta uno por proceso.
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+from llm_providers import create_provider
+
+
+class LLMClientRegistry:
+    """Clientes del modelo por (modelo, temperatura) creados por un proveedor"""
+
+    def __init__(self, api_key: Optional[str], provider=None):
+        """
+        Args:
+            api_key: Clave de OpenAI
+            provider: Proveedor de clientes; por defecto el de ``LLM_PROVIDER``
+        """
+        self.provider = provider or create_provider(api_key)
+        self._clients: Dict[Tuple[str, float], object] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model: str, temperature: float) -> Tuple[str, float]:
+        return model, round(float(temperature), 2)
+
+    def get(self, model: str, temperature: float):
+        """Retorna el cliente de (modelo, temperatura), creándolo la primera vez"""
+        key = self._key(model, temperature)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self.provider.create(model, key[1])
+                self._clients[key] = client
+                print(f"🔌 [LOG] Cliente LLM creado: {model} (temperatura {key[1]}, "
+                      f"{self.provider.name}); {len(self._clients)} en el registro")
+            return client
@@ -0,0 +1,311 @@
+# U-TUTOR v5.0 - Reintentos, peticiones de respaldo (hedging) y cadena de modelos
+"""
+Capa de resiliencia para las respuestas en streaming del modelo.
+
+- Reintento con backoff exponencial y jitter ante errores transitorios
+  (timeouts, conexión, 429 y 5xx), solo mientras no haya llegado ningún
+  fragmento: una respuesta ya empezada no se repite.
+- Hedging: si el primer token tarda más que el p95 observado del modelo, se
+  lanza una segunda petición (al siguiente modelo de la cadena, o al mismo si
+  no hay otro) y se queda la que responda primero; la otra se cancela.
+- Cadena de respaldo (``MODEL_FALLBACK_CHAIN``, p. ej. ``gpt-4,gpt-4o,gpt-4o-mini``):
+  si un modelo agota sus reintentos o falla de forma no transitoria, se pasa
+  al siguiente. ``on_served(modelo)`` informa qué modelo respondió.
+
+Cada reintento, petición de respaldo o modelo de la cadena es una llamada
+más a la API: ``acquire(modelo)`` pide cupo en el limitador antes de cada una
+(la primera usa el turno que ya tomó quien llama).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+# Intentos por modelo y límites del backoff (segundos)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+# Hedging: 0 lo desactiva; se necesita un mínimo de muestras de TTFT por modelo
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "1") != "0"
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Cadena de modelos de respaldo, en orden de preferencia
+MODEL_FALLBACK_CHAIN = [m.strip() for m in os.getenv("MODEL_FALLBACK_CHAIN", "").split(",") if m.strip()]
+
+# Códigos HTTP que vale la pena reintentar
+_TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_TRANSIENT_ERRORS = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    "TimeoutError", "TimeoutException", "ConnectError", "ReadTimeout", "RemoteProtocolError",
+}
+# Errores que ningún otro modelo va a resolver
+_FATAL_STATUS = {401}
+
+ClientFactory = Callable[[str], object]
+# Piden cupo en el limitador para una llamada extra al modelo indicado; la
+# versión asíncrona puede retornar el ticket (con ``release()``) para devolverlo
+Acquire = Callable[[str], None]
+AsyncAcquire = Callable[[str], Awaitable[object]]
+
+
+def fallback_models(model: str, chain: Optional[List[str]] = None) -> List[str]:
+    """Modelos a probar, empezando por ``model`` y siguiendo la cadena a partir de él"""
+    chain = MODEL_FALLBACK_CHAIN if chain is None else chain
+    rest = chain[chain.index(model) + 1:] if model in chain else chain
+    return [model] + [m for m in rest if m != model]
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True si el error es temporal (se reintenta con el mismo modelo)"""
+    if getattr(error, "status_code", None) in _TRANSIENT_STATUS:
+        return True
+    return type(error).__name__ in _TRANSIENT_ERRORS or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def is_fatal_error(error: Exception) -> bool:
+    """True si el error no se resuelve cambiando de modelo (p. ej. API key inválida)"""
+    return getattr(error, "status_code", None) in _FATAL_STATUS
+
+
+def backoff_delay(attempt: int) -> float:
+    """Backoff exponencial con jitter completo para el intento ``attempt`` (desde 0)"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """TTFT recientes por modelo para decidir cuándo lanzar una petición de respaldo"""
+
+    def __init__(self, window: int = 200, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, ttft: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(ttft)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """p95 del TTFT del modelo en segundos, o None si aún no hay suficientes muestras"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+
+# Compartido por todas las sesiones: el p95 se aprende del tráfico de todo el proceso
+latency_tracker = LatencyTracker()
+
+
+async def _close(agen, task: Optional[asyncio.Task] = None):
+    """Cancela la espera pendiente y cierra el stream (y su conexión HTTP)"""
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+    elif task is not None and not task.cancelled():
+        task.exception()  # Marcar el error como leído (terminó a la vez que la ganadora)
+    try:
+        await agen.aclose()
+    except Exception:
+        pass
+
+
+async def _discard_slot(slot: asyncio.Future):
+    """Cancela la espera de cupo de un respaldo que sobra, o devuelve el cupo si ya lo tenía"""
+    if not slot.done():
+        slot.cancel()
+        try:
+            await slot
+        except BaseException:
+            pass
+    elif not slot.cancelled() and slot.exception() is None:
+        release = getattr(slot.result(), "release", None)
+        if release:
+            release()
+
+
+async def _first_chunk(get_client: ClientFactory, models: List[str], api_messages,
+                       tracker: LatencyTracker, acquire: Optional[AsyncAcquire] = None):
+    """
+    Pide la respuesta y espera su primer fragmento, con hedging si tarda.
+
+    La petición de respaldo pide su propio cupo con ``acquire`` sin dejar de
+    esperar a la primera: si la primera responde antes de obtenerlo, el
+    respaldo no se lanza (y el cupo se devuelve); si no hay cupo, se sigue
+    esperando a la primera.
+
+    Returns:
+        (modelo, stream, primer_fragmento o None si la respuesta vino vacía)
+    """
+    model = models[0]
+    started = {}
+    slot = None
+
+    def launch(target: str):
+        agen = get_client(target).astream(api_messages).__aiter__()
+        task = asyncio.ensure_future(agen.__anext__())
+        started[task] = (target, agen, time.perf_counter())
+        return task
+
+    try:
+        pending = {launch(model)}
+        delay = tracker.hedge_delay(model) if HEDGE_REQUESTS else None
+        if delay is not None:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                hedge_model = models[1] if len(models) > 1 else model
+                hedge = True
+                if acquire is not None:
+                    # El cupo del respaldo compite con la respuesta de la principal
+                    slot = asyncio.ensure_future(acquire(hedge_model))
+                    await asyncio.wait(pending | {slot}, return_when=asyncio.FIRST_COMPLETED)
+                    if any(task.done() for task in pending):
+                        await _discard_slot(slot)
+                        hedge = False
+                    elif slot.exception() is not None:
+                        print(f"⚠️ [LOG] Sin cupo para la petición de respaldo a {hedge_model}: "
+                              f"{slot.exception()}")
+                        hedge = False
+                    slot = None
+                if hedge:
+                    print(f"🪂 [LOG] Primer token de {model} tarda más de {delay * 1000:.0f} ms (p95); "
+                          f"petición de respaldo a {hedge_model}")
+                    pending.add(launch(hedge_model))
+            else:
+                pending = done
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                target, agen, start = started.pop(task)
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    chunk = None
+                except Exception as e:
+                    error = e
+                    await _close(agen)
+                    continue
+                tracker.record(target, time.perf_counter() - start)
+                # Ganó esta petición: cerrar las demás, pendientes o terminadas a la vez
+                for other, (_, other_agen, _) in list(started.items()):
+                    await _close(other_agen, other)
+                started.clear()
+                return target, agen, chunk
+        raise error
+    except asyncio.CancelledError:
+        # La generación se canceló mientras esperaba: cerrar todas las peticiones
+        if slot is not None:
+            await _discard_slot(slot)
+        for task, (_, agen, _) in list(started.items()):
+            await _close(agen, task)
+        raise
+
+
+async def resilient_astream(get_client: ClientFactory, models: List[str], api_messages,
+                            on_served: Callable[[str], None],
+                            tracker: LatencyTracker = latency_tracker,
+                            acquire: Optional[AsyncAcquire] = None) -> AsyncIterator:
+    """
+    Stream asíncrono con reintentos, hedging y cadena de respaldo.
+
+    Args:
+        get_client: fn(modelo) -> cliente con ``astream``
+        models: Modelo principal seguido de sus respaldos (ver fallback_models)
+        api_messages: Mensajes a enviar
+        on_served: Se llama con el modelo que respondió, antes del primer fragmento
+        acquire: Pide cupo antes de cada llamada después de la primera
+    """
+    last_error = None
+    first_call = True
+    for index, model in enumerate(models):
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            # Sin cupo en el limitador: se propaga (no es un fallo del modelo)
+            if acquire is not None and not first_call:
+                await acquire(model)
+            first_call = False
+            try:
+                served, agen, chunk = await _first_chunk(
+                    get_client, models[index:], api_messages, tracker, acquire
+                )
+            except Exception as e:
+                last_error = e
+                if is_fatal_error(e):
+                    raise
+                if not is_transient_error(e):
+                    break
+                if attempt + 1 < RETRY_MAX_ATTEMPTS:
+                    delay = backoff_delay(attempt)
+                    print(f"🔁 [LOG] {model}: {type(e).__name__}; reintento {attempt + 2}/"
+                          f"{RETRY_MAX_ATTEMPTS} en {delay:.2f} s")
+                    await asyncio.sleep(delay)
+                continue
+
+            on_served(served)
+            try:
+                if chunk is not None:
+                    yield chunk
+                    async for chunk in agen:
+                        yield chunk
+            finally:
+                await _close(agen)
+            return
+        if index + 1 < len(models):
+            print(f"↪️ [LOG] {model} no respondió ({type(last_error).__name__}); probando {models[index + 1]}")
+    raise last_error
+
+
+def resilient_call(models: List[str], call: Callable[[str], object],
+                   on_served: Callable[[str], None], acquire: Optional[Acquire] = None):
+    """
+    Versión síncrona: ``call(modelo)`` con reintentos y cadena de respaldo (sin hedging).
+
+    Args:
+        acquire: Pide cupo antes de cada llamada después de la primera
+
+    Returns:
+        El resultado de la primera llamada que no falló
+    """
+    last_error = None
+    first_call = True
+    for index, model in enumerate(models):
+        for attempt in range(RETRY_MAX_ATTEMPTS):
+            if acquire is not None and not first_call:
+                acquire(model)
+            first_call = False
+            try:
+                result = call(model)
+            except Exception as e:
+                last_error = e
+                if is_fatal_error(e):
+                    raise
+                if not is_transient_error(e):
+                    break
+                if attempt + 1 < RETRY_MAX_ATTEMPTS:
+                    time.sleep(backoff_delay(attempt))
+                continue
+            on_served(model)
+            return result
+        if index + 1 < len(models):
+            print(f"↪️ [LOG] {model} no respondió ({type(last_error).__name__}); probando {models[index + 1]}")
+    raise last_error
+
+
+def resilient_stream(get_client: ClientFactory, models: List[str], api_messages,
+                     on_served: Callable[[str], None], acquire: Optional[Acquire] = None) -> Iterator:
+    """Stream síncrono: se reintenta hasta obtener el primer fragmento (ver resilient_call)"""
+    def open_stream(model: str):
+        stream = iter(get_client(model).stream(api_messages))
+        return stream, next(stream, None)
+
+    stream, chunk = resilient_call(models, open_stream, on_served, acquire)
+    if chunk is not None:
+        yield chunk
+        yield from stream
@@ -0,0 +1,291 @@
+# U-TUTOR v5.0 - Títulos de conversación locales y refinamiento diferido con IA
+"""
+Dos etapas para titular una conversación sin esperar al modelo:
+
+1. ``LocalTitler`` (al crear la conversación, microsegundos): extrae la frase
+   clave del primer mensaje con pesos TF-IDF sobre un vocabulario académico
+   en español y antepone la materia detectada, p. ej. "¿Me ayudas con
+   ecuaciones cuadráticas?" -> "Matemáticas: Ecuaciones cuadráticas".
+   Las palabras de petición ("explícame", "ayúdame", "funciona"...) pesan poco
+   y las del vocabulario de materias (``query_router.SUBJECT_KEYWORDS``) mucho;
+   la frecuencia documental se ajusta con cada mensaje titulado.
+
+2. ``TitleRefiner`` (después de la primera respuesta): una cola acotada con un
+   hilo en segundo plano pide el título al modelo con prioridad de fondo y lo
+   guarda solo si es distinto del local y nadie renombró la conversación.
+"""
+import math
+import queue
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from query_router import SUBJECT_KEYWORDS, detect_subject, keyword_pattern
+
+# Largo máximo de un título (el mismo que el de los títulos con IA)
+TITLE_MAX_LENGTH = 40
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_STOPWORDS = {
+    "a", "al", "algo", "ante", "como", "con", "cual", "cuales", "cuando", "cuanto", "cuantos",
+    "de", "del", "desde", "donde", "e", "el", "ella", "en", "entre", "era", "eran", "es", "esa",
+    "ese", "eso", "esta", "estas", "este", "esto", "estos", "fue", "fueron", "ha", "han", "hay",
+    "la", "las", "le", "les", "lo", "los", "mas", "me", "mi", "mis", "muy", "no", "nos", "o",
+    "para", "pero", "por", "porque", "que", "quien", "se", "ser", "si", "sin", "sobre", "son",
+    "su", "sus", "te", "tiene", "tienen", "tu", "u", "un", "una", "unas", "uno", "unos", "y", "ya",
+    "yo",
+    # Inglés: interrogativas, auxiliares y artículos ("What is a prime number?")
+    "about", "an", "and", "any", "are", "be", "been", "but", "by", "can", "could", "did", "do",
+    "does", "for", "from", "had", "has", "have", "how", "into", "is", "it", "its", "not", "of",
+    "on", "or", "should", "some", "than", "that", "the", "their", "there", "these", "they", "this",
+    "those", "to", "was", "we", "were", "what", "when", "where", "which", "who", "why", "will",
+    "with", "would", "you", "your",
+}
+# Palabras de petición: aparecen en casi todos los mensajes (IDF bajo)
+_REQUEST_WORDS = {
+    "ayuda", "ayudame", "ayudar", "ayudas", "calcula", "calcular", "cuentame", "dame", "define", "definicion",
+    "diferencia", "dime", "duda", "dudas", "ejemplo", "ejemplos", "entender", "entiendo", "explica",
+    "explicacion", "explicame", "explicar", "facil", "favor", "forma", "funciona", "funcionan",
+    "gracias", "hacer", "hola", "manera", "mejor", "necesito", "paso", "pasos", "podrias", "pregunta",
+    "puedes", "quiero", "resolver", "resuelve", "sencillo", "significa", "simple", "sirve", "sirven",
+    "tema", "tengo", "usar", "uso",
+    # Inglés
+    "calculate", "define", "definition", "difference", "easy", "example", "examples", "explain",
+    "hello", "help", "learn", "mean", "means", "need", "please", "question", "show", "simple",
+    "solve", "step", "steps", "tell", "thanks", "understand", "use", "want", "work", "works",
+}
+# Conectores que pueden quedar dentro de una frase clave ("teorema de Pitágoras")
+_CONNECTORS = {"a", "de", "del", "of"}
+# Artículos que pueden seguir a un conector ("causes of the French Revolution")
+_CONNECTOR_ARTICLES = {"the"}
+
+# Frecuencias documentales iniciales (pseudo-documentos) por tipo de palabra
+_SEED_DOCUMENTS = 100
+_SEED_DF_REQUEST = 50
+_SEED_DF_ACADEMIC = 2
+_SEED_DF_OTHER = 10
+
+
+def _strip_accents(text: str) -> str:
+    """Minúsculas y sin tildes"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+# Vocabulario académico (sin tildes), con las mismas reglas que detect_subject:
+# palabra completa o su plural, o raíz si termina en "*"; "tabla periodica" aporta dos
+_ACADEMIC_WORD = re.compile("|".join(sorted({
+    keyword_pattern(word) for keywords in SUBJECT_KEYWORDS.values() for keyword in keywords
+    for word in (keyword.split() if " " in keyword else [keyword]) if len(word) >= 3
+})))
+
+
+class LocalTitler:
+    """Título "Materia: Frase clave" a partir del primer mensaje, sin llamar al modelo"""
+
+    def __init__(self, max_length: int = TITLE_MAX_LENGTH):
+        self.max_length = max_length
+        self._documents = _SEED_DOCUMENTS
+        self._df: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_academic(word: str) -> bool:
+        return _ACADEMIC_WORD.fullmatch(word) is not None
+
+    def _idf(self, word: str) -> float:
+        if word in _REQUEST_WORDS:
+            seed = _SEED_DF_REQUEST
+        elif self._is_academic(word):
+            seed = _SEED_DF_ACADEMIC
+        else:
+            seed = _SEED_DF_OTHER
+        return math.log((self._documents + 1) / (seed + self._df.get(word, 0) + 1)) + 1
+
+    @staticmethod
+    def _is_content(word: str) -> bool:
+        return len(word) >= 3 and word not in _STOPWORDS and word not in _REQUEST_WORDS and not word.isdigit()
+
+    def _phrase_word(self, tokens: List[Tuple[str, str]], index: int) -> int:
+        """Palabras de la frase que aporta tokens[index]: 1 si es de contenido, 2 o 3 si es "de (the) X", si no 0"""
+        word = tokens[index][1]
+        if self._is_content(word):
+            return 1
+        if word in _CONNECTORS and index > 0:
+            following = index + 1
+            if following < len(tokens) - 1 and tokens[following][1] in _CONNECTOR_ARTICLES:
+                following += 1
+            if following < len(tokens) and self._is_content(tokens[following][1]):
+                return following - index + 1
+        return 0
+
+    def _key_phrase(self, tokens: List[Tuple[str, str]]) -> Optional[str]:
+        """
+        Palabra con mayor TF-IDF, extendida con las palabras de contenido vecinas
+        ("ecuaciones cuadráticas", "segunda ley de Newton").
+
+        Returns:
+            La frase tal como se escribió, o None
+        """
+        frequencies: Dict[str, int] = {}
+        for _, word in tokens:
+            frequencies[word] = frequencies.get(word, 0) + 1
+
+        best, best_score = None, 0.0
+        with self._lock:
+            for index, (_, word) in enumerate(tokens):
+                if not self._is_content(word):
+                    continue
+                score = frequencies[word] * self._idf(word)
+                if score > best_score:
+                    best, best_score = index, score
+        if best is None:
+            return None
+
+        start, end = best, best + 1
+        content_words = 1
+        while content_words < 3 and end < len(tokens) and self._phrase_word(tokens, end):
+            end += self._phrase_word(tokens, end)
+            content_words += 1
+        while content_words < 3 and start > 0:
+            if self._is_content(tokens[start - 1][1]):
+                start -= 1
+            elif start > 1 and tokens[start - 1][1] in _CONNECTORS and self._is_content(tokens[start - 2][1]):
+                start -= 2
+            else:
+                break
+            content_words += 1
+
+        # Se conserva la forma escrita (tildes y nombres propios)
+        text = " ".join(original for original, _ in tokens[start:end])
+        return text[0].upper() + text[1:]
+
+    def observe(self, text: str):
+        """Suma el mensaje a la frecuencia documental (las palabras repetidas pesan menos)"""
+        words = {_strip_accents(match) for match in _WORD.findall(text)}
+        with self._lock:
+            self._documents += 1
+            for word in words:
+                self._df[word] = self._df.get(word, 0) + 1
+
+    def title(self, text: str) -> Optional[str]:
+        """
+        Título local del primer mensaje.
+
+        Returns:
+            "Materia: Frase clave", solo la frase si no se detecta materia, o
+            None si el mensaje no tiene palabras de contenido
+        """
+        tokens = [(match, _strip_accents(match)) for match in _WORD.findall(text)]
+        phrase = self._key_phrase(tokens)
+        self.observe(text)
+        if phrase is None:
+            return None
+
+        # La materia de la frase clave manda ("base de datos"); si no tiene, la del mensaje
+        subject = detect_subject(phrase) or detect_subject(text)
+        # "Programación orientada a objetos" ya nombra la materia
+        if subject and not _strip_accents(phrase).startswith(_strip_accents(subject)):
+            title = f"{subject}: {phrase}"
+            if len(title) <= self.max_length:
+                return title
+        if len(phrase) > self.max_length:
+            return phrase[:self.max_length - 3].rstrip() + "..."
+        return phrase
+
+
+_titler: Optional[LocalTitler] = None
+_titler_lock = threading.Lock()
+
+
+def get_local_titler() -> LocalTitler:
+    """Retorna el titulador compartido del proceso (lo crea la primera vez)"""
+    global _titler
+    with _titler_lock:
+        if _titler is None:
+            _titler = LocalTitler()
+        return _titler
+
+
+class TitleRefiner:
+    """Cola de títulos con IA que se calculan en segundo plano, uno a la vez"""
+
+    def __init__(self, db_manager, max_queue: int = 100):
+        """
+        Args:
+            db_manager: DatabaseManager donde se guarda el título refinado
+            max_queue: Conversaciones que pueden esperar título a la vez
+        """
+        self.db_manager = db_manager
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.refined = 0
+        self.unchanged = 0
+        self.dropped = 0
+
+    def enqueue(self, conversation_id: int, local_title: str,
+                messages: List[Dict[str, str]], chat_manager) -> bool:
+        """
+        Pide el título con IA de una conversación (sin bloquear).
+
+        Args:
+            local_title: Título actual; el de IA solo lo reemplaza si sigue siendo este
+            messages: Primeros mensajes de la conversación
+            chat_manager: ChatManager de la sesión (modelo y limitador)
+
+        Returns:
+            False si la conversación ya estaba en cola o la cola está llena
+        """
+        with self._lock:
+            if conversation_id in self._pending:
+                return False
+            try:
+                self.queue.put_nowait((conversation_id, local_title, list(messages), chat_manager))
+            except queue.Full:
+                self.dropped += 1
+                print(f"⚠️ [LOG] Cola de títulos llena; la conversación {conversation_id} conserva su título local")
+                return False
+            self._pending.add(conversation_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ututor-title-refiner", daemon=True)
+                self._thread.start()
+            return True
+
+    def _run(self):
+        """Hilo de fondo: un título a la vez (las llamadas esperan turno en el limitador)"""
+        while True:
+            conversation_id, local_title, messages, chat_manager = self.queue.get()
+            try:
+                self._refine(conversation_id, local_title, messages, chat_manager)
+            except Exception as e:
+                print(f"❌ [LOG] Error generando título: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(conversation_id)
+
+    def _refine(self, conversation_id: int, local_title: str,
+                messages: List[Dict[str, str]], chat_manager):
+        # Sin respaldo: si la IA falla, el título local se queda como está
+        title = chat_manager.generate_ai_title(messages, fallback=False)
+        if (title and title != local_title
+                and self.db_manager.update_conversation_title(conversation_id, title, expected_title=local_title)):
+            with self._lock:
+                self.refined += 1
+            print(f"🏷️ [LOG] Título generado para la conversación {conversation_id}: {title}")
+        else:
+            with self._lock:
+                self.unchanged += 1
+
+    def get_metrics(self) -> dict:
+        """Títulos en cola, reemplazados, sin cambios y descartados"""
+        with self._lock:
+            return {
+                "queued": self.queue.qsize(),
+                "refined": self.refined,
+                "unchanged": self.unchanged,
+                "dropped": self.dropped,
+            }
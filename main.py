@@ -1,32 +1,115 @@
 # U-TUTOR v5.0 - Aplicación principal optimizada
+import itertools
 import os
+import time
 from dotenv import load_dotenv
 import streamlit as st
 from functools import lru_cache
+from typing import Optional
 
 # Importar módulos principales
 from database_manager import DatabaseManager
-from chat_manager import ChatManager
+from chat_manager import PERSONALITIES, ChatManager
+from llm_registry import LLMClientRegistry
+from llm_providers import LLM_PROVIDER
+from rate_limiter import RateLimitExceeded
+from query_router import QUERY_ROUTER, QueryRouter, estimate_cost
+from local_titler import TitleRefiner
+from quick_suggestions import SUGGESTION_WARMUP, SUGGESTION_WARMUP_MODELS, SuggestionWarmer
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache, NUMPY_AVAILABLE
 from ui_components import UIComponents
-from audio_manager import AudioManager
+from speech_engine import get_speech_engine
 
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Frecuencia de repintado de la respuesta en streaming (lo que ocurra primero)
+STREAM_FLUSH_MS = int(os.getenv("STREAM_FLUSH_MS", "50"))
+STREAM_FLUSH_CHUNKS = int(os.getenv("STREAM_FLUSH_CHUNKS", "20"))
+# Cada cuánto se guarda en la BD la respuesta parcial mientras llega (0 = nunca)
+STREAM_CHECKPOINT_MS = int(os.getenv("STREAM_CHECKPOINT_MS", "2000"))
+# Temperatura de las sesiones nuevas (y de las respuestas precalentadas)
+DEFAULT_TEMPERATURE = 1
+
 
 # Cache para DatabaseManager - OPTIMIZACION
 @st.cache_resource
 def get_db_manager():
     """Cachea el DatabaseManager para evitar reconexiones"""
-    return DatabaseManager()
+    # DB_POOLED=0 vuelve al modo de una conexión por llamada
+    pooled = os.getenv("DB_POOLED", "1") == "1"
+    # Conexiones abiertas como máximo, compartidas por todas las sesiones
+    pool_size = int(os.getenv("DB_POOL_SIZE", "8"))
+    # DB_WRITE_BEHIND=1 guarda los mensajes en lotes desde un hilo en segundo plano
+    write_behind = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+    return DatabaseManager(pooled=pooled, write_behind=write_behind, pool_size=pool_size)
+
+
+# Clientes del modelo compartidos por todas las sesiones - OPTIMIZACION
+@st.cache_resource
+def get_llm_registry(api_key: str):
+    """Cachea el LLMClientRegistry (pool HTTP con keep-alive compartido)"""
+    return LLMClientRegistry(api_key)
+
+
+# Enrutador de preguntas por complejidad (opcional) - OPTIMIZACION
+@st.cache_resource
+def get_query_router():
+    """Cachea el QueryRouter (QUERY_ROUTER=1 para activarlo); sus métricas son de todo el proceso"""
+    return QueryRouter() if QUERY_ROUTER else None
+
+
+# Caché de respuestas compartida por todas las sesiones - OPTIMIZACION
+@st.cache_resource
+def get_response_cache():
+    """Cachea el ResponseCache (RESPONSE_CACHE=0 para desactivarlo)"""
+    if os.getenv("RESPONSE_CACHE", "1") == "0":
+        return None
+    return ResponseCache(get_db_manager())
 
 
-# Cache para AudioManager - OPTIMIZACION
+# Caché semántica de primeras preguntas (opcional) - OPTIMIZACION
+@st.cache_resource
+def get_semantic_cache():
+    """Cachea el SemanticCache (SEMANTIC_CACHE=1 para activarlo)"""
+    response_cache = get_response_cache()
+    if os.getenv("SEMANTIC_CACHE", "0") != "1" or response_cache is None:
+        return None
+    if not NUMPY_AVAILABLE:
+        print("⚠️ SEMANTIC_CACHE=1 requiere numpy; caché semántica desactivada")
+        return None
+    return SemanticCache(response_cache)
+
+
+# Respuestas pregeneradas de las sugerencias rápidas - OPTIMIZACION
+@st.cache_resource
+def get_suggestion_warmer(api_key: str, model: str, temperature: float):
+    """Cachea y arranca el SuggestionWarmer (solo con SUGGESTION_WARMUP=1)"""
+    response_cache = get_response_cache()
+    if not SUGGESTION_WARMUP or response_cache is None:
+        return None
+    # ChatManager propio: misma caché, registro y enrutador que las sesiones
+    chat_manager = ChatManager(
+        api_key,
+        model,
+        temperature,
+        response_cache=response_cache,
+        semantic_cache=get_semantic_cache(),
+        llm_registry=get_llm_registry(api_key),
+        query_router=get_query_router()
+    )
+    warmer = SuggestionWarmer(chat_manager, PERSONALITIES, SUGGESTION_WARMUP_MODELS or [model])
+    warmer.start()
+    return warmer
+
+
+# Cola de títulos con IA compartida por todas las sesiones - OPTIMIZACION
 @st.cache_resource
-def get_audio_manager():
-    """Cachea el AudioManager para evitar reinicializaciones"""
-    return AudioManager()
+def get_title_refiner():
+    """Cachea el TitleRefiner (un hilo de fondo por proceso)"""
+    return TitleRefiner(get_db_manager())
 
 
 # ============================================
@@ -89,21 +172,33 @@ class UTutorApp:
         # Inicializar componentes (usando cache)
         self.db_manager = get_db_manager()
         self.ui_components = UIComponents(self.db_manager, self.version)
-        self.audio_manager = get_audio_manager()
-
-        # Hacer audio_manager disponible globalmente
-        st.session_state.audio_manager = self.audio_manager
+        # Motor de voz compartido por todas las sesiones (y por los botones de audio)
+        self.speech_engine = get_speech_engine()
         
-        if not self.api_key:
+        # El proveedor falso (LLM_PROVIDER=fake) no necesita clave
+        if not self.api_key and LLM_PROVIDER != "fake":
             st.error("❌ Por favor, configura tu OPENAI_API_KEY en el archivo .env")
             st.stop()
 
+        # Pregenerar las respuestas de las sugerencias con la temperatura de una sesión nueva
+        get_suggestion_warmer(self.api_key, self.model, DEFAULT_TEMPERATURE)
+
         # Inicializar con configuración guardada
-        temperature = st.session_state.get('temperature', 1)
+        temperature = st.session_state.get('temperature', DEFAULT_TEMPERATURE)
 
         # Crear ChatManager (no se cachea porque el modelo puede cambiar)
         if 'chat_manager_instance' not in st.session_state:
-            st.session_state.chat_manager_instance = ChatManager(self.api_key, self.model, temperature)
+            st.session_state.chat_manager_instance = ChatManager(
+                self.api_key,
+                self.model,
+                temperature,
+                max_context_messages=int(os.getenv("CONTEXT_MAX_MESSAGES", "50")),
+                db_manager=self.db_manager,
+                response_cache=get_response_cache(),
+                semantic_cache=get_semantic_cache(),
+                llm_registry=get_llm_registry(self.api_key),
+                query_router=get_query_router()
+            )
 
         self.chat_manager = st.session_state.chat_manager_instance
         st.session_state.chat_manager = self.chat_manager
@@ -226,12 +321,28 @@ class UTutorApp:
         if "current_conversation_id" not in st.session_state:
             st.session_state.current_conversation_id = None
 
+        # Hay mensajes más antiguos que la ventana cargada en la sesión
+        if "has_older_messages" not in st.session_state:
+            st.session_state.has_older_messages = False
+
+        # Traducciones para TTS en curso: texto original -> Future
+        if "pending_translations" not in st.session_state:
+            st.session_state.pending_translations = {}
+
+        # Mensajes de la conversación anteriores al primero cargado en la sesión
+        if "messages_offset" not in st.session_state:
+            st.session_state.messages_offset = 0
+
         if "editing_title" not in st.session_state:
             st.session_state.editing_title = None
 
         if "pending_message" not in st.session_state:
             st.session_state.pending_message = None
 
+        # Conversación nueva esperando su título con IA ({conversation_id, title})
+        if "pending_title" not in st.session_state:
+            st.session_state.pending_title = None
+
         if "current_audio" not in st.session_state:
             st.session_state.current_audio = None
 
@@ -249,9 +360,13 @@ class UTutorApp:
         if "cancelled_at_message" not in st.session_state:
             st.session_state.cancelled_at_message = None
 
+        # Respuesta interrumpida guardada como checkpoint ({conversation_id, id, content})
+        if "partial_message" not in st.session_state:
+            st.session_state.partial_message = None
+
         # Inicializar configuración (temperatura y personalidad)
         if "temperature" not in st.session_state:
-            st.session_state.temperature = 1
+            st.session_state.temperature = DEFAULT_TEMPERATURE
 
         if "personality" not in st.session_state:
             st.session_state.personality = "Profesional"
@@ -309,15 +424,14 @@ class UTutorApp:
                     st.info(f"🎵 Reproduciendo audio en {lang_name}")
                 
                 # Mostrar indicador de generación de audio con información de velocidad
-                cache_size = self.audio_manager.get_cache_size()
-                if cache_size > 0:
-                    st.info(f"⚡ Caché activo: {cache_size} archivos guardados para reproducción rápida")
+                cache_entries = self.speech_engine.get_metrics()["entries"]
+                if cache_entries > 0:
+                    st.info(f"⚡ Caché activo: {cache_entries} audios guardados para reproducción rápida")
                 
                 with st.spinner():
-                    import time
                     start_time = time.time()
                     
-                    audio_file = self.audio_manager.text_to_speech(
+                    audio_bytes = self.speech_engine.synthesize(
                         st.session_state.current_audio, 
                         lang=tts_lang
                     )
@@ -332,34 +446,18 @@ class UTutorApp:
                     else:
                         st.warning(f"🐌 Audio generado en {generation_time:.1f}s (lento - verifica tu conexión)")
                 
-                if audio_file and os.path.exists(audio_file):
-                    # Leer archivo de audio
-                    with open(audio_file, 'rb') as audio:
-                        audio_bytes = audio.read()
+                if audio_bytes:
+                    # Reproducir audio (MP3 en memoria, sin archivos temporales)
+                    st.audio(audio_bytes, format='audio/mp3', autoplay=True)
                     
-                    # Determinar formato del archivo
-                    audio_format = 'audio/wav' if audio_file.endswith('.wav') else 'audio/mp3'
-                    
-                    # Reproducir audio
-                    st.audio(audio_bytes, format=audio_format, autoplay=True)
-                    
-                    # Mostrar información del archivo
+                    # Mostrar información del audio
                     file_size = len(audio_bytes)
                     if file_size < 50000:  # Menos de 50KB
-                        st.info(f"📁 Archivo pequeño: {file_size} bytes (rápido)")
+                        st.info(f"📁 Audio pequeño: {file_size} bytes (rápido)")
                     else:
-                        st.info(f"📁 Archivo: {file_size} bytes")
-                    
-                    # Limpiar archivo temporal solo si no está en caché
-                    try:
-                        # Verificar si está en caché antes de eliminar
-                        cache_key = f"{st.session_state.current_audio[:200]}_{tts_lang}"
-                        if cache_key not in self.audio_manager.audio_cache:
-                            os.remove(audio_file)
-                    except:
-                        pass
+                        st.info(f"📁 Audio: {file_size} bytes")
                 else:
-                    st.error("❌ No se pudo generar el archivo de audio")
+                    st.error("❌ No se pudo generar el audio")
                 
                 # Limpiar después de reproducir
                 st.session_state.current_audio = None
@@ -478,6 +576,10 @@ class UTutorApp:
         if st.session_state.current_conversation_id is None:
             conversation_title = self.chat_manager.generate_conversation_title(prompt)
             st.session_state.current_conversation_id = self.db_manager.create_conversation(conversation_title)
+            # Título local al instante; el de IA se pide tras la primera respuesta
+            st.session_state.pending_title = {
+                "conversation_id": st.session_state.current_conversation_id, "title": conversation_title
+            }
 
         # 3️⃣ Agregar mensaje del usuario al historial de la sesión
         # FIX: No duplicar si ya está en la sesión
@@ -500,11 +602,35 @@ class UTutorApp:
         st.session_state.await_response = True
 
 
+    def _schedule_ai_title(self, conversation_id: int):
+        """
+        Encola el título con IA de una conversación nueva - U-TUTOR v5.0
+
+        Se pide después de la primera respuesta (con pregunta y respuesta como
+        contexto) en la cola de fondo de TitleRefiner: no compite con la
+        respuesta principal y solo reemplaza el título local si es distinto.
+        """
+        pending = st.session_state.get('pending_title')
+        if not pending or pending["conversation_id"] != conversation_id:
+            return
+        st.session_state.pending_title = None
+        if os.getenv("AI_TITLES", "1") == "0":
+            return
+        get_title_refiner().enqueue(
+            conversation_id, pending["title"], st.session_state.messages[:3], self.chat_manager
+        )
+
     def _generate_assistant_response(self):
         """
         Genera y muestra la respuesta del asistente con streaming - U-TUTOR v5.0
         FIX: Mejor protección contra re-entrancy y duplicación de mensajes
         """
+        generation = None
+        conversation_id = st.session_state.current_conversation_id
+        checkpoint_id = None
+        checkpointed = ""
+        full_response = ""
+        saved = False
         try:
             # FIX: Proteger contra re-entrancy - si ya estamos generando, salir
             if st.session_state.get('_generating_response', False):
@@ -513,67 +639,142 @@ class UTutorApp:
 
             print("🟢 [LOG] Iniciando _generate_assistant_response()")
             st.session_state._generating_response = True
-            placeholder = st.empty()  # Placeholder para el spinner / mensaje temporal
-
+            placeholder = st.empty()  # Placeholder donde se pinta la respuesta mientras llega
+
+            # Respuesta parcial previa: se continúa desde su texto o se reemplaza
+            messages = st.session_state.messages
+            continuation_prefix = None
+            partial = st.session_state.partial_message
+            st.session_state.partial_message = None
+            continuing = st.session_state.pop('continue_partial', False)
+            regenerating = st.session_state.pop('regenerate_partial', False)
+            if partial and partial["conversation_id"] == conversation_id:
+                if continuing:
+                    continuation_prefix = full_response = checkpointed = partial["content"]
+                    checkpoint_id = partial["id"]
+                    if messages and messages[-1].get("role") == "assistant":
+                        messages = messages[:-1]
+                    print(f"▶️ [LOG] Continuando respuesta parcial ({len(full_response)} caracteres)")
+                elif regenerating:
+                    # La respuesta nueva reemplaza al checkpoint
+                    self.db_manager.delete_message(partial["id"])
+                else:
+                    # Sigue en el historial de la sesión: queda como respuesta definitiva
+                    self.db_manager.update_partial_message(partial["id"], partial["content"], finished=True)
+
+            print(f"📨 [LOG] Llamando get_response_stream con {len(messages)} mensajes")
+            start_time = time.perf_counter()
+            first_token_time = None
+            chunk_count = 0
+
+            # 1️⃣ Pintar la respuesta token a token (generación cancelable en el event loop)
+            generation = self.chat_manager.start_generation(
+                messages,
+                conversation_id=conversation_id,
+                messages_offset=st.session_state.get('messages_offset', 0),
+                continuation_prefix=continuation_prefix
+            )
+            stream = iter(generation)
+            self._wait_for_queue(generation, placeholder)
             with self.ui_components.show_spinner("🤔 Jake está pensando..."):
+                first_chunk = next(stream, None)
+
+            last_flush = last_checkpoint = time.perf_counter()
+            pending_chunks = 0
+            for chunk in itertools.chain([first_chunk] if first_chunk is not None else [], stream):
+                if not (hasattr(chunk, 'content') and chunk.content):
+                    continue
+                # Asegurar que es string antes de concatenar
+                full_response += str(chunk.content)
+                chunk_count += 1
+                pending_chunks += 1
+                now = time.perf_counter()
+                if first_token_time is None:
+                    first_token_time = now
+
+                # Actualizar el placeholder cada STREAM_FLUSH_MS o STREAM_FLUSH_CHUNKS
+                if (now - last_flush) * 1000 >= STREAM_FLUSH_MS or pending_chunks >= STREAM_FLUSH_CHUNKS:
+                    self.ui_components.render_streaming_message(placeholder, full_response)
+                    last_flush = now
+                    pending_chunks = 0
+
+                # Checkpoint periódico: si se interrumpe, se puede continuar desde aquí
+                if STREAM_CHECKPOINT_MS and (now - last_checkpoint) * 1000 >= STREAM_CHECKPOINT_MS:
+                    checkpoint_id = self._checkpoint_partial(conversation_id, checkpoint_id, full_response)
+                    checkpointed = full_response
+                    last_checkpoint = now
+
+            # Cancelada o de otra conversación (el usuario cambió de chat): queda como parcial
+            if generation.cancelled or conversation_id != st.session_state.current_conversation_id:
+                print("🛑 [LOG] Respuesta interrumpida: la generación fue cancelada")
+                placeholder.empty()
+                return
 
-                full_response = ""
-                print(f"📨 [LOG] Llamando get_response_stream con {len(st.session_state.messages)} mensajes")
-
-                # 1️⃣ Recolectar respuesta en streaming
-                for chunk in self.chat_manager.get_response_stream(st.session_state.messages):
-                    if hasattr(chunk, 'content') and chunk.content:
-                        # Asegurar que es string antes de concatenar
-                        content = str(chunk.content) if chunk.content else ""
-                        full_response += content
+            self.ui_components.render_streaming_message(placeholder, full_response, finished=True)
+            generated = full_response[len(continuation_prefix):] if continuation_prefix else full_response
+            message_metrics = self._record_response_metrics(generated, start_time, first_token_time, chunk_count)
+            print(f"✅ [LOG] Respuesta generada ({len(full_response)} caracteres)")
 
-                print(f"✅ [LOG] Respuesta generada ({len(full_response)} caracteres)")
+            # 2️⃣ Traducción para TTS en segundo plano (no retrasa el guardado ni el rerun)
+            tts_language = st.session_state.get('tts_language', 'es')
+            auto_translate = st.session_state.get('auto_translate', True)
 
-                # 2️⃣ Post-procesar traducción para TTS si aplica
-                tts_language = st.session_state.get('tts_language', 'es')
-                auto_translate = st.session_state.get('auto_translate', True)
+            if tts_language == 'en' and auto_translate:
+                st.session_state.pending_translations[full_response] = (
+                    self.chat_manager.translate_text_async(full_response, 'en')
+                )
+                # Conservar solo las traducciones más recientes
+                while len(st.session_state.pending_translations) > 20:
+                    st.session_state.pending_translations.pop(next(iter(st.session_state.pending_translations)))
+
+            # 3️⃣ FIX: Verificar que no haya un mensaje del asistente duplicado
+            # (esto puede ocurrir si se hizo rerun antes de limpiar await_response)
+            print(f"💾 [LOG] Guardando mensaje en sesión y BD...")
+
+            # Verificar si el último mensaje ya es del asistente (evitar duplicado)
+            if (st.session_state.messages and
+                st.session_state.messages[-1].get("role") == "assistant"):
+                print("⚠️ [LOG] Último mensaje ya es del asistente, reemplazando...")
+                st.session_state.messages[-1] = {
+                    "role": "assistant",
+                    "content": full_response
+                }
+            else:
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": full_response
+                })
 
-                if tts_language == 'en' and auto_translate:
-                    translated_response = self.chat_manager.translate_text(full_response, 'en')
-                    audio_response = translated_response if translated_response != full_response else full_response
-                else:
-                    audio_response = full_response
-
-                # 3️⃣ FIX: Verificar que no haya un mensaje del asistente duplicado
-                # (esto puede ocurrir si se hizo rerun antes de limpiar await_response)
-                print(f"💾 [LOG] Guardando mensaje en sesión y BD...")
-
-                # Verificar si el último mensaje ya es del asistente (evitar duplicado)
-                if (st.session_state.messages and
-                    st.session_state.messages[-1].get("role") == "assistant"):
-                    print("⚠️ [LOG] Último mensaje ya es del asistente, reemplazando...")
-                    st.session_state.messages[-1] = {
-                        "role": "assistant",
-                        "content": full_response
-                    }
-                else:
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": full_response
-                    })
-
-                self.db_manager.save_message(
-                    st.session_state.current_conversation_id,
-                    "assistant",
-                    full_response
+            # Texto final: completa el checkpoint o se guarda una sola vez si no lo hubo
+            if checkpoint_id:
+                self.db_manager.update_partial_message(
+                    checkpoint_id, full_response, finished=True, metrics=message_metrics
                 )
-                print(f"💾 [LOG] Mensaje guardado. Total mensajes: {len(st.session_state.messages)}")
+            else:
+                self.db_manager.save_message(conversation_id, "assistant", full_response, metrics=message_metrics)
+            saved = True
+            print(f"💾 [LOG] Mensaje guardado. Total mensajes: {len(st.session_state.messages)}")
 
-                # 4️⃣ Marcar que ya no esperamos respuesta y recargar
-                st.session_state.await_response = False
-                print("🟡 [LOG] await_response establecido a False")
-                print("🔄 [LOG] Triggerando st.rerun() para mostrar el nuevo mensaje...")
-                st.rerun()  # ✅ FIX: Forzar rerun para renderizar el nuevo mensaje
+            # Título con IA y resumen de los turnos antiguos (en segundo plano)
+            self._schedule_ai_title(conversation_id)
+            self.chat_manager.schedule_summary_update(conversation_id)
+
+            # 4️⃣ Marcar que ya no esperamos respuesta y recargar
+            st.session_state.await_response = False
+            print("🟡 [LOG] await_response establecido a False")
+            print("🔄 [LOG] Triggerando st.rerun() para mostrar el nuevo mensaje...")
+            st.rerun()  # ✅ FIX: Forzar rerun para renderizar el nuevo mensaje
 
         except Exception as e:
             print(f"❌ [LOG] Error en _generate_assistant_response: {str(e)}")
             self._handle_api_error(e)
         finally:
+            # Si el script se interrumpió a mitad del stream, cerrar la petición HTTP
+            if generation is not None and not generation.finished:
+                self.chat_manager.cancel_generation(reason="ejecución interrumpida", handle=generation)
+            # Respuesta sin terminar: guardar lo recibido para poder continuarla
+            if generation is not None and not saved:
+                self._save_partial_response(conversation_id, checkpoint_id, checkpointed, full_response)
             # FIX: Siempre limpiar flag de generación
             st.session_state._generating_response = False
             st.session_state.await_response = False
@@ -581,12 +782,109 @@ class UTutorApp:
 
     
 
+    def _wait_for_queue(self, generation, placeholder):
+        """Muestra la posición en la cola del limitador mientras se espera turno - U-TUTOR v5.0"""
+        ticket = generation.ticket
+        shown = False
+        while ticket is not None and not ticket.join(0.25):
+            position = generation.queue_position()
+            if position:
+                placeholder.info(
+                    f"⏳ Hay muchas consultas en este momento. Tu pregunta está en la posición "
+                    f"**{position}** de la cola; Jake responderá en cuanto sea su turno."
+                )
+                shown = True
+        if shown:
+            placeholder.empty()
+
+    def _checkpoint_partial(self, conversation_id: int, message_id: Optional[int],
+                            content: str) -> Optional[int]:
+        """Guarda (o actualiza) la respuesta parcial en la BD - U-TUTOR v5.0"""
+        try:
+            if message_id is None:
+                return self.db_manager.insert_partial_message(conversation_id, content)
+            self.db_manager.update_partial_message(message_id, content)
+        except Exception as e:
+            print(f"⚠️ [LOG] Error guardando checkpoint de la respuesta: {e}")
+        return message_id
+
+    def _save_partial_response(self, conversation_id: int, message_id: Optional[int],
+                               checkpointed: str, content: str):
+        """
+        Deja guardada una respuesta interrumpida para ofrecer "Continuar" - U-TUTOR v5.0
+        """
+        if not content.strip():
+            return
+        if content != checkpointed or message_id is None:
+            message_id = self._checkpoint_partial(conversation_id, message_id, content)
+        if message_id is None:
+            return
+        print(f"💾 [LOG] Respuesta parcial guardada ({len(content)} caracteres)")
+
+        # Si el usuario sigue en la conversación, mostrarla ya con la opción de continuar
+        if conversation_id == st.session_state.current_conversation_id:
+            partial_message = {"role": "assistant", "content": content}
+            if st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
+                st.session_state.messages[-1] = partial_message
+            else:
+                st.session_state.messages.append(partial_message)
+            st.session_state.partial_message = {
+                "conversation_id": conversation_id, "id": message_id, "content": content
+            }
+
+    def _record_response_metrics(self, full_response: str, start_time: float,
+                                 first_token_time: Optional[float], chunk_count: int) -> dict:
+        """
+        Registra TTFT y tokens/s de la respuesta en la sesión - U-TUTOR v5.0
+
+        Returns:
+            Métricas a guardar con el mensaje (model es None si vino de la caché)
+        """
+        end_time = time.perf_counter()
+        completion_tokens = self.chat_manager.count_tokens(full_response)
+        generation_seconds = end_time - (first_token_time or end_time)
+        served_model = self.chat_manager.last_served_model
+        prompt_tokens = (self.chat_manager.last_context_stats or {}).get("prompt_tokens", 0)
+        route = self.chat_manager.last_route
+        metrics = {
+            "ttft_ms": round((first_token_time - start_time) * 1000, 1) if first_token_time else None,
+            "total_ms": round((end_time - start_time) * 1000, 1),
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": round(completion_tokens / generation_seconds, 1) if generation_seconds > 0 else None,
+            "chunks": chunk_count,
+            # Modelo que respondió realmente (puede ser uno de respaldo)
+            "model": served_model or "caché",
+            "route": route.route if route else None,
+            "cost_usd": estimate_cost(served_model, prompt_tokens, completion_tokens) if served_model else 0.0,
+        }
+        if route and self.chat_manager.query_router:
+            self.chat_manager.query_router.record(
+                route.route, metrics["ttft_ms"], metrics["total_ms"], metrics["cost_usd"],
+                prompt_tokens + completion_tokens
+            )
+        st.session_state.last_response_metrics = metrics
+        st.session_state.response_metrics = (st.session_state.get('response_metrics', []) + [metrics])[-50:]
+        print(f"⏱️ [LOG] TTFT {metrics['ttft_ms']} ms, {completion_tokens} tokens, "
+              f"{metrics['tokens_per_second']} tokens/s, total {metrics['total_ms']} ms ({metrics['model']})")
+        # Una respuesta de la caché no consumió tokens del modelo
+        return {
+            "model": served_model,
+            "prompt_tokens": prompt_tokens if served_model else 0,
+            "completion_tokens": completion_tokens if served_model else 0,
+            "ttft_ms": metrics["ttft_ms"],
+            "total_ms": metrics["total_ms"],
+        }
+
     def _handle_api_error(self, error: Exception):
         """Maneja errores de la API con mensajes específicos - U-TUTOR v5.0"""
         error_str = str(error).lower()
         error_type = type(error).__name__
         
-        if "rate_limit" in error_str or "429" in error_str:
+        if isinstance(error, RateLimitExceeded):
+            st.warning("⏳ **Demasiadas consultas en cola**")
+            st.info("El tutor está atendiendo a muchos estudiantes a la vez. Intenta de nuevo en unos segundos.")
+
+        elif "rate_limit" in error_str or "429" in error_str:
             st.error("⏳ **Límite de solicitudes alcanzado**")
             st.info("Has realizado demasiadas solicitudes. Por favor, espera unos minutos antes de intentar nuevamente.")
         
@@ -0,0 +1,249 @@
+# U-TUTOR v5.0 - Persistencia diferida (write-behind) de mensajes con group commit
+"""
+Cola acotada + hilo escritor que guarda mensajes en lotes.
+
+``save_message`` deja de escribir en el hilo del script de Streamlit: solo
+encola el mensaje y retorna. Un hilo en segundo plano agrupa lo que haya en
+la cola (hasta ``batch_size`` mensajes o ``linger_ms`` de espera) y lo
+confirma en una sola transacción con ``executemany``.
+
+Garantías:
+- La cola es acotada: si se llena, ``enqueue`` bloquea (backpressure) en vez
+  de crecer sin límite.
+- ``flush(conversation_id)`` espera solo a los mensajes ya encolados de esa
+  conversación (o de todas si es None); DatabaseManager lo llama antes de
+  leer mensajes para conservar read-your-writes sin frenar a otras sesiones.
+- ``close()`` (registrado con atexit) vacía la cola antes de terminar.
+- Un lote que falla se reintenta con espera creciente (SQLite bloqueado) y,
+  si sigue fallando, se guarda mensaje por mensaje. Los que aun así fallan
+  no se descartan: quedan en ``failed_rows`` (``retry_failed()`` los vuelve a
+  encolar), ``flush()`` retorna False para su conversación y el error queda
+  en las métricas.
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+# Marcas de control para el hilo escritor
+_STOP = object()
+_FLUSH = object()  # Confirma el lote actual sin esperar linger_ms
+
+
+class MessageWriter:
+    """Escritor en segundo plano de mensajes con commits agrupados"""
+
+    def __init__(self, db_manager, max_queue: int = 1000, batch_size: int = 100,
+                 linger_ms: float = 20.0, max_retries: int = 3, retry_delay_ms: float = 100.0):
+        """
+        Args:
+            db_manager: DatabaseManager con el método write_messages_batch
+            max_queue: Capacidad máxima de la cola
+            batch_size: Máximo de mensajes por transacción
+            linger_ms: Tiempo que se espera para juntar más mensajes en un lote
+            max_retries: Reintentos de un lote que falla antes de guardarlo mensaje por mensaje
+            retry_delay_ms: Espera antes del primer reintento (se duplica en cada uno)
+        """
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        # Números de secuencia: los lotes se confirman en orden FIFO, así que
+        # "todo lo encolado hasta N está guardado" equivale a committed_seq >= N
+        self._cond = threading.Condition()
+        self._enqueue_lock = threading.Lock()
+        self._enqueued_seq = 0
+        self._committed_seq = 0
+        # Solo conversaciones con mensajes sin confirmar (se poda en cada lote)
+        self._last_seq_by_conversation: Dict[int, int] = {}
+        # Mensajes que no se pudieron guardar: (conversation_id, role, content, metrics)
+        self.failed_rows: List[tuple] = []
+        self._failed_conversations: Set[int] = set()
+        self.last_error: Optional[str] = None
+
+        # Métricas
+        self.committed_messages = 0
+        self.committed_batches = 0
+        self.failed_messages = 0
+        self.total_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self.last_commit_ms = 0.0
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ututor-message-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, conversation_id: int, role: str, content: str,
+                metrics: Optional[dict] = None):
+        """Encola un mensaje (y sus métricas, si las hay) para guardarlo en el próximo lote"""
+        if self._closed:
+            raise RuntimeError("MessageWriter cerrado")
+        # _enqueue_lock mantiene el orden de la cola igual al de la secuencia; el put
+        # (que puede bloquear si la cola está llena) queda fuera de _cond para no
+        # trabar al hilo escritor
+        with self._enqueue_lock:
+            with self._cond:
+                self._enqueued_seq += 1
+                seq = self._enqueued_seq
+                self._last_seq_by_conversation[conversation_id] = seq
+            self.queue.put((seq, conversation_id, role, content, metrics))
+
+    def flush(self, conversation_id: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Bloquea hasta que los mensajes ya encolados estén confirmados.
+
+        Args:
+            conversation_id: Solo esperar a los mensajes de esta conversación
+            timeout: Segundos máximos de espera (None = sin límite)
+
+        Returns:
+            True si todo lo pedido quedó guardado (False si algún mensaje falló;
+            ver failed_rows)
+        """
+        def saved() -> bool:
+            if conversation_id is None:
+                return not self._failed_conversations
+            return conversation_id not in self._failed_conversations
+
+        with self._cond:
+            if conversation_id is None:
+                target = self._enqueued_seq
+            else:
+                target = self._last_seq_by_conversation.get(conversation_id, 0)
+            if self._committed_seq >= target:
+                return saved()
+
+        # Despertar al escritor para que no espere linger_ms
+        self.queue.put(_FLUSH)
+
+        with self._cond:
+            return self._cond.wait_for(lambda: self._committed_seq >= target, timeout) and saved()
+
+    def retry_failed(self) -> int:
+        """
+        Vuelve a encolar los mensajes que no se pudieron guardar.
+
+        Returns:
+            Mensajes reencolados
+        """
+        with self._cond:
+            rows = self.failed_rows
+            self.failed_rows = []
+            self._failed_conversations.clear()
+        for row in rows:
+            self.enqueue(*row)
+        return len(rows)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Vacía la cola y detiene el hilo escritor"""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def get_metrics(self) -> dict:
+        """Retorna profundidad de cola y latencias de commit"""
+        with self._cond:
+            batches = self.committed_batches
+            return {
+                "queue_depth": self._enqueued_seq - self._committed_seq,
+                "queue_capacity": self.queue.maxsize,
+                "committed_messages": self.committed_messages,
+                "committed_batches": batches,
+                "failed_messages": self.failed_messages,
+                "pending_failed": len(self.failed_rows),
+                "last_error": self.last_error,
+                "avg_batch_size": round(self.committed_messages / batches, 1) if batches else 0,
+                "avg_commit_ms": round(self.total_commit_ms / batches, 2) if batches else 0,
+                "max_commit_ms": round(self.max_commit_ms, 2),
+                "last_commit_ms": round(self.last_commit_ms, 2),
+            }
+
+    def _collect_batch(self, first_item) -> Tuple[List[tuple], bool]:
+        """Junta mensajes hasta llenar el lote, agotar linger_ms o recibir una marca"""
+        batch = [first_item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            if item is _FLUSH:
+                break
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        """Bucle del hilo escritor"""
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            if item is _FLUSH:
+                continue
+
+            batch, stopping = self._collect_batch(item)
+            rows = [item[1:] for item in batch]
+            start_time = time.perf_counter()
+            failed = self._write(rows)
+
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            with self._cond:
+                if len(failed) < len(rows):
+                    self.committed_messages += len(rows) - len(failed)
+                    self.committed_batches += 1
+                    self.total_commit_ms += elapsed_ms
+                    self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+                    self.last_commit_ms = elapsed_ms
+                if failed:
+                    self.failed_messages += len(failed)
+                    self.failed_rows.extend(failed)
+                    self._failed_conversations.update(row[0] for row in failed)
+                # Los fallidos también cuentan como procesados para no bloquear flush()
+                self._committed_seq = batch[-1][0]
+                for conversation_id, seq in list(self._last_seq_by_conversation.items()):
+                    if seq <= self._committed_seq:
+                        del self._last_seq_by_conversation[conversation_id]
+                self._cond.notify_all()
+
+    def _write(self, rows: List[tuple]) -> List[tuple]:
+        """
+        Guarda un lote con reintentos; si sigue fallando, mensaje por mensaje.
+
+        Returns:
+            Los mensajes que no se pudieron guardar
+        """
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.db_manager.write_messages_batch(rows)
+                return []
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ [WRITER] Error guardando lote de {len(rows)} mensajes "
+                      f"(intento {attempt + 1}/{self.max_retries + 1}): {e}")
+            if attempt < self.max_retries:
+                time.sleep(delay)
+                delay *= 2
+
+        # Aislar el mensaje que falla para no perder el resto del lote
+        failed = []
+        for row in rows:
+            try:
+                self.db_manager.write_messages_batch([row])
+            except Exception as e:
+                self.last_error = str(e)
+                failed.append(row)
+        if failed:
+            print(f"❌ [WRITER] {len(failed)} mensajes sin guardar; quedan en failed_rows para reintentar")
+        return failed
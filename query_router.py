@@ -0,0 +1,215 @@
+# U-TUTOR v5.0 - Enrutamiento de preguntas: modelo económico para las simples
+"""
+Clasificador local (sin llamadas a la API) de la complejidad de cada pregunta.
+
+Las preguntas cortas o factuales ("¿qué es un número primo?") van al modelo
+rápido y barato (``ROUTER_CHEAP_MODEL``); las que piden varios pasos, código,
+desarrollo matemático o llegan en conversaciones largas van al modelo
+elegido por el usuario. La puntuación combina:
+
+- longitud de la pregunta
+- materia detectada (ver ``detect_subject``)
+- presencia de código o de notación matemática
+- pedidos de varios pasos (paso a paso, demuestra, compara...) o varias preguntas
+- profundidad de la conversación
+
+``QueryRouter`` guarda además latencia y costo estimado por ruta para la
+pestaña de estadísticas.
+"""
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+
+# QUERY_ROUTER=1 activa el enrutamiento
+QUERY_ROUTER = os.getenv("QUERY_ROUTER", "0") == "1"
+ROUTER_CHEAP_MODEL = os.getenv("ROUTER_CHEAP_MODEL", "gpt-4o-mini")
+# Puntuación a partir de la cual la pregunta se considera compleja (0-1)
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.35"))
+
+ROUTE_SIMPLE = "simple"
+ROUTE_COMPLEX = "compleja"
+
+# Precio en USD por millón de tokens (entrada, salida) para estimar costos
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+
+# Palabras clave (sin tildes) por materia; en caso de empate gana la primera.
+# Se comparan con palabras completas (admiten plural: "ecuaciones"); las que
+# terminan en "*" son raíces y cubren cualquier palabra que empiece así
+# ("trigonometr*" -> "trigonometria", "trigonometrico").
+SUBJECT_KEYWORDS = {
+    "Matemáticas": ["ecuacion", "integral", "derivada", "limite", "matriz", "algebra", "calculo",
+                    "funcion", "polinomio", "probabilidad", "estadistica", "geometria", "vector",
+                    "primo", "logaritmo", "trigonometr*", "teorema", "fraccion"],
+    "Programación": ["python", "java", "codigo", "program*", "algoritmo", "variable", "clase",
+                     "objeto", "bucle", "recursi*", "compilador", "sql", "javascript", "arreglo",
+                     "lista enlazada", "base de datos", "poo", "api", "html"],
+    "Física": ["fuerza", "velocidad", "aceleracion", "energia", "newton", "masa", "gravedad",
+               "electric*", "magnet*", "cinematica", "dinamica", "termodinamica", "onda"],
+    "Química": ["quimic*", "molecula", "atomo", "reaccion", "enlace", "mol", "acido", "base",
+                "tabla periodica", "estequiometr*", "oxidacion"],
+    "Biología": ["celula", "adn", "fotosintesis", "organismo", "evolucion", "gen", "proteina",
+                 "ecosistema", "biolog*", "mitosis", "bacteria"],
+    "Historia": ["historia", "guerra", "revolucion", "imperio", "siglo", "independencia",
+                 "civilizacion", "colonia"],
+    "Economía": ["economia", "mercado", "oferta", "demanda", "inflacion", "pib", "costo",
+                 "contabilidad", "finanzas"],
+    "Lenguaje": ["gramatica", "ortografia", "ensayo", "redaccion", "verbo", "literatura",
+                 "poema", "sintaxis", "ingles"],
+}
+_TECHNICAL_SUBJECTS = {"Matemáticas", "Programación", "Física", "Química"}
+
+_CODE = re.compile(r"```|\bdef |\bclass |\bimport |\breturn\b|[{};]\s*$|=>|\w+\(\)|</?\w+>", re.MULTILINE)
+_CODE_REQUEST = re.compile(r"\b(implementa|programa|codigo|script|funcion en|depura|error en mi)\b")
+_MATH = re.compile(r"\d\s*[-+*/^=]\s*\d|[a-z]\s*\^\s*\d|\\frac|\\int|[∫∑√π≤≥≠]|\bdx\b|\bsen\(|\bcos\(|\blog\(")
+_MULTI_STEP = re.compile(
+    r"\b(paso a paso|explica por que|demuestra|demostrar|compara|analiza|diseña|disena|resuelve|"
+    r"desarrolla|deduce|justifica|diferencias entre|ventajas y desventajas|optimiza|calcula)\b"
+)
+_FACTUAL = re.compile(r"^\W*(que es|que son|quien (fue|es)|cuando|donde|define|definicion de|"
+                      r"que significa|significado de|cual es la formula)\b")
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def keyword_pattern(keyword: str) -> str:
+    """Regex de una palabra clave: palabra completa (o su plural), o raíz si termina en *"""
+    if keyword.endswith("*"):
+        return r"\b" + re.escape(keyword[:-1]) + r"\w*"
+    return r"\b" + r"\s+".join(map(re.escape, keyword.split())) + r"(?:s|es)?\b"
+
+
+_SUBJECT_PATTERNS = {
+    subject: [re.compile(keyword_pattern(keyword)) for keyword in keywords]
+    for subject, keywords in SUBJECT_KEYWORDS.items()
+}
+
+
+def detect_subject(text: str) -> Optional[str]:
+    """Materia con más palabras clave en el texto, o None"""
+    normalized = _normalize(text)
+    best, best_hits = None, 0
+    for subject, patterns in _SUBJECT_PATTERNS.items():
+        hits = sum(1 for pattern in patterns if pattern.search(normalized))
+        if hits > best_hits:
+            best, best_hits = subject, hits
+    return best
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Costo estimado en USD (0 si el modelo no tiene precio conocido)"""
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+class RouteDecision:
+    """Resultado del enrutamiento de una pregunta"""
+
+    def __init__(self, route: str, model: str, score: float, subject: Optional[str] = None,
+                 reasons: Optional[List[str]] = None):
+        self.route = route
+        self.model = model
+        self.score = score
+        self.subject = subject
+        self.reasons = reasons or []
+
+
+class QueryRouter:
+    """Elige el modelo de cada pregunta y acumula métricas por ruta"""
+
+    def __init__(self, cheap_model: str = ROUTER_CHEAP_MODEL, threshold: float = ROUTER_THRESHOLD):
+        """
+        Args:
+            cheap_model: Modelo para las preguntas simples
+            threshold: Puntuación mínima (0-1) para considerar compleja una pregunta
+        """
+        self.cheap_model = cheap_model
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # ruta -> acumulados de respuestas, latencias, costo y tokens
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def score(self, question: str, depth: int = 0) -> RouteDecision:
+        """
+        Puntúa la complejidad de una pregunta (sin decidir el modelo).
+
+        Args:
+            question: Último mensaje del estudiante
+            depth: Mensajes anteriores en la conversación
+        """
+        normalized = _normalize(question)
+        reasons = []
+        score = min(len(normalized.split()) / 80, 1.0) * 0.3
+
+        subject = detect_subject(question)
+        if subject in _TECHNICAL_SUBJECTS:
+            score += 0.1
+            reasons.append(f"materia: {subject}")
+        if _CODE.search(question) or _CODE_REQUEST.search(normalized):
+            score += 0.3
+            reasons.append("código")
+        if _MATH.search(normalized):
+            score += 0.2
+            reasons.append("notación matemática")
+        multi_step = len(_MULTI_STEP.findall(normalized))
+        if multi_step:
+            score += min(0.2 * multi_step, 0.35)
+            reasons.append("varios pasos")
+        if question.count("?") > 1:
+            score += 0.1
+            reasons.append("varias preguntas")
+        if depth:
+            score += min(depth / 20, 1.0) * 0.15
+        if _FACTUAL.search(normalized):
+            score -= 0.2
+            reasons.append("factual")
+
+        score = round(max(0.0, min(score, 1.0)), 3)
+        route = ROUTE_COMPLEX if score >= self.threshold else ROUTE_SIMPLE
+        return RouteDecision(route, "", score, subject, reasons)
+
+    def route(self, messages: List[Dict[str, str]], strong_model: str) -> RouteDecision:
+        """Decide el modelo para el último mensaje del estudiante"""
+        question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        decision = self.score(question, depth=max(len(messages) - 1, 0))
+        decision.model = strong_model if decision.route == ROUTE_COMPLEX else self.cheap_model
+        return decision
+
+    def record(self, route: str, ttft_ms: Optional[float], total_ms: float, cost_usd: float, tokens: int):
+        """Acumula la latencia y el costo de una respuesta servida por ``route``"""
+        with self._lock:
+            stats = self._stats.setdefault(
+                route, {"count": 0, "ttft_ms": 0.0, "ttft_count": 0, "total_ms": 0.0, "cost_usd": 0.0, "tokens": 0}
+            )
+            stats["count"] += 1
+            if ttft_ms is not None:
+                stats["ttft_ms"] += ttft_ms
+                stats["ttft_count"] += 1
+            stats["total_ms"] += total_ms
+            stats["cost_usd"] += cost_usd
+            stats["tokens"] += tokens
+
+    def get_metrics(self) -> Dict[str, dict]:
+        """Por ruta: respuestas, TTFT y tiempo total promedio, costo acumulado"""
+        with self._lock:
+            return {
+                route: {
+                    "count": int(s["count"]),
+                    "avg_ttft_ms": round(s["ttft_ms"] / s["ttft_count"], 1) if s["ttft_count"] else None,
+                    "avg_total_ms": round(s["total_ms"] / s["count"], 1),
+                    "cost_usd": round(s["cost_usd"], 4),
+                    "tokens": int(s["tokens"]),
+                }
+                for route, s in self._stats.items()
+            }
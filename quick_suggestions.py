@@ -0,0 +1,126 @@
+# U-TUTOR v5.0 - Sugerencias rápidas y precalentamiento de sus respuestas
+"""
+Las sugerencias de la pantalla de nueva conversación son el primer mensaje
+más común, así que sus respuestas se pregeneran en la caché de respuestas.
+
+``SuggestionWarmer`` corre en un hilo de fondo: al iniciar y luego cada
+``SUGGESTION_REFRESH_HOURS / 2`` recorre personalidades x modelos x
+sugerencias y genera las respuestas que falten o tengan más de
+``SUGGESTION_REFRESH_HOURS``. La clave de caché es la misma que la de un clic
+(misma personalidad, modelo y temperatura), así que la respuesta se pinta al
+instante desde ``response_cache`` sin llamar al modelo.
+
+La lista vive aquí junto con el precalentamiento: cambiar una sugerencia
+precalienta la nueva en el próximo ciclo.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+# (emoji, texto) que se muestran en la pantalla de nueva conversación
+QUICK_SUGGESTIONS = [
+    ("📐", "Explícame el teorema de Pitágoras"),
+    ("🌱", "¿Cómo funciona la fotosíntesis?"),
+    ("➗", "Ayúdame con ecuaciones cuadráticas"),
+    ("💻", "¿Qué es la programación orientada a objetos?"),
+    ("🧪", "Explica la tabla periódica"),
+    ("📊", "¿Qué es la estadística descriptiva?"),
+]
+
+# SUGGESTION_WARMUP=1 activa el precalentamiento (cada ronda son llamadas pagadas al modelo)
+SUGGESTION_WARMUP = os.getenv("SUGGESTION_WARMUP", "0") == "1"
+# Modelos a precalentar, separados por comas (vacío = solo el modelo por defecto de la app)
+SUGGESTION_WARMUP_MODELS = [m.strip() for m in os.getenv("SUGGESTION_WARMUP_MODELS", "").split(",") if m.strip()]
+# Edad máxima de una respuesta precalentada antes de regenerarla (menor que RESPONSE_CACHE_TTL)
+SUGGESTION_REFRESH_HOURS = float(os.getenv("SUGGESTION_REFRESH_HOURS", "24"))
+
+
+class SuggestionWarmer:
+    """Hilo que mantiene en caché las respuestas de las sugerencias rápidas"""
+
+    def __init__(self, chat_manager, personalities: Iterable[str], models: List[str],
+                 refresh_hours: float = SUGGESTION_REFRESH_HOURS,
+                 suggestions: Optional[List[tuple]] = None):
+        """
+        Args:
+            chat_manager: ChatManager propio del precalentador (con la caché de
+                          respuestas y la temperatura de las sesiones nuevas)
+            personalities: Personalidades a precalentar
+            models: Modelos a precalentar
+            refresh_hours: Edad máxima de una respuesta antes de regenerarla
+            suggestions: (emoji, texto); por defecto QUICK_SUGGESTIONS
+        """
+        self.chat_manager = chat_manager
+        self.personalities = list(personalities)
+        self.models = models
+        self.max_age = refresh_hours * 3600
+        self.suggestions = suggestions or QUICK_SUGGESTIONS
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.failed = 0
+        self.last_run: Optional[float] = None
+        self.last_run_ms = 0.0
+
+    def start(self):
+        """Lanza el hilo de precalentamiento (una sola vez)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ututor-suggestion-warmer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.warm()
+            # Revisar a mitad del periodo: ninguna respuesta supera mucho max_age
+            self._stop.wait(max(self.max_age / 2, 60))
+
+    def warm(self) -> int:
+        """
+        Genera las respuestas que faltan o vencieron.
+
+        Returns:
+            Respuestas generadas en esta pasada
+        """
+        start_time = time.perf_counter()
+        generated = 0
+        for model in self.models:
+            self.chat_manager.set_model(model)
+            for personality in self.personalities:
+                self.chat_manager.update_personality(personality)
+                for _, suggestion in self.suggestions:
+                    if self._stop.is_set():
+                        return generated
+                    try:
+                        if self.chat_manager.refresh_cached_response(
+                            [{"role": "user", "content": suggestion}], self.max_age
+                        ):
+                            generated += 1
+                    except Exception as e:
+                        with self._lock:
+                            self.failed += 1
+                        print(f"⚠️ [CACHE] No se pudo precalentar \"{suggestion}\" ({model}, {personality}): {e}")
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        with self._lock:
+            self.generated += generated
+            self.last_run = time.time()
+            self.last_run_ms = elapsed_ms
+        print(f"🔥 [CACHE] Sugerencias precalentadas: {generated} respuestas nuevas "
+              f"({len(self.models)} modelos x {len(self.personalities)} personalidades, {elapsed_ms:.0f} ms)")
+        return generated
+
+    def get_metrics(self) -> Dict[str, object]:
+        """Respuestas generadas, fallos y última pasada"""
+        with self._lock:
+            return {
+                "generated": self.generated,
+                "failed": self.failed,
+                "last_run": self.last_run,
+                "last_run_ms": round(self.last_run_ms, 1),
+            }
@@ -0,0 +1,306 @@
+# U-TUTOR v5.0 - Limitador global de llamadas a OpenAI (token bucket + prioridades)
+"""
+Un limitador por proceso delante de todas las llamadas de ``ChatManager``.
+
+Dos token buckets se rellenan de forma continua: solicitudes por minuto
+(``RATE_LIMIT_RPM``) y tokens por minuto (``RATE_LIMIT_TPM``, estimados antes
+de la llamada y ajustados con los reales al terminar). Si no hay cupo, la
+llamada espera en una cola ordenada por prioridad:
+
+- ``PRIORITY_CHAT``: respuestas que el estudiante está esperando
+- ``PRIORITY_SUMMARY``: resúmenes de memoria en segundo plano
+- ``PRIORITY_BACKGROUND``: títulos y traducciones
+
+La cola tiene un tamaño máximo: si está llena, una petición de chat expulsa a
+la de menor prioridad más reciente; si no hay a quién expulsar, se rechaza con
+``RateLimitExceeded`` (igual que si la espera supera ``RATE_LIMIT_MAX_WAIT``).
+"""
+import asyncio
+import bisect
+import itertools
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+# Cupos por minuto (0 = sin límite)
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "200000"))
+# Peticiones que pueden esperar a la vez y segundos máximos de espera
+RATE_LIMIT_MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "100"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "120"))
+# Tokens de respuesta que se reservan por llamada de chat (se ajusta al terminar)
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "600"))
+
+PRIORITY_CHAT = 0
+PRIORITY_SUMMARY = 1
+PRIORITY_BACKGROUND = 2
+
+
+class RateLimitExceeded(Exception):
+    """La petición no obtuvo cupo: cola llena o espera demasiado larga"""
+
+
+class _TokenBucket:
+    """Cupo por minuto que se rellena de forma continua"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta que haya cupo para ``amount`` (0 si ya lo hay)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # Una petición mayor que el cupo completo pasa cuando el bucket está lleno
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self.tokens -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        """Devuelve (o descuenta, si es negativo) cupo tras conocer el consumo real"""
+        if self.capacity > 0:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimitTicket:
+    """Turno de una petición en el limitador"""
+
+    def __init__(self, limiter: "RateLimiter", priority: int, tokens: int, seq: int):
+        self.limiter = limiter
+        self.priority = priority
+        self.tokens = tokens
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.error: Optional[RateLimitExceeded] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def __lt__(self, other: "RateLimitTicket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    @property
+    def done(self) -> bool:
+        """True si ya tiene cupo o fue rechazado"""
+        return self._event.is_set()
+
+    def position(self) -> int:
+        """Posición en la cola (0 si ya no está esperando)"""
+        return self.limiter.position(self)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se resuelva sin lanzar errores; retorna ``done``"""
+        return self._event.wait(timeout)
+
+    def _resolve(self, error: Optional[RateLimitExceeded] = None):
+        """Lo llama el limitador (con su lock tomado)"""
+        self.granted = error is None
+        self.error = error
+        self._event.set()
+        for callback in self._callbacks:
+            callback()
+        self._callbacks.clear()
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def wait(self, timeout: float = RATE_LIMIT_MAX_WAIT):
+        """Bloquea hasta obtener cupo"""
+        if not self._event.wait(timeout):
+            self.cancel()
+            raise RateLimitExceeded(f"Sin cupo para llamar al modelo tras {timeout:.0f} s de espera")
+        self._check()
+
+    async def wait_async(self, timeout: float = RATE_LIMIT_MAX_WAIT):
+        """Versión asíncrona de wait (no bloquea el event loop)"""
+        if not self.done:
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+
+            def wake():
+                loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+            self.limiter.add_callback(self, wake)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                self.cancel()
+                raise RateLimitExceeded(f"Sin cupo para llamar al modelo tras {timeout:.0f} s de espera")
+            except asyncio.CancelledError:
+                self.cancel()
+                # Cupo concedido justo antes de cancelar: la llamada no se hará
+                self.release()
+                raise
+        self._check()
+
+    def cancel(self):
+        """Retira la petición de la cola (sin efecto si ya tenía cupo)"""
+        self.limiter.withdraw(self)
+
+    def settle(self, actual_tokens: int):
+        """Ajusta el cupo de tokens con el consumo real de la llamada"""
+        if self.granted:
+            self.limiter.settle(self.tokens - actual_tokens)
+
+    def release(self):
+        """Devuelve el cupo completo (solicitud y tokens) de una llamada que no se hizo"""
+        if self.granted:
+            self.granted = False
+            self.limiter.release(self.tokens)
+
+
+class RateLimiter:
+    """Token buckets de RPM/TPM con cola de prioridad acotada"""
+
+    def __init__(self, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM,
+                 max_queue: int = RATE_LIMIT_MAX_QUEUE):
+        """
+        Args:
+            rpm: Solicitudes por minuto (0 = sin límite)
+            tpm: Tokens por minuto (0 = sin límite)
+            max_queue: Peticiones que pueden esperar a la vez
+        """
+        self._requests = _TokenBucket(rpm)
+        self._tokens = _TokenBucket(tpm)
+        self.max_queue = max_queue
+        self._queue: List[RateLimitTicket] = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self.granted = 0
+        self.rejected = 0
+        self.queued = 0
+        self._total_wait = 0.0
+
+    def _available(self, tokens: int, now: float) -> float:
+        return max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+
+    def _grant(self, ticket: RateLimitTicket, now: float):
+        self._requests.take(1)
+        self._tokens.take(ticket.tokens)
+        self.granted += 1
+        self._total_wait += now - ticket.enqueued_at
+        ticket._resolve()
+
+    def enqueue(self, priority: int, tokens: int) -> RateLimitTicket:
+        """
+        Pide cupo para una llamada sin bloquear.
+
+        Args:
+            priority: PRIORITY_CHAT, PRIORITY_SUMMARY o PRIORITY_BACKGROUND
+            tokens: Tokens estimados (prompt + respuesta esperada)
+
+        Returns:
+            Ticket ya resuelto si había cupo, o en cola
+
+        Raises:
+            RateLimitExceeded: Si la cola está llena
+        """
+        with self._cond:
+            ticket = RateLimitTicket(self, priority, tokens, next(self._seq))
+            now = time.monotonic()
+            if not self._queue and self._available(tokens, now) == 0:
+                self._grant(ticket, now)
+                return ticket
+
+            if len(self._queue) >= self.max_queue:
+                # Expulsar a la petición menos prioritaria si lo es menos que esta
+                worst = self._queue[-1]
+                if worst.priority <= priority:
+                    self.rejected += 1
+                    raise RateLimitExceeded("La cola de peticiones al modelo está llena")
+                self._queue.pop()
+                self.rejected += 1
+                worst._resolve(RateLimitExceeded("Petición desplazada por otra de mayor prioridad"))
+
+            bisect.insort(self._queue, ticket)
+            self.queued += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ututor-rate-limiter", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return ticket
+
+    def _run(self):
+        """Hilo despachador: da cupo al primero de la cola cuando lo hay"""
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                ticket = self._queue[0]
+                now = time.monotonic()
+                delay = self._available(ticket.tokens, now)
+                if delay > 0:
+                    # Se despierta antes si llega una petición más prioritaria
+                    self._cond.wait(delay)
+                    continue
+                self._queue.pop(0)
+                self._grant(ticket, now)
+
+    def add_callback(self, ticket: RateLimitTicket, callback: Callable[[], None]):
+        """Ejecuta ``callback`` cuando el ticket se resuelva (ya, si lo está)"""
+        with self._cond:
+            if not ticket.done:
+                ticket._callbacks.append(callback)
+                return
+        callback()
+
+    def withdraw(self, ticket: RateLimitTicket):
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                ticket._resolve(RateLimitExceeded("Petición cancelada"))
+                self._cond.notify()
+
+    def settle(self, token_delta: int):
+        with self._cond:
+            self._tokens.give(token_delta)
+            self._cond.notify()
+
+    def release(self, tokens: int):
+        with self._cond:
+            self._requests.give(1)
+            self._tokens.give(tokens)
+            self._cond.notify()
+
+    def position(self, ticket: RateLimitTicket) -> int:
+        with self._cond:
+            if ticket.done:
+                return 0
+            return bisect.bisect_left(self._queue, ticket) + 1
+
+    def get_metrics(self) -> dict:
+        """Peticiones en cola, atendidas y rechazadas, y espera promedio"""
+        with self._cond:
+            return {
+                "waiting": len(self._queue),
+                "granted": self.granted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self._total_wait / self.granted * 1000, 1) if self.granted else 0,
+            }
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Retorna el limitador compartido del proceso (lo crea la primera vez)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,146 @@
+# U-TUTOR v5.0 - Caché exacta de respuestas del modelo (SQLite, TTL + LRU)
+"""
+Evita repetir llamadas al modelo para peticiones idénticas.
+
+La clave es un hash SHA-256 de: modelo, temperatura y los mensajes que se
+enviarían a la API (mensaje de sistema/personalidad incluido) normalizados:
+espacios colapsados y sin distinguir mayúsculas. Así la misma sugerencia
+rápida o la misma primera pregunta con la misma configuración se sirve desde
+la tabla ``response_cache`` sin ir a OpenAI.
+
+Las entradas vencen tras ``ttl_seconds`` y, si la tabla supera
+``max_entries``, se expulsan las de acceso más antiguo.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+# Tiempo de vida de una respuesta cacheada (por defecto 7 días)
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+# Máximo de respuestas guardadas
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Colapsa espacios y elimina diferencias de mayúsculas"""
+    return _WHITESPACE.sub(" ", str(text)).strip().casefold()
+
+
+def make_cache_key(model: str, temperature: float, api_messages: List[tuple]) -> str:
+    """
+    Hash de una petición al modelo.
+
+    Args:
+        model: Nombre del modelo
+        temperature: Temperatura de muestreo
+        api_messages: [(rol, contenido)] tal como se enviarían a la API
+    """
+    payload = {
+        "model": model,
+        "temperature": round(float(temperature), 3),
+        "messages": [(role, normalize_text(content)) for role, content in api_messages],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Caché persistente de respuestas con vencimiento y expulsión LRU"""
+
+    def __init__(self, db_manager, ttl_seconds: int = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            db_manager: DatabaseManager con la tabla response_cache
+            ttl_seconds: Segundos que una respuesta sigue siendo válida
+            max_entries: Respuestas máximas antes de expulsar las menos usadas
+        """
+        self.db_manager = db_manager
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, cache_key: str) -> Optional[str]:
+        """Lee una respuesta sin contarla en las métricas (la usa la caché semántica)"""
+        try:
+            return self.db_manager.get_cached_response(cache_key, time.time() - self.ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ [CACHE] Error leyendo caché de respuestas: {e}")
+            return None
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Retorna la respuesta cacheada o None"""
+        response = self.fetch(cache_key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def age(self, cache_key: str) -> Optional[float]:
+        """Segundos desde que se guardó la respuesta (None si no existe o venció)"""
+        try:
+            created_at = self.db_manager.get_cached_response_created_at(cache_key)
+        except Exception as e:
+            print(f"⚠️ [CACHE] Error leyendo caché de respuestas: {e}")
+            return None
+        if created_at is None:
+            return None
+        age = time.time() - created_at
+        return age if age < self.ttl_seconds else None
+
+    def put(self, cache_key: str, model: str, response: str,
+            question: Optional[str] = None, partition: Optional[str] = None) -> bool:
+        """
+        Guarda una respuesta completa (las vacías no se cachean).
+
+        Args:
+            question / partition: Pregunta y partición para la caché semántica
+
+        Returns:
+            True si se guardó
+        """
+        if not response or not response.strip():
+            return False
+        try:
+            self.db_manager.save_cached_response(
+                cache_key, model, response, self.max_entries, time.time() - self.ttl_seconds,
+                question, partition
+            )
+            return True
+        except Exception as e:
+            print(f"⚠️ [CACHE] Error guardando en caché de respuestas: {e}")
+            return False
+
+    def iter_questions(self) -> Iterator[Tuple[str, str, str]]:
+        """(cache_key, partición, pregunta) de las respuestas indexables semánticamente"""
+        return self.db_manager.iter_cached_questions(time.time() - self.ttl_seconds)
+
+    def clear(self):
+        """Elimina todas las respuestas cacheadas y reinicia los contadores"""
+        self.db_manager.clear_response_cache()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_metrics(self) -> dict:
+        """Aciertos, fallos y tamaño de la caché"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups * 100, 1) if lookups else 0,
+            "entries": self.db_manager.get_response_cache_size(),
+            "max_entries": self.max_entries,
+        }
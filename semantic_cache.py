@@ -0,0 +1,314 @@
+# U-TUTOR v5.0 - Caché semántica de primeras preguntas con embeddings locales
+"""
+Reutiliza respuestas de preguntas casi idénticas ("¿cómo funciona la
+fotosíntesis?" ~ "explica la fotosíntesis") sin llamar al modelo.
+
+Todo es local y sin conexión:
+
+- Embedding: vectorizador por hashing (palabras de contenido + trigramas de
+  caracteres, sin tildes ni palabras vacías del español) de ``VECTOR_DIM``
+  dimensiones, normalizado (coseno = producto punto).
+- Índice: por partición (personalidad + modelo + temperatura) una matriz NumPy float32 (1 KB por pregunta) y
+  un índice invertido por raíz de palabra. La consulta solo puntúa las filas
+  que comparten alguna raíz con la pregunta (las raíces más raras primero,
+  hasta ``MAX_CANDIDATES``), así el costo no crece con el tamaño de la caché.
+- Seguridad: además del umbral de similitud, números y letras sueltas
+  ("x^2" vs "x^3") deben coincidir exactamente.
+
+Las respuestas viven en ``response_cache`` (misma TTL y LRU); el índice solo
+guarda la clave de cada una y se reconstruye al iniciar desde esa tabla.
+Solo se cachean primeras preguntas: después la respuesta depende del hilo.
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Dimensiones del embedding por hashing
+VECTOR_DIM = 256
+# Similitud coseno mínima para considerar dos preguntas equivalentes
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+# Preguntas máximas por partición (al llenarse se descartan las más antiguas)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+# Filas máximas puntuadas por consulta
+MAX_CANDIDATES = 1024
+# Peso de cada trigrama de caracteres frente a una palabra completa (1.0)
+CHAR_NGRAM_WEIGHT = 0.3
+# Longitud de la raíz usada en el índice invertido ("derivada" ~ "derivadas")
+STEM_LENGTH = 5
+
+STOPWORDS = frozenset("""
+a al algo algun alguna alguno algunos ante antes aqui asi cada como con contra cual cuales
+cuando de del desde donde dos e el ella ellas ellos en entre era es esa ese eso esta este esto
+estos fue ha hay la las le les lo los mas me mi mis muy ni no nos o otra otro para pero poco por
+porque que quien se ser si sin sobre son su sus tambien te tiene tu un una uno unos y ya yo
+""".split())
+
+# Palabras que solo enmarcan la pregunta ("explícame", "qué es", "dime")
+FRAMING_WORDS = frozenset("""
+ayudame ayuda cuentame define definicion defineme dime entender explica explicame explicar
+explicacion favor funciona funcionan hablame puedes podrias quiero saber significa sirve
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(text: str) -> str:
+    """Minúsculas y sin tildes ("Fotosíntesis" -> "fotosintesis")"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _stable_hash(value: str) -> int:
+    """Hash estable entre procesos (hash() de Python cambia en cada arranque)"""
+    return zlib.crc32(value.encode("utf-8"))
+
+
+class QuestionVectorizer:
+    """Embedding por hashing de una pregunta corta"""
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+
+    def tokenize(self, text: str) -> List[str]:
+        """Palabras de contenido de la pregunta"""
+        return [
+            token for token in _TOKEN_RE.findall(normalize_question(text))
+            if token not in STOPWORDS and token not in FRAMING_WORDS
+        ]
+
+    def vectorize(self, text: str) -> Tuple[Optional["np.ndarray"], List[int], int]:
+        """
+        Returns:
+            (vector normalizado o None si no hay palabras de contenido,
+             raíces para el índice invertido, firma de números/letras sueltas)
+        """
+        tokens = self.tokenize(text)
+        if not tokens:
+            return None, [], 0
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokens:
+            features = [(f"w:{token}", 1.0)]
+            padded = f" {token} "
+            features.extend(
+                (f"c:{padded[i:i + 3]}", CHAR_NGRAM_WEIGHT) for i in range(len(padded) - 2)
+            )
+            for feature, weight in features:
+                hashed = _stable_hash(feature)
+                # El bit de signo reduce el sesgo de las colisiones
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                vector[hashed % self.dim] += sign * weight
+
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None, [], 0
+
+        stems = sorted({_stable_hash(token[:STEM_LENGTH]) for token in tokens})
+        guard_tokens = sorted({token for token in tokens if token.isdigit() or len(token) == 1})
+        guard = _stable_hash("|".join(guard_tokens))
+        return vector / norm, stems, guard
+
+
+class _PartitionIndex:
+    """Matriz de embeddings + índice invertido de una personalidad y modelo"""
+
+    def __init__(self, dim: int, max_entries: int):
+        self.dim = dim
+        self.max_entries = max_entries
+        self._reset()
+
+    def _reset(self):
+        """Deja el índice vacío"""
+        self.size = 0
+        self.vectors = np.zeros((64, self.dim), dtype=np.float32)
+        self.guards = np.zeros(64, dtype=np.uint32)
+        self.alive = np.zeros(64, dtype=bool)
+        self.keys: List[str] = []
+        self.row_stems: List[List[int]] = []
+        self.postings: Dict[int, array] = {}
+        self.row_by_key: Dict[str, int] = {}
+
+    def _grow(self):
+        """Duplica la capacidad de los arreglos"""
+        capacity = len(self.guards) * 2
+        for name in ("vectors", "guards", "alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, vector: "np.ndarray", stems: List[int], guard: int, cache_key: str):
+        """Agrega una pregunta (ignora claves repetidas)"""
+        if cache_key in self.row_by_key:
+            self.alive[self.row_by_key[cache_key]] = True
+            return
+        if self.size >= self.max_entries:
+            self._compact()
+        if self.size >= len(self.guards):
+            self._grow()
+
+        row = self.size
+        self.vectors[row] = vector
+        self.guards[row] = guard
+        self.alive[row] = True
+        self.keys.append(cache_key)
+        self.row_stems.append(stems)
+        self.row_by_key[cache_key] = row
+        for stem in stems:
+            posting = self.postings.get(stem)
+            if posting is None:
+                posting = self.postings[stem] = array("q")
+            posting.append(row)
+        self.size += 1
+
+    def _compact(self):
+        """Reconstruye el índice sin filas muertas ni el 10% más antiguo"""
+        keep_from = self.size // 10
+        rows = [row for row in range(keep_from, self.size) if self.alive[row]]
+        vectors = self.vectors[rows]
+        guards = self.guards[rows]
+        entries = [(self.row_stems[row], self.keys[row]) for row in rows]
+
+        self._reset()
+        for vector, guard, (stems, cache_key) in zip(vectors, guards, entries):
+            self.add(vector, stems, int(guard), cache_key)
+
+    def candidates(self, stems: List[int]) -> "np.ndarray":
+        """Filas que comparten alguna raíz, empezando por las raíces más raras"""
+        lists = sorted(
+            (self.postings[stem] for stem in stems if stem in self.postings), key=len
+        )
+        selected = []
+        remaining = MAX_CANDIDATES
+        for rows in lists:
+            # Vista sin copia del array('q'); de las raíces comunes solo las filas más recientes
+            selected.append(np.frombuffer(rows, dtype=np.int64)[-remaining:])
+            remaining -= len(selected[-1])
+            if remaining <= 0:
+                break
+        if not selected:
+            return np.empty(0, dtype=np.int64)
+        if len(selected) == 1:
+            return selected[0]
+        return np.unique(np.concatenate(selected))
+
+    def search(self, vector: "np.ndarray", stems: List[int], guard: int) -> Tuple[Optional[int], float]:
+        """Fila más parecida que cumpla la firma (o None) y su similitud"""
+        rows = self.candidates(stems)
+        if rows.size == 0:
+            return None, 0.0
+        scores = self.vectors[rows] @ vector
+        scores[(self.guards[rows] != guard) | ~self.alive[rows]] = -1.0
+        best = int(np.argmax(scores))
+        return int(rows[best]), float(scores[best])
+
+
+class SemanticCache:
+    """Caché semántica de primeras preguntas, apoyada en ResponseCache"""
+
+    def __init__(self, response_cache, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            response_cache: ResponseCache donde están guardadas las respuestas
+            threshold: Similitud coseno mínima para un acierto
+            max_entries: Preguntas máximas por partición
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("La caché semántica requiere numpy")
+        self.response_cache = response_cache
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.vectorizer = QuestionVectorizer()
+        self._partitions: Dict[str, _PartitionIndex] = {}
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.total_lookup_ms = 0.0
+        self.max_lookup_ms = 0.0
+
+        self._load_from_db()
+
+    def _load_from_db(self):
+        """Reconstruye el índice desde las preguntas guardadas en response_cache"""
+        start_time = time.perf_counter()
+        count = 0
+        for cache_key, partition, question in self.response_cache.iter_questions():
+            self.add(partition, question, cache_key)
+            count += 1
+        if count:
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            print(f"🧠 [CACHE] Índice semántico reconstruido: {count} preguntas ({elapsed_ms:.0f} ms)")
+
+    def add(self, partition: str, question: str, cache_key: str):
+        """Indexa una pregunta cuya respuesta está en response_cache con cache_key"""
+        vector, stems, guard = self.vectorizer.vectorize(question)
+        if vector is None:
+            return
+        with self._lock:
+            index = self._partitions.get(partition)
+            if index is None:
+                index = self._partitions[partition] = _PartitionIndex(self.vectorizer.dim, self.max_entries)
+            index.add(vector, stems, guard, cache_key)
+
+    def lookup(self, partition: str, question: str) -> Optional[str]:
+        """
+        Busca la respuesta de una pregunta equivalente.
+
+        Returns:
+            La respuesta cacheada o None
+        """
+        start_time = time.perf_counter()
+        vector, stems, guard = self.vectorizer.vectorize(question)
+        cache_key = None
+        similarity = 0.0
+        with self._lock:
+            index = self._partitions.get(partition)
+            if vector is not None and index is not None:
+                row, similarity = index.search(vector, stems, guard)
+                if row is not None and similarity >= self.threshold:
+                    cache_key = index.keys[row]
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            self.total_lookup_ms += elapsed_ms
+            self.max_lookup_ms = max(self.max_lookup_ms, elapsed_ms)
+
+        response = self.response_cache.fetch(cache_key) if cache_key else None
+        with self._lock:
+            if cache_key and response is None:
+                # La respuesta venció o fue expulsada de response_cache
+                row = index.row_by_key.get(cache_key)
+                if row is not None:
+                    index.alive[row] = False
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                print(f"🧠 [CACHE] Acierto semántico (similitud {similarity:.3f}, {elapsed_ms:.2f} ms)")
+        return response
+
+    def get_metrics(self) -> dict:
+        """Aciertos, fallos, tamaño y latencia de búsqueda"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0,
+                "entries": sum(int(index.alive[:index.size].sum()) for index in self._partitions.values()),
+                "partitions": len(self._partitions),
+                "avg_lookup_ms": round(self.total_lookup_ms / lookups, 3) if lookups else 0,
+                "max_lookup_ms": round(self.max_lookup_ms, 3),
+            }
@@ -0,0 +1,260 @@
+# U-TUTOR v5.0 - Motor único de texto a voz (edge-tts + gTTS) con caché compartida
+"""
+Un solo motor de síntesis por proceso para todos los botones de audio.
+
+- Backends con la misma interfaz ``synthesize(texto, idioma) -> bytes``:
+  ``EdgeTTSBackend`` (voces neuronales, principal) y ``GTTSBackend``
+  (respaldo). ``TTS_ENGINE`` elige cuál se prueba primero.
+- API en bytes: el MP3 nunca pasa por archivos temporales.
+- Caché LRU compartida por todas las sesiones, acotada en bytes
+  (``TTS_CACHE_MAX_MB``). La clave es el texto ya preprocesado + idioma, así
+  que la misma respuesta se sintetiza una sola vez aunque la pidan varias
+  sesiones o botones; si dos la piden a la vez, la segunda espera a la primera.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+
+from async_runner import get_background_loop
+
+try:
+    import edge_tts
+    EDGE_TTS_AVAILABLE = True
+except ImportError:
+    EDGE_TTS_AVAILABLE = False
+
+try:
+    from gtts import gTTS
+    GTTS_AVAILABLE = True
+except ImportError:
+    GTTS_AVAILABLE = False
+
+# Motor que se prueba primero ('edge-tts' o 'gtts'); el otro queda de respaldo
+TTS_ENGINE = os.getenv("TTS_ENGINE", "edge-tts")
+# Memoria máxima de la caché de audio (MB) y largo máximo del texto leído
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "64"))
+TTS_MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", "2000"))
+# Segundos máximos de edge-tts antes de pasar a gTTS
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "15"))
+
+# Voces de edge-tts por idioma
+VOICE_MAP = {
+    "es": "es-ES-AlvaroNeural",  # Español masculino
+    "en": "en-US-AriaNeural",  # Inglés femenino (US)
+    "pt": "pt-BR-AntonioNeural",  # Portugués masculino (Brasil)
+    "fr": "fr-FR-HenriNeural",  # Francés masculino
+}
+
+
+def preprocess_text(text: str, max_chars: int = TTS_MAX_CHARS) -> str:
+    """
+    Prepara el texto para leerlo en voz alta.
+
+    - Elimina markdown y bloques de código
+    - Reemplaza URLs
+    - Limita la longitud
+    """
+    text = re.sub(r"\*\*(.+?)\*\*", r"\1", text)  # Negrita
+    text = re.sub(r"\*(.+?)\*", r"\1", text)  # Cursiva
+    text = re.sub(r"```[^`]*```", "", text)  # Bloques de código
+    text = re.sub(r"`([^`]+)`", r"\1", text)  # Código en línea
+    text = re.sub(r"https?://\S+", "enlace web", text)
+    text = re.sub(r"^\s*[-*]\s+", "", text, flags=re.MULTILINE)  # Viñetas
+
+    if len(text) > max_chars:
+        text = text[:max_chars] + "... [audio truncado]"
+    return text.strip()
+
+
+class EdgeTTSBackend:
+    """Voces neuronales de edge-tts (corre en el event loop compartido)"""
+
+    name = "edge-tts"
+    available = EDGE_TTS_AVAILABLE
+
+    def __init__(self, timeout: float = TTS_TIMEOUT):
+        self.timeout = timeout
+
+    @staticmethod
+    async def _stream(text: str, voice: str) -> bytes:
+        communicate = edge_tts.Communicate(text, voice)
+        parts = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                parts.append(chunk["data"])
+        return b"".join(parts)
+
+    def synthesize(self, text: str, lang: str) -> Optional[bytes]:
+        voice = VOICE_MAP.get(lang, VOICE_MAP["es"])
+        future = get_background_loop().submit(self._stream(text, voice))
+        try:
+            return future.result(timeout=self.timeout) or None
+        except FutureTimeoutError:
+            # Websocket trabado: cerrarlo y dejar que responda el respaldo
+            future.cancel()
+            print(f"⚠️ [TTS] edge-tts no respondió en {self.timeout:.0f} s")
+            return None
+
+
+class GTTSBackend:
+    """gTTS (requiere internet; respaldo de edge-tts)"""
+
+    name = "gtts"
+    available = GTTS_AVAILABLE
+
+    def synthesize(self, text: str, lang: str) -> Optional[bytes]:
+        fp = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=False, tld="com").write_to_fp(fp)
+        return fp.getvalue() or None
+
+
+class SpeechEngine:
+    """Síntesis con respaldo entre backends y caché LRU de MP3 acotada en bytes"""
+
+    def __init__(self, backends: Optional[List] = None, max_cache_mb: float = TTS_CACHE_MAX_MB):
+        """
+        Args:
+            backends: Backends en orden de preferencia (por defecto según TTS_ENGINE)
+            max_cache_mb: Memoria máxima de la caché de audio
+        """
+        if backends is None:
+            backends = [EdgeTTSBackend(), GTTSBackend()]
+            if TTS_ENGINE == "gtts":
+                backends.reverse()
+        self.backends = [backend for backend in backends if backend.available]
+        self.max_cache_bytes = int(max_cache_mb * 1024 * 1024)
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        # Síntesis en curso: clave -> evento (la segunda petición espera a la primera)
+        self._in_flight: Dict[str, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @staticmethod
+    def _cache_key(text: str, lang: str) -> str:
+        return hashlib.sha1(f"{lang}|{text}".encode("utf-8")).hexdigest()
+
+    def _get_cached(self, key: str) -> Optional[bytes]:
+        """Lee de la caché y marca el acceso (llamar con el lock tomado)"""
+        audio = self._cache.get(key)
+        if audio is not None:
+            self._cache.move_to_end(key)
+        return audio
+
+    def _store(self, key: str, audio: bytes):
+        """Guarda y expulsa los audios menos usados hasta entrar en el límite"""
+        with self._lock:
+            if key in self._cache or len(audio) > self.max_cache_bytes:
+                return
+            self._cache[key] = audio
+            self._cache_bytes += len(audio)
+            while self._cache_bytes > self.max_cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def synthesize(self, text: str, lang: str = "es") -> Optional[bytes]:
+        """
+        MP3 del texto (preprocesado para voz) en el idioma indicado.
+
+        Returns:
+            Bytes del MP3, o None si el texto está vacío o ningún backend pudo
+        """
+        clean_text = preprocess_text(text)
+        if not clean_text:
+            return None
+        key = self._cache_key(clean_text, lang)
+
+        while True:
+            with self._lock:
+                audio = self._get_cached(key)
+                if audio is not None:
+                    self.hits += 1
+                    return audio
+                waiting = self._in_flight.get(key)
+                if waiting is None:
+                    self.misses += 1
+                    done = self._in_flight[key] = threading.Event()
+                    break
+            # Otra sesión ya está sintetizando este texto
+            waiting.wait()
+            with self._lock:
+                audio = self._get_cached(key)
+                if audio is not None:
+                    self.hits += 1
+                    return audio
+            # Falló o no entró en la caché: intentarlo aquí
+
+        try:
+            audio = self._synthesize_uncached(clean_text, lang)
+            if audio:
+                self._store(key, audio)
+            return audio
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+
+    def _synthesize_uncached(self, text: str, lang: str) -> Optional[bytes]:
+        for backend in self.backends:
+            try:
+                audio = backend.synthesize(text, lang)
+            except Exception as e:
+                print(f"⚠️ [TTS] {backend.name} falló: {e}")
+                continue
+            if audio:
+                return audio
+        with self._lock:
+            self.failures += 1
+        return None
+
+    def clear_cache(self) -> int:
+        """Vacía la caché de audio; retorna cuántos audios se eliminaron"""
+        with self._lock:
+            count = len(self._cache)
+            self._cache.clear()
+            self._cache_bytes = 0
+            return count
+
+    def get_info(self) -> dict:
+        """Backends disponibles (en orden de uso) e idiomas con voz"""
+        return {
+            "backends": [backend.name for backend in self.backends],
+            "edge_tts_available": EDGE_TTS_AVAILABLE,
+            "gtts_available": GTTS_AVAILABLE,
+            "available_languages": list(VOICE_MAP),
+        }
+
+    def get_metrics(self) -> dict:
+        """Aciertos, fallos y memoria de la caché de audio"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0,
+                "entries": len(self._cache),
+                "cache_mb": round(self._cache_bytes / (1024 * 1024), 2),
+                "max_cache_mb": round(self.max_cache_bytes / (1024 * 1024), 2),
+            }
+
+
+_engine: Optional[SpeechEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_speech_engine() -> SpeechEngine:
+    """Retorna el motor de voz compartido del proceso (lo crea la primera vez)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SpeechEngine()
+            print(f"🔊 [TTS] Motor de voz: {', '.join(b.name for b in _engine.backends) or 'sin backends'}")
+        return _engine
@@ -0,0 +1,30 @@
+# U-TUTOR v5.0 - Pruebas de los títulos locales de conversación
+"""Ejecutar con: python -m pytest test_local_titler.py"""
+import pytest
+
+from local_titler import LocalTitler
+
+
+@pytest.mark.parametrize("text, title", [
+    ("¿Me ayudas con ecuaciones cuadráticas?", "Matemáticas: Ecuaciones cuadráticas"),
+    ("Explícame el teorema de Pitágoras", "Matemáticas: Teorema de Pitágoras"),
+    ("¿Cómo funciona la fotosíntesis?", "Biología: Fotosíntesis"),
+    ("¿Qué es la programación orientada a objetos?", "Programación orientada a objetos"),
+])
+def test_title_spanish_key_phrase_and_subject(text, title):
+    assert LocalTitler().title(text) == title
+
+
+@pytest.mark.parametrize("text, title", [
+    # Las interrogativas y auxiliares no pueden ser el título ("What")
+    ("What is a prime number?", "Prime number"),
+    ("Can you explain the Pythagorean theorem?", "Pythagorean theorem"),
+    ("Help me with quadratic equations", "Quadratic equations"),
+    ("What are the causes of the French Revolution?", "Causes of the French Revolution"),
+])
+def test_title_english_skips_interrogatives(text, title):
+    assert LocalTitler().title(text) == title
+
+
+def test_title_without_content_words():
+    assert LocalTitler().title("¿Qué es eso?") is None
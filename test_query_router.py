@@ -0,0 +1,35 @@
+# U-TUTOR v5.0 - Pruebas de la detección de materia del enrutador
+"""Ejecutar con: python -m pytest test_query_router.py"""
+import pytest
+
+from query_router import QueryRouter, detect_subject
+
+
+@pytest.mark.parametrize("text, subject", [
+    # Palabras clave que solo aparecían como subcadena de otra palabra
+    ("¿Cómo funciona la fotosíntesis?", "Biología"),  # "funcion" en "funciona"
+    ("Resume la Revolución Francesa", "Historia"),  # "evolucion" en "revolucion"
+    ("¿Cuál es la capital de Francia?", None),  # "api" en "capital"
+    ("¿Cuál fue la causa general?", None),  # "gen" en "general"
+    ("Un texto basado en hechos", None),  # "base" en "basado"
+    ("¿Qué es una base de datos?", "Programación"),
+])
+def test_detect_subject_ignores_substrings(text, subject):
+    assert detect_subject(text) == subject
+
+
+@pytest.mark.parametrize("text, subject", [
+    ("Ayúdame con ecuaciones cuadráticas", "Matemáticas"),  # plural
+    ("Explícame las funciones lineales", "Matemáticas"),
+    ("Los genes y el ADN", "Biología"),
+    ("Identidades trigonométricas", "Matemáticas"),  # raíz "trigonometr*"
+    ("¿Qué es la programación orientada a objetos?", "Programación"),
+    ("Explica la tabla periódica", "Química"),  # frase de varias palabras
+])
+def test_detect_subject_matches_words_plurals_and_stems(text, subject):
+    assert detect_subject(text) == subject
+
+
+def test_false_subject_does_not_add_technical_score():
+    router = QueryRouter(cheap_model="cheap", threshold=0.35)
+    assert router.score("¿Cuál es la capital de Francia?").subject is None
@@ -5,20 +5,23 @@ import time
 import os
 from typing import List, Tuple, Optional
 from database_manager import DatabaseManager
-from TTSManager import TTSManager
+from export_manager import ExportManager, EXPORT_FORMATS
+from quick_suggestions import QUICK_SUGGESTIONS
+from speech_engine import get_speech_engine
 
-@st.cache_resource
-def get_tts_manager():
-    """Cachea el TTSManager para evitar reinicializaciones - OPTIMIZACION"""
-    tts_engine = os.getenv("TTS_ENGINE", "edge-tts")
-    return TTSManager(engine_type=tts_engine)
+# Conversaciones por página en el sidebar (paginación por keyset)
+SIDEBAR_PAGE_SIZE = int(os.getenv("SIDEBAR_PAGE_SIZE", "20"))
+
+# Mensajes cargados al abrir una conversación y por cada "Cargar mensajes anteriores"
+MESSAGE_WINDOW_SIZE = int(os.getenv("MESSAGE_WINDOW_SIZE", "50"))
 
 class UIComponents:
     def __init__(self, db_manager: DatabaseManager, version: str):
         """Inicializa UIComponents con estados de sesión - U-TUTOR v5.0"""
         self.db_manager = db_manager
+        self.export_manager = ExportManager(db_manager)
         self.version = os.getenv("VERSION", "5.0")
-        self.tts_manager = get_tts_manager()
+        self.speech_engine = get_speech_engine()
         # Inicializar estados de sesión necesarios
         if 'theme' not in st.session_state:
             st.session_state.theme = 'blueish'
@@ -365,7 +368,6 @@ class UIComponents:
     def render_model_selector(self):
         import os
         import streamlit as st
-        from langchain_openai import ChatOpenAI
 
         # Lista de modelos: se puede personalizar desde .env con AVAILABLE_MODELS
         default_models = [
@@ -395,25 +397,19 @@ class UIComponents:
 
         if "chat_manager" in st.session_state:
             chat_manager = st.session_state.chat_manager
-            current_model = getattr(chat_manager.llm, "model_name", None)
+            current_model = chat_manager.model
 
             if selected_model != current_model:
-                kwargs = {
-                    "model_name": selected_model,
-                    "api_key": os.getenv("OPENAI_API_KEY")
-                }
-
-                # Agregar temperatura (todos los modelos la soportan)
-                kwargs["temperature"] = chat_manager.temperature
-
                 try:
-                    # Reemplazar el modelo
-                    chat_manager.llm = ChatOpenAI(**kwargs)
-                    chat_manager.model = selected_model
+                    # Cambiar de modelo (el cliente sale del registro compartido)
+                    chat_manager.set_model(selected_model)
+                    chat_manager.llm  # Crea el cliente ahora para reportar errores aquí
 
                     # Limpiar el chat actual para empezar uno nuevo con el nuevo modelo
                     st.session_state.current_conversation_id = None
                     st.session_state.messages = []
+                    st.session_state.has_older_messages = False
+                    st.session_state.messages_offset = 0
                     st.session_state.editing_title = None
 
                     st.sidebar.success(f"✅ Modelo cambiado a {selected_model}")
@@ -500,10 +496,14 @@ class UIComponents:
         # FIX: Deshabilitar botón de nueva conversación mientras se genera
         if st.sidebar.button("➕&nbsp;&nbsp;Nueva conversación", key="new_conv_button", disabled=is_generating):
             # Detener generación en progreso
+            self._cancel_generation("nueva conversación")
             st.session_state.await_response = False
             st.session_state._generating_response = False
             st.session_state.current_conversation_id = None
             st.session_state.messages = []
+            st.session_state.has_older_messages = False
+            st.session_state.messages_offset = 0
+            st.session_state.partial_message = None
             st.session_state.editing_title = None
             st.session_state.show_config_page = False
             st.rerun()
@@ -516,10 +516,16 @@ class UIComponents:
         )
         
 
+        # Fragmentos resaltados de la búsqueda por contenido: {conv_id: snippet}
+        search_snippets = {}
+        has_more_conversations = False
+
         if search_query.strip():
-            conversations = self.db_manager.search_conversations(search_query.strip())
+            results = self.db_manager.search_conversations_ranked(search_query.strip())
+            conversations = [row[:4] for row in results]
+            search_snippets = {row[0]: row[4] for row in results if row[4]}
         else:
-            conversations = self.db_manager.get_conversations()
+            conversations, has_more_conversations = self._get_sidebar_conversations()
 
         # Mostrar conversaciones como botones
 
@@ -538,6 +544,9 @@ class UIComponents:
                     ):
                         self._load_conversation(conv_id)
 
+                    if conv_id in search_snippets:
+                        st.caption(f"…{search_snippets[conv_id]}…")
+
                 with col_menu:
                     # FIX: Deshabilitar menú de opciones mientras se genera
                     if st.button("⋮", key=f"menu_btn_{conv_id}", help="Opciones" if not is_generating else "Espera a que termine", disabled=is_generating):
@@ -562,26 +571,6 @@ class UIComponents:
                         )
 
                         # ===== FUNCIONES INTERNAS =====
-                        def export_conversation():
-                            try:
-                                conv_data = self.db_manager.get_conversation_by_id(conv_id)
-                                conv_title = conv_data[1] if conv_data else f"chat_{conv_id}"
-                                messages = self.db_manager.load_conversation_messages(conv_id)  # <--- CORREGIDO
-
-                                import io
-                                output = io.StringIO()
-                                for msg in messages:
-                                    role = msg[0].capitalize()  # load_conversation_messages devuelve (role, content, timestamp)
-                                    content = msg[1]
-                                    output.write(f"{role}: {content}\n\n")
-
-                                file_content = output.getvalue()
-                                output.close()
-                                return conv_title, file_content
-                            except Exception as e:
-                                st.error(f"❌ Error al preparar la descarga: {e}")
-                                return None, None
-
                         def edit_conversation(new_name):
                             try:
                                 self.db_manager.update_conversation_title(conv_id, new_name)
@@ -602,22 +591,37 @@ class UIComponents:
                                 st.error(f"❌ Error al eliminar: {e}")
 
                         # ===== DESCARGAR =====
+                        export_format = st.radio(
+                            "Formato",
+                            list(EXPORT_FORMATS.keys()),
+                            format_func=lambda fmt: "Markdown" if fmt == "markdown" else "JSONL",
+                            key=f"export_format_{conv_id}",
+                            horizontal=True,
+                            label_visibility="collapsed"
+                        )
                         if st.button("📥 Descargar", key=f"prepare_download_{conv_id}", use_container_width=True):
-                            conv_title, file_content = export_conversation()
-                            if file_content:
-                                st.session_state[f"download_data_{conv_id}"] = (conv_title, file_content)
+                            try:
+                                # Se guarda solo la ruta: el archivo vive en el caché de exportación
+                                st.session_state[f"download_data_{conv_id}"] = \
+                                    self.export_manager.export_conversation(conv_id, export_format)
+                            except Exception as e:
+                                st.error(f"❌ Error al preparar la descarga: {e}")
 
                         # Mostrar botón de descarga solo si hay datos
                         if st.session_state.get(f"download_data_{conv_id}"):
-                            conv_title, file_content = st.session_state[f"download_data_{conv_id}"]
-                            st.download_button(
-                                label=f"✅ {conv_title[:20]}...",
-                                data=file_content,
-                                file_name=f"{conv_title}.md",
-                                mime="text/markdown",
-                                key=f"download_actual_{conv_id}",
-                                use_container_width=True
-                            )
+                            file_path, file_name, mime = st.session_state[f"download_data_{conv_id}"]
+                            if os.path.exists(file_path):
+                                with open(file_path, "rb") as export_file:
+                                    st.download_button(
+                                        label=f"✅ {file_name[:20]}...",
+                                        data=export_file,
+                                        file_name=file_name,
+                                        mime=mime,
+                                        key=f"download_actual_{conv_id}",
+                                        use_container_width=True
+                                    )
+                            else:
+                                st.session_state[f"download_data_{conv_id}"] = None
 
                         # ===== EDITAR =====
                         if not st.session_state.get(f"editing_{conv_id}", False):
@@ -673,9 +677,39 @@ class UIComponents:
 
                 # Línea divisoria visual
                 st.sidebar.markdown("<hr style='margin:4px 0;'>", unsafe_allow_html=True)
+
+            # Cargar la siguiente página solo bajo demanda
+            if has_more_conversations:
+                if st.sidebar.button("⬇️ Cargar más conversaciones", key="sidebar_load_more",
+                                     use_container_width=True, disabled=is_generating):
+                    st.session_state.sidebar_pages += 1
+                    st.rerun()
         else:
             st.sidebar.info("💬 No hay conversaciones todavía.")
 
+    def _get_sidebar_conversations(self) -> Tuple[List[Tuple], bool]:
+        """
+        Obtiene las páginas de conversaciones visibles en el sidebar - U-TUTOR v5.0
+
+        Solo se consultan las páginas que el usuario ha pedido con "Cargar más",
+        así el costo de cada rerun no crece con el tamaño del historial.
+
+        Returns:
+            (conversaciones, hay_más_páginas)
+        """
+        if 'sidebar_pages' not in st.session_state:
+            st.session_state.sidebar_pages = 1
+
+        conversations = []
+        cursor = None
+        for _ in range(st.session_state.sidebar_pages):
+            rows, cursor = self.db_manager.get_conversations_page(SIDEBAR_PAGE_SIZE, cursor)
+            conversations.extend(rows)
+            if cursor is None:
+                break
+
+        return conversations, cursor is not None
+
 
     def render_config_page(self):
         """Renderiza página de configuración como ventana separada - U-TUTOR v5.0"""
@@ -736,16 +770,14 @@ class UIComponents:
         st.info("🇪🇸 **Español** (fijo para mejor compatibilidad)")
         
         # Mostrar información sobre voces TTS disponibles
-        if hasattr(st.session_state, 'audio_manager'):
-            voices_info = st.session_state.audio_manager.get_available_voices_info()
-            # Edge-TTS es considerado "local" porque no requiere APIs externas complejas
-            if voices_info.get('edge_tts_available', False):
-                if voices_info.get('available_languages'):
-                    st.success(f"🎤 Edge-TTS disponible para: {', '.join(voices_info['available_languages'])}")
-                else:
-                    st.warning("⚠️ Edge-TTS disponible pero sin voces compatibles")
-            else:
-                st.info("ℹ️ Solo gTTS disponible (requiere internet)")
+        voices_info = self.speech_engine.get_info()
+        # Edge-TTS es considerado "local" porque no requiere APIs externas complejas
+        if voices_info['edge_tts_available']:
+            st.success(f"🎤 Edge-TTS disponible para: {', '.join(voices_info['available_languages'])}")
+        elif voices_info['gtts_available']:
+            st.info("ℹ️ Solo gTTS disponible (requiere internet)")
+        else:
+            st.warning("⚠️ Sin motores de voz instalados (edge-tts o gTTS)")
         
         # Apariencia / Tema (Lilac / Blueish)
         st.markdown("ㅤ")
@@ -790,16 +822,45 @@ class UIComponents:
                 st.info("↩️ Valores por defecto")
                 st.rerun()
         
+        # Exportación masiva de conversaciones
+        st.markdown("---")
+        st.markdown("ㅤ")
+        st.markdown("### 📦 Exportar conversaciones")
+        bulk_format = st.radio(
+            "Formato de exportación",
+            list(EXPORT_FORMATS.keys()),
+            format_func=lambda fmt: "Markdown" if fmt == "markdown" else "JSONL",
+            key="bulk_export_format",
+            horizontal=True
+        )
+        if st.button("📦 Preparar ZIP con todas las conversaciones", use_container_width=True):
+            with st.spinner("Exportando conversaciones..."):
+                try:
+                    st.session_state.bulk_export = self.export_manager.export_zip(fmt=bulk_format)
+                except Exception as e:
+                    st.error(f"❌ Error al exportar: {e}")
+            if not st.session_state.get('bulk_export'):
+                st.info("💬 No hay conversaciones para exportar")
+
+        if st.session_state.get('bulk_export'):
+            file_path, file_name, mime = st.session_state.bulk_export
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as export_file:
+                    st.download_button(
+                        label=f"⬇️ Descargar {file_name}",
+                        data=export_file,
+                        file_name=file_name,
+                        mime=mime,
+                        key="bulk_export_download",
+                        use_container_width=True
+                    )
+
         # Botón para limpiar caché de audio
         st.markdown("---")
         st.markdown("ㅤ")
-        if st.button("🧹 Limpiar caché de audio", use_container_width=True, help="Libera memoria eliminando archivos de audio guardados"):
-            if hasattr(st.session_state, 'audio_manager'):
-                cache_size = st.session_state.audio_manager.get_cache_size()
-                st.session_state.audio_manager.clear_audio_cache()
-                st.success(f"✅ Caché limpiado ({cache_size} archivos eliminados)")
-            else:
-                st.info("ℹ️ Caché de audio no disponible")
+        if st.button("🧹 Limpiar caché de audio", use_container_width=True, help="Libera memoria eliminando los audios guardados"):
+            cache_size = self.speech_engine.clear_cache()
+            st.success(f"✅ Caché limpiado ({cache_size} audios eliminados)")
 
     def _render_stats_tab(self):
         """Renderiza la pestaña de estadísticas - U-TUTOR v5.0"""
@@ -843,6 +904,150 @@ class UIComponents:
         else:
             st.info("📅 No hay conversaciones registradas aún")
 
+        # Métricas de la cola de escritura diferida (solo si está activa)
+        write_metrics = self.db_manager.get_write_metrics()
+        if write_metrics:
+            st.markdown("ㅤ")
+            st.markdown("### 💾 Escritura en segundo plano")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("📥 En cola", f"{write_metrics['queue_depth']}/{write_metrics['queue_capacity']}")
+            with col2:
+                st.metric("⏱️ Commit promedio", f"{write_metrics['avg_commit_ms']} ms")
+            with col3:
+                st.metric("📦 Mensajes/lote", write_metrics['avg_batch_size'])
+            if write_metrics['pending_failed']:
+                st.warning(f"⚠️ {write_metrics['pending_failed']} mensajes no se pudieron guardar: "
+                           f"{write_metrics['last_error']}")
+                if st.button("🔁 Reintentar guardado", key="retry_failed_writes"):
+                    retried = self.db_manager.retry_failed_writes()
+                    st.success(f"✅ {retried} mensajes reencolados")
+
+        # Latencia de las respuestas de esta sesión
+        response_metrics = st.session_state.get('response_metrics', [])
+        if response_metrics:
+            ttfts = [m['ttft_ms'] for m in response_metrics if m['ttft_ms'] is not None]
+            speeds = [m['tokens_per_second'] for m in response_metrics if m['tokens_per_second']]
+            st.markdown("ㅤ")
+            st.markdown("### ⏱️ Velocidad de respuesta")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("⚡ Primer token (prom.)", f"{sum(ttfts) / len(ttfts):.0f} ms" if ttfts else "-")
+            with col2:
+                st.metric("🚀 Tokens/s (prom.)", f"{sum(speeds) / len(speeds):.1f}" if speeds else "-")
+            with col3:
+                st.metric("🧾 Respuestas medidas", len(response_metrics))
+            served = {}
+            for m in response_metrics:
+                model = m.get('model', '-')
+                served[model] = served.get(model, 0) + 1
+            st.caption("🤖 Respondido por: " + ", ".join(f"{model} ×{count}" for model, count in served.items()))
+
+        # Rendimiento histórico (todas las sesiones), agregado en SQL por día
+        response_history = self.db_manager.get_response_metrics(days=14)
+        if response_history['daily']:
+            latest = response_history['daily'][0]
+            st.markdown("ㅤ")
+            st.markdown("### 📈 Rendimiento por día")
+            st.caption(f"Tiempo total de respuesta del modelo el {latest[0]} (percentiles)")
+            col1, col2, col3 = st.columns(3)
+            for col, label, value in zip((col1, col2, col3), ("p50", "p95", "p99"), latest[8:11]):
+                with col:
+                    st.metric(f"⏱️ {label}", f"{value:.0f} ms" if value is not None else "-")
+
+            def ms(value):
+                return round(value) if value is not None else None
+
+            rows = []
+            for day, count, cached, prompt_tokens, completion_tokens, *latencies in response_history['daily']:
+                rows.append({
+                    "Día": day, "Respuestas": count, "De caché": cached,
+                    "Tokens prompt": prompt_tokens, "Tokens respuesta": completion_tokens,
+                    "TTFT p50": ms(latencies[0]), "TTFT p95": ms(latencies[1]), "TTFT p99": ms(latencies[2]),
+                    "Total p50": ms(latencies[3]), "Total p95": ms(latencies[4]), "Total p99": ms(latencies[5]),
+                })
+            with st.expander("📅 Detalle de los últimos 14 días", expanded=False):
+                st.dataframe(rows, use_container_width=True)
+                if response_history['models']:
+                    st.caption("🤖 Por modelo: " + ", ".join(
+                        f"{model} ×{count} ({prompt_tokens + completion_tokens} tokens, {avg_ms:.0f} ms prom.)"
+                        for model, count, prompt_tokens, completion_tokens, avg_ms in response_history['models']
+                    ))
+
+        # Métricas de la caché de respuestas (solo si está activa)
+        chat_manager = st.session_state.get('chat_manager')
+        response_cache = getattr(chat_manager, 'response_cache', None)
+        if response_cache:
+            cache_metrics = response_cache.get_metrics()
+            st.markdown("ㅤ")
+            st.markdown("### ⚡ Caché de respuestas")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("🎯 Aciertos", f"{cache_metrics['hit_rate']}%")
+            with col2:
+                st.metric("✅/❌ Hits/Miss", f"{cache_metrics['hits']}/{cache_metrics['misses']}")
+            with col3:
+                st.metric("🗃️ Entradas", f"{cache_metrics['entries']}/{cache_metrics['max_entries']}")
+            semantic_cache = getattr(chat_manager, 'semantic_cache', None)
+            if semantic_cache:
+                semantic_metrics = semantic_cache.get_metrics()
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("🧠 Aciertos semánticos", f"{semantic_metrics['hit_rate']}%")
+                with col2:
+                    st.metric("❓ Preguntas indexadas", semantic_metrics['entries'])
+                with col3:
+                    st.metric("⏱️ Búsqueda promedio", f"{semantic_metrics['avg_lookup_ms']} ms")
+            if st.button("🧹 Vaciar caché de respuestas", key="clear_response_cache"):
+                response_cache.clear()
+                st.success("✅ Caché de respuestas vaciada")
+
+        # Latencia y costo por ruta del enrutador de preguntas (todo el proceso)
+        query_router = getattr(chat_manager, 'query_router', None)
+        route_metrics = query_router.get_metrics() if query_router else {}
+        if route_metrics:
+            st.markdown("ㅤ")
+            st.markdown("### 🧭 Enrutamiento de preguntas")
+            st.caption(f"Preguntas simples → {query_router.cheap_model}; complejas → modelo elegido")
+            for route, metrics in route_metrics.items():
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric(f"🧾 {route.capitalize()}", metrics['count'])
+                with col2:
+                    ttft = metrics['avg_ttft_ms']
+                    st.metric("⚡ Primer token (prom.)", f"{ttft:.0f} ms" if ttft is not None else "-")
+                with col3:
+                    st.metric("⏱️ Total (prom.)", f"{metrics['avg_total_ms']:.0f} ms")
+                with col4:
+                    st.metric("💵 Costo estimado", f"${metrics['cost_usd']:.4f}")
+
+        # Limitador global de llamadas al modelo (compartido por todas las sesiones)
+        rate_limiter = getattr(chat_manager, 'rate_limiter', None)
+        if rate_limiter:
+            limiter_metrics = rate_limiter.get_metrics()
+            st.markdown("ㅤ")
+            st.markdown("### 🚦 Cola de solicitudes")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("📥 Esperando", limiter_metrics['waiting'])
+            with col2:
+                st.metric("⏱️ Espera promedio", f"{limiter_metrics['avg_wait_ms']} ms")
+            with col3:
+                st.metric("🚫 Rechazadas", limiter_metrics['rejected'])
+
+        # Caché de audio del motor de voz (compartida por todas las sesiones)
+        audio_metrics = self.speech_engine.get_metrics()
+        if audio_metrics['hits'] or audio_metrics['misses']:
+            st.markdown("ㅤ")
+            st.markdown("### 🔊 Caché de audio")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("🎯 Aciertos", f"{audio_metrics['hit_rate']}%")
+            with col2:
+                st.metric("✅/❌ Hits/Miss", f"{audio_metrics['hits']}/{audio_metrics['misses']}")
+            with col3:
+                st.metric("💾 Memoria", f"{audio_metrics['cache_mb']}/{audio_metrics['max_cache_mb']} MB")
+
 
     def _render_info_tab(self):
         """Renderiza la pestaña de información - U-TUTOR v5.0"""
@@ -923,7 +1128,11 @@ class UIComponents:
         if hasattr(st.session_state, 'current_conversation_id') and st.session_state.current_conversation_id:
             conversation = self.db_manager.get_conversation_by_id(st.session_state.current_conversation_id)
             if conversation:
-                msg_count = len(st.session_state.messages)
+                # Total materializado: la sesión solo tiene la ventana cargada
+                msg_count = max(
+                    self.db_manager.get_conversation_message_count(st.session_state.current_conversation_id),
+                    len(st.session_state.messages)
+                )
                 st.markdown(f"""
                 <div style='background: linear-gradient(90deg, #2d3748 0%, #4a5568 100%); 
                             padding: 15px; 
@@ -947,17 +1156,9 @@ class UIComponents:
         El usuario puede expandir solo si desea ver las sugerencias.
         """
         with st.expander("💡 Ver sugerencias de conversación", expanded=False):
-            suggestions = [
-                ("📐", "Explícame el teorema de Pitágoras"),
-                ("🌱", "¿Cómo funciona la fotosíntesis?"),
-                ("➗", "Ayúdame con ecuaciones cuadráticas"),
-                ("💻", "¿Qué es la programación orientada a objetos?"),
-                ("🧪", "Explica la tabla periódica"),
-                ("📊", "¿Qué es la estadística descriptiva?"),
-            ]
-
+            # Lista compartida con el precalentador de respuestas (quick_suggestions.py)
             cols = st.columns(2)
-            for idx, (emoji, suggestion) in enumerate(suggestions):
+            for idx, (emoji, suggestion) in enumerate(QUICK_SUGGESTIONS):
                 with cols[idx % 2]:
                     if st.button(
                         f"{emoji} {suggestion}",
@@ -984,6 +1185,7 @@ class UIComponents:
             with col1:
                 if st.button("🔄 Regenerar Respuesta", use_container_width=True, key="continue_generation_btn"):
                     # Limpiar flags y esperar nueva respuesta
+                    self._cancel_generation("regenerar")
                     st.session_state.generation_cancelled = False
                     st.session_state._generating_response = False
                     st.session_state.await_response = True
@@ -996,6 +1198,17 @@ class UIComponents:
                     st.rerun()
             st.markdown("---")
 
+        # Respuesta interrumpida con checkpoint: se puede continuar desde donde quedó
+        partial = st.session_state.get('partial_message')
+        if (partial and partial["conversation_id"] == st.session_state.current_conversation_id
+                and not st.session_state.get('await_response', False)):
+            self._render_partial_message_actions(partial)
+
+        # Historial más antiguo que la ventana cargada: se trae solo bajo demanda
+        if st.session_state.get('has_older_messages', False) and messages and messages[0].get("id"):
+            if st.button("⬆️ Cargar mensajes anteriores", key="load_older_messages", use_container_width=True):
+                self._load_older_messages()
+
         # Contenedor principal
         chat_container = st.container()
 
@@ -1003,8 +1216,8 @@ class UIComponents:
         with chat_container:
             st.markdown("<div class='u-tutor-messages'>", unsafe_allow_html=True)
 
-            # Mostrar solo los ultimos 50 mensajes para optimizar rendimiento
-            messages_to_display = messages[-50:] if len(messages) > 50 else messages
+            # La sesión ya contiene solo la ventana cargada (ver _load_conversation)
+            messages_to_display = messages
 
             # Verificar si el último mensaje es del asistente (para habilitar regenerar)
             last_is_assistant = st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant"
@@ -1041,6 +1254,7 @@ class UIComponents:
                         with col_regen:
                             if st.button("🔄", key=f"regen_on_user_{idx}", help="Regenerar respuesta", use_container_width=True):
                                 # FIX: Reenviar el mensaje del usuario para regenerar la respuesta
+                                self._cancel_generation("regenerar")
                                 # 1. Extraer el contenido del mensaje del usuario
                                 user_content = content
 
@@ -1060,16 +1274,7 @@ class UIComponents:
                                 print(f"🔄 [LOG] Mensaje del usuario reenviado para regeneración")
                                 st.rerun()
                 else:
-                    html = f"""
-    <div class='u-tutor-message assistant'>
-    <div style='display: flex; align-items: flex-start; gap: 8px;'>
-        <div class='u-tutor-avatar assistant'>🎓</div>
-        <div style='flex: 1;'>{content}</div>
-    </div>
-</div>
-                    """
-
-                    st.markdown(html, unsafe_allow_html=True)
+                    st.markdown(self._assistant_message_html(content), unsafe_allow_html=True)
 
                     # Mostrar botón de regenerar solo en el último mensaje del asistente
                     is_last_message = (real_idx == len(st.session_state.messages) - 1)
@@ -1089,6 +1294,36 @@ class UIComponents:
             st.markdown("</div>", unsafe_allow_html=True)
 
 
+    @staticmethod
+    def _assistant_message_html(content: str) -> str:
+        """HTML de un mensaje del asistente - U-TUTOR v5.0"""
+        return f"""
+    <div class='u-tutor-message assistant'>
+    <div style='display: flex; align-items: flex-start; gap: 8px;'>
+        <div class='u-tutor-avatar assistant'>🎓</div>
+        <div style='flex: 1;'>{content}</div>
+    </div>
+</div>
+                    """
+
+    def render_streaming_message(self, placeholder, content: str, finished: bool = False):
+        """Pinta la respuesta parcial en su placeholder (con cursor mientras llega) - U-TUTOR v5.0"""
+        placeholder.markdown(
+            self._assistant_message_html(content if finished else content + "▌"),
+            unsafe_allow_html=True
+        )
+
+    def _get_tts_text(self, text: str) -> str:
+        """Texto a leer: la traducción en segundo plano si ya terminó, si no el original - U-TUTOR v5.0"""
+        pending = st.session_state.get('pending_translations', {})
+        future = pending.get(text)
+        if future is None or not future.done():
+            return text
+        try:
+            return future.result()
+        except Exception:
+            return text
+
     def _add_tts_button(self, text: str, message_index: int, show_regenerate: bool = False):
         """Renderiza botón de TTS + Regenerar - CSS movido a styles_modern.css"""
         conv_id = st.session_state.get('current_conversation_id', 'new')
@@ -1117,8 +1352,9 @@ class UIComponents:
                 else:
                     if st.button("▶️", key=f"play_{unique_key}", help="Reproducir audio", use_container_width=True):
                         with st.spinner("Generando audio..."):
-                            processed_text = self.tts_manager.preprocess_text_for_tts(text)
-                            audio_data = self.tts_manager.text_to_speech_fast(processed_text)
+                            audio_data = self.speech_engine.synthesize(
+                                self._get_tts_text(text), lang=st.session_state.get('tts_language', 'es')
+                            )
                             if audio_data:
                                 st.session_state[f'audio_data_{unique_key}'] = audio_data
                                 st.session_state[f'audio_playing_{unique_key}'] = True
@@ -1129,10 +1365,13 @@ class UIComponents:
             # ✅ Botón Regenerar Respuesta
             with col_regen:
                 if st.button("🔄", key=f"regen_{unique_key}", help="Regenerar esta respuesta", use_container_width=True):
+                    self._cancel_generation("regenerar")
                     # FIX: Eliminar el último mensaje del asistente de forma segura
                     if st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
                         removed_message = st.session_state.messages.pop()
                         print(f"🔄 [LOG] Mensaje regenerado removido: {len(removed_message.get('content', ''))} caracteres")
+                        # Si era una respuesta interrumpida, su checkpoint también se reemplaza
+                        st.session_state.regenerate_partial = True
 
                     # FIX: Limpiar flags antes de regenerar para evitar conflictos
                     st.session_state._generating_response = False
@@ -1151,8 +1390,9 @@ class UIComponents:
                 else:
                     if st.button("▶️", key=f"play_{unique_key}", help="Reproducir audio", use_container_width=True):
                         with st.spinner("Generando audio..."):
-                            processed_text = self.tts_manager.preprocess_text_for_tts(text)
-                            audio_data = self.tts_manager.text_to_speech_fast(processed_text)
+                            audio_data = self.speech_engine.synthesize(
+                                self._get_tts_text(text), lang=st.session_state.get('tts_language', 'es')
+                            )
                             if audio_data:
                                 st.session_state[f'audio_data_{unique_key}'] = audio_data
                                 st.session_state[f'audio_playing_{unique_key}'] = True
@@ -1176,7 +1416,8 @@ class UIComponents:
         # PLAN PASO 1: Detener generación gracefully con flag
         was_generating = st.session_state.get('await_response', False)
 
-        # Detener generación
+        # Detener generación (cierra el stream HTTP, no solo los flags)
+        self._cancel_generation("cambio de chat")
         st.session_state.await_response = False
         st.session_state._generating_response = False
 
@@ -1192,13 +1433,86 @@ class UIComponents:
         if st.session_state.show_config_page:
             st.session_state.show_config_page = False
 
-        # Cargar mensajes de la conversación
-        messages_data = self.db_manager.load_conversation_messages(conv_id)
-        st.session_state.messages = []
+        # Cargar solo la ventana de mensajes más recientes de la conversación
+        messages_data, has_more = self.db_manager.load_message_window(conv_id, limit=MESSAGE_WINDOW_SIZE)
+        st.session_state.messages = [
+            {"id": msg_id, "role": role, "content": content}
+            for msg_id, role, content, _ in messages_data
+        ]
+        st.session_state.has_older_messages = has_more
+        st.session_state.messages_offset = (
+            self.db_manager.get_conversation_message_count(conv_id) - len(st.session_state.messages)
+            if has_more else 0
+        )
+
+        # ¿La conversación terminó en una respuesta interrumpida?
+        partial = self.db_manager.get_partial_message(conv_id)
+        st.session_state.partial_message = (
+            {"conversation_id": conv_id, "id": partial[0], "content": partial[1]} if partial else None
+        )
+
+        # Reutilizar el resumen guardado de la conversación
+        chat_manager = st.session_state.get('chat_manager')
+        if chat_manager:
+            chat_manager.load_conversation_memory(conv_id)
+
+        st.rerun()
+
+    def _render_partial_message_actions(self, partial: dict):
+        """Acciones sobre una respuesta incompleta guardada - U-TUTOR v5.0"""
+        st.warning("⚠️ **Respuesta incompleta** - La generación se interrumpió; puedes continuarla desde donde quedó")
 
-        for role, content, _ in messages_data:
-            st.session_state.messages.append({"role": role, "content": content})
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            if st.button("▶️ Continuar", use_container_width=True, key="continue_partial_btn"):
+                # Solo se piden los tokens que faltan (ver ChatManager.start_generation)
+                st.session_state.continue_partial = True
+                st.session_state._generating_response = False
+                st.session_state.await_response = True
+                st.rerun()
+        with col2:
+            if st.button("🔄 Regenerar", use_container_width=True, key="regenerate_partial_btn"):
+                # La respuesta nueva reemplaza al checkpoint (se elimina al generar)
+                if st.session_state.messages and st.session_state.messages[-1].get("role") == "assistant":
+                    st.session_state.messages.pop()
+                st.session_state.regenerate_partial = True
+                st.session_state._generating_response = False
+                st.session_state.await_response = True
+                st.rerun()
+        with col3:
+            if st.button("✅ Conservar", use_container_width=True, key="keep_partial_btn"):
+                # Se queda como respuesta definitiva tal como está
+                self.db_manager.update_partial_message(partial["id"], partial["content"], finished=True)
+                st.session_state.partial_message = None
+                st.rerun()
+        st.markdown("---")
 
+    def _cancel_generation(self, reason: str):
+        """Cancela la respuesta en curso del ChatManager de la sesión - U-TUTOR v5.0"""
+        chat_manager = st.session_state.get('chat_manager')
+        if chat_manager:
+            chat_manager.cancel_generation(reason=reason)
+
+    def _load_older_messages(self):
+        """Antepone la página anterior de mensajes de la conversación actual - U-TUTOR v5.0"""
+        conv_id = st.session_state.get('current_conversation_id')
+        if not conv_id or not st.session_state.messages:
+            return
+
+        oldest_id = st.session_state.messages[0].get("id")
+        messages_data, has_more = self.db_manager.load_message_window(
+            conv_id, before_id=oldest_id, limit=MESSAGE_WINDOW_SIZE
+        )
+        older_messages = [
+            {"id": msg_id, "role": role, "content": content}
+            for msg_id, role, content, _ in messages_data
+        ]
+        st.session_state.messages = older_messages + st.session_state.messages
+        st.session_state.has_older_messages = has_more
+        st.session_state.messages_offset = (
+            max(0, st.session_state.get('messages_offset', 0) - len(older_messages))
+            if has_more else 0
+        )
         st.rerun()
     
 
@@ -1223,8 +1537,11 @@ class UIComponents:
             # Si la conversación eliminada era la activa, resetear
             if (hasattr(st.session_state, 'current_conversation_id') and 
                 st.session_state.current_conversation_id == conv_id):
+                self._cancel_generation("conversación eliminada")
                 st.session_state.current_conversation_id = None
                 st.session_state.messages = []
+                st.session_state.has_older_messages = False
+                st.session_state.messages_offset = 0
             
             # Cerrar menú después de eliminar
             if hasattr(st.session_state, 'active_menu'):